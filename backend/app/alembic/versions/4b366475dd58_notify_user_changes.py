@@ -0,0 +1,44 @@
+"""Notify user changes
+
+Revision ID: 4b366475dd58
+Revises: 524a24d233d4
+Create Date: 2026-10-18 16:11:51.495349
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '4b366475dd58'
+down_revision = '524a24d233d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tell the API workers to drop their cached principal of a user (see
+    # app/core/principals.py)
+    op.execute(
+        """
+        CREATE FUNCTION notify_user_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('user_changed', OLD.id::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER user_changed
+        AFTER UPDATE OR DELETE ON "user"
+        FOR EACH ROW EXECUTE FUNCTION notify_user_changed()
+        """
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER user_changed ON "user"')
+    op.execute("DROP FUNCTION notify_user_changed()")
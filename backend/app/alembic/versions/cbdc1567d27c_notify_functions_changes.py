@@ -0,0 +1,56 @@
+"""Notify functions changes
+
+Revision ID: cbdc1567d27c
+Revises: e4e7dabd5d07
+Create Date: 2026-10-18 16:02:54.488823
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'cbdc1567d27c'
+down_revision = 'e4e7dabd5d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tell the API workers to drop their cached entitlements of a user (see
+    # app/core/entitlements.py), not on charges which only lower credits
+    op.execute(
+        """
+        CREATE FUNCTION notify_functions_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('functions_changed', COALESCE(NEW.id, OLD.id)::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER functions_inserted_or_deleted
+        AFTER INSERT OR DELETE ON functions
+        FOR EACH ROW EXECUTE FUNCTION notify_functions_changed()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER functions_updated
+        AFTER UPDATE ON functions
+        FOR EACH ROW
+        WHEN (
+            NEW.entitlements <> OLD.entitlements OR NEW.credits > OLD.credits
+        )
+        EXECUTE FUNCTION notify_functions_changed()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER functions_updated ON functions")
+    op.execute("DROP TRIGGER functions_inserted_or_deleted ON functions")
+    op.execute("DROP FUNCTION notify_functions_changed()")
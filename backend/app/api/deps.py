@@ -11,6 +11,7 @@ from sqlmodel import Session
 from app.core import security
 from app.core.config import settings
 from app.core.db import engine
+from app.core.principals import UserPrincipal, principal_cache, token_revocations
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -27,29 +28,80 @@ SessionDep = Annotated[Session, Depends(get_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-    except (InvalidTokenError, ValidationError):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
-        )
-    user = session.get(User, token_data.sub)
+def get_current_user(session: SessionDep, token: TokenDep) -> UserPrincipal:
+    # Clients reuse their token for many requests, skip verifying it again
+    token_data = security.verified_tokens.get(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+            )
+            token_data = TokenPayload(**payload)
+        except (InvalidTokenError, ValidationError):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        if token_data.type == "refresh":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        if token_data.sub is not None and "exp" in payload:
+            security.verified_tokens.put(token, token_data, payload["exp"])
+    user_id = token_data.sub
+    if token_data.ver is not None:
+        assert user_id is not None and token_data.iat is not None
+        valid = token_revocations.check(user_id, token_data.ver, token_data.iat)
+        if valid is False:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked"
+            )
+        if valid:
+            # Issued to an active user, nothing changed since
+            return principal_from_claims(token_data)
+    # Most routes only need the principal, cached instead of read
+    user = principal_cache.get(user_id) or principal_cache.load(session, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if token_data.ver is not None and token_data.ver != user.token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked"
+        )
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return user
 
 
-CurrentUser = Annotated[User, Depends(get_current_user)]
+def principal_from_claims(token_data: TokenPayload) -> UserPrincipal:
+    assert token_data.sub is not None and token_data.ver is not None
+    assert token_data.email is not None and token_data.is_superuser is not None
+    return UserPrincipal(
+        id=token_data.sub,
+        email=token_data.email,
+        is_active=True,
+        is_superuser=token_data.is_superuser,
+        full_name=token_data.full_name,
+        token_version=token_data.ver,
+        entitlements=token_data.entitlements,
+    )
+
+
+CurrentUser = Annotated[UserPrincipal, Depends(get_current_user)]
+
+
+def get_current_db_user(session: SessionDep, current_user: CurrentUser) -> User:
+    """The current user's row, for the routes changing it."""
+    user = session.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+CurrentDBUser = Annotated[User, Depends(get_current_db_user)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+def get_current_active_superuser(current_user: CurrentUser) -> UserPrincipal:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
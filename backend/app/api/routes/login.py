@@ -1,16 +1,29 @@
 from datetime import timedelta
 from typing import Annotated, Any
 
+import jwt
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from jwt.exceptions import InvalidTokenError
+from pydantic import ValidationError
+from sqlmodel import Session
 
 from app import crud
 from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
 from app.core import security
 from app.core.config import settings
+from app.core.principals import principal_cache
 from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app.models import (
+    Message,
+    NewPassword,
+    RefreshToken,
+    Token,
+    TokenPayload,
+    User,
+    UserPublic,
+)
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
@@ -35,11 +48,63 @@ def login_access_token(
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return create_tokens(session, user)
+
+
+@router.post("/login/refresh-token")
+def refresh_access_token(session: SessionDep, body: RefreshToken) -> Token:
+    """
+    Get a new access token with the user's current claims
+    """
+    try:
+        payload = jwt.decode(
+            body.refresh_token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+        token_data = TokenPayload(**payload)
+    except (InvalidTokenError, ValidationError):
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+    if token_data.type != "refresh":
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
+    user = session.get(User, token_data.sub)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if token_data.ver != user.token_version:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return create_tokens(session, user)
+
+
+def create_tokens(session: Session, user: User) -> Token:
+    if not settings.ACCESS_TOKEN_CLAIMS:
+        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        return Token(
+            access_token=security.create_access_token(
+                user.id, expires_delta=access_token_expires
+            )
+        )
+    # Checked without reading the user until they expire or the user changes
+    functions = crud.get_functions(session=session, user_id=user.id)
+    claims = {
+        "ver": user.token_version,
+        "email": user.email,
+        "full_name": user.full_name,
+        "is_superuser": user.is_superuser,
+        "entitlements": functions.entitlements if functions else 0,
+    }
     return Token(
         access_token=security.create_access_token(
-            user.id, expires_delta=access_token_expires
-        )
+            user.id,
+            expires_delta=timedelta(
+                minutes=settings.ACCESS_TOKEN_CLAIMS_EXPIRE_MINUTES
+            ),
+            claims=claims,
+        ),
+        refresh_token=security.create_refresh_token(
+            user.id,
+            user.token_version,
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        ),
     )
 
 
@@ -93,8 +158,11 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
         raise HTTPException(status_code=400, detail="Inactive user")
     hashed_password = get_password_hash(password=body.new_password)
     user.hashed_password = hashed_password
+    # Revokes the user's tokens
+    user.token_version += 1
     session.add(user)
     session.commit()
+    principal_cache.invalidate(user.id)
     return Message(message="Password updated successfully")
 
 
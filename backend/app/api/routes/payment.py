@@ -1,66 +1,98 @@
+from datetime import timedelta
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlmodel import Session
 
+from app import crud
 from app.api.deps import get_current_user, get_db
-from app.models import Functions, User
+from app.core.config import settings
+from app.core.entitlements import entitlement_cache
+from app.core.principals import UserPrincipal
+from app.mlmodel.catalog import model_catalog
+from app.models import utcnow
 
 router = APIRouter()
 
 
 @router.post("/payment/{option}")
-async def process_payment(
+def process_payment(
     option: str,
     session: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
+    idempotency_key: str | None = Header(default=None, max_length=255),
 ) -> dict[str, Any]:
-    if option not in ["model1", "model2", "model3", "all"]:
+    """
+    Buy a payment option. Retries of a request sent with an Idempotency-Key
+    header get its first response back rather than paying again.
+    """
+    catalog = model_catalog.get()
+    payment_option = catalog.options.get(option)
+    if payment_option is None:
         raise HTTPException(status_code=400, detail="Invalid payment option")
 
+    assert current_user.id is not None
+    expired_before = utcnow() - timedelta(
+        hours=settings.PAYMENT_IDEMPOTENCY_EXPIRE_HOURS
+    )
+    # Retries stop at this insert's unique index probe, a first request's
+    # key is committed with its payment. Expired keys not purged yet are
+    # claimed again
+    if idempotency_key is not None and not crud.claim_payment_key(
+        session=session,
+        user_id=current_user.id,
+        key=idempotency_key,
+        option=option,
+        expired_before=expired_before,
+    ):
+        claimed = crud.get_payment_key(
+            session=session, user_id=current_user.id, key=idempotency_key
+        )
+        if claimed is None or claimed.response is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A payment with this Idempotency-Key is in progress",
+            )
+        if claimed.option != option:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key already used for another payment option",
+            )
+        return claimed.response
+
     # Simulate a successful payment
     payment_successful = True  # This can be set to False to simulate a failed payment
 
     if payment_successful:
         # Update user's paid models and credits
-        functions = session.exec(
-            select(Functions).where(Functions.id == current_user.id)
-        ).first()
-        if not functions:
-            functions = Functions(id=current_user.id)
-            session.add(functions)
-
-        if option == "model1":
-            functions.model1 = True
-            cost = 30
-        elif option == "model2":
-            functions.model2 = True
-            cost = 60
-        elif option == "model3":
-            functions.model3 = True
-            cost = 90
-        elif option == "all":
-            functions.model1 = True
-            functions.model2 = True
-            functions.model3 = True
-            cost = 100
-
-        functions.credits += cost
-
-        session.add(functions)
-        session.commit()
-        session.refresh(functions)
-
-        return {
+        entitlements, credits = crud.add_credits(
+            session=session,
+            user_id=current_user.id,
+            credits=payment_option.credits,
+            entitlements=payment_option.entitlements,
+        )
+        response = {
             "message": "Payment successful",
             "paid_models": {
-                k: v
-                for k, v in functions.__dict__.items()
-                if k in ["model1", "model2", "model3"]
+                model_name: catalog.entitled(entitlements, model_name)
+                for model_name in catalog.masks
             },
-            "credits_added": cost,
-            "total_credits": functions.credits,
+            "credits_added": payment_option.credits,
+            "total_credits": credits,
         }
+        if idempotency_key is not None:
+            crud.store_payment_response(
+                session=session,
+                user_id=current_user.id,
+                key=idempotency_key,
+                response=response,
+                purge_before=expired_before,
+            )
+        session.commit()
+        # Other workers are notified by the functions table triggers
+        entitlement_cache.invalidate(current_user.id)
+
+        return response
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Payment failed"
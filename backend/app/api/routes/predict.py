@@ -1,80 +1,738 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+import asyncio
+import json
+import math
+from collections.abc import AsyncGenerator, AsyncIterator, Iterator
+from contextlib import aclosing
+from datetime import datetime, timezone
 
-from app.api.deps import get_current_user, get_db
-from app.mlmodel.prediction import PredictionService
-from app.models import Functions, InputData, User
+import anyio
+import numpy as np
+import numpy.typing as npt
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, col, select
+from starlette.types import Receive
+
+from app import crud
+from app.api.deps import CurrentUser, SessionDep, get_current_user, get_db
+from app.core.config import settings
+from app.core.credits import credit_reservations
+from app.core.db import engine
+from app.core.entitlements import Entitlements, entitlement_cache
+from app.core.executor import inference_executor
+from app.core.principals import UserPrincipal
+from app.mlmodel.batching import QueueFullError, micro_batcher
+from app.mlmodel.bulk import BULK_MEDIA_TYPES, BulkInputError, read_chunks
+from app.mlmodel.cache import prediction_cache, prediction_key
+from app.mlmodel.catalog import Catalog, model_catalog
+from app.mlmodel.mlconfig import FEATURES
+from app.mlmodel.prediction import (
+    PredictionService,
+    columns_to_matrix,
+    predict_ensemble,
+    rows_to_matrix,
+)
+from app.mlmodel.prediction_log import prediction_log
+from app.mlmodel.registry import model_registry
+from app.mlmodel.sweep import sweep
+from app.models import (
+    BatchPrediction,
+    EnsemblePrediction,
+    InputColumns,
+    InputData,
+    PredictionJob,
+    PredictionJobPublic,
+    PredictionJobResult,
+    SweepInput,
+    SweepPrediction,
+)
 
 router = APIRouter()
 
 
+async def get_entitlements(session: Session, user_id: int | None) -> Entitlements:
+    # Usually cached, checked without a threadpool round trip
+    functions = entitlement_cache.get(user_id)
+    if functions is None:
+        functions = await run_in_threadpool(entitlement_cache.load, session, user_id)
+    return functions
+
+
+def require_paid(functions: Entitlements, model_name: str, catalog: Catalog) -> None:
+    if not catalog.entitled(functions.entitlements, model_name):
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Payment required for {model_name}",
+        )
+    if functions.credits < catalog.prices[model_name]:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Not enough credits for {model_name}",
+        )
+
+
+def charge_refused(
+    session: Session, user_id: int | None, model_name: str, detail: str
+) -> str:
+    """
+    Why charging for ``model_name`` failed: the entitlement the charging
+    UPDATE checks, or ``detail``. Read from the database, since the cached
+    entitlements let the request through.
+    """
+    entitlement_cache.invalidate(user_id)
+    functions = entitlement_cache.load(session, user_id)
+    if not model_catalog.get().entitled(functions.entitlements, model_name):
+        return f"Payment required for {model_name}"
+    return detail
+
+
+def get_paid_functions(
+    session: Session, user_id: int | None, model_name: str
+) -> Entitlements:
+    functions = entitlement_cache.get(user_id) or entitlement_cache.load(
+        session, user_id
+    )
+    require_paid(functions, model_name, model_catalog.get())
+    return functions
+
+
+def charge_prediction(
+    session: Session, user_id: int | None, model_name: str, catalog: Catalog
+) -> int:
+    # The entitlement and credit checks are part of the charging UPDATE (or
+    # reservation), so concurrent requests can't overdraw the credits
+    if settings.CREDIT_RESERVATIONS:
+        assert user_id is not None
+        credits_left = credit_reservations.charge(
+            user_id, model_name, catalog.prices[model_name], catalog.masks[model_name]
+        )
+    else:
+        credits_left = crud.deduct_credits(
+            session=session,
+            user_id=user_id,
+            amount=catalog.prices[model_name],
+            entitlement=catalog.masks[model_name],
+        )
+    if credits_left is None:
+        # Raises the reason it failed, from the database since the cached
+        # entitlements let it through
+        entitlement_cache.invalidate(user_id)
+        get_paid_functions(session, user_id, model_name)
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Not enough credits for {model_name}",
+        )
+    return credits_left
+
+
+def log_prediction(
+    user_id: int | None, model_name: str, input_data: InputData, prediction: int
+) -> None:
+    if prediction_log.enabled:
+        prediction_log.log(
+            user_id, model_name, rows_to_matrix([input_data]), [prediction]
+        )
+
+
+def refund_prediction(
+    session: Session, user_id: int | None, model_name: str, catalog: Catalog
+) -> None:
+    if settings.CREDIT_RESERVATIONS:
+        assert user_id is not None
+        credit_reservations.refund(user_id, model_name, catalog.prices[model_name])
+    else:
+        crud.refund_credits(
+            session=session, user_id=user_id, amount=catalog.prices[model_name]
+        )
+
+
+def predict_one(model_name: str, input_data: InputData) -> int:
+    prediction_service = PredictionService(model_name)
+    return prediction_service.predict(input_data)["prediction"]
+
+
+def predict_many(model_name: str, x_values: npt.NDArray[np.float32]) -> list[int]:
+    prediction_service = PredictionService(model_name)
+    return prediction_service.predict_batch(x_values)
+
+
+async def run_prediction(model_name: str, input_data: InputData) -> int:
+    if not settings.PREDICT_MICRO_BATCHING:
+        return await inference_executor.run(
+            model_name, predict_one, model_name, input_data
+        )
+    try:
+        return await micro_batcher.predict(model_name, input_data)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Too many pending predictions for {model_name}",
+        )
+
+
+@router.post("/predict/ensemble", response_model=EnsemblePrediction)
+async def predict_ensemble_endpoint(
+    input_data: InputData,
+    session: SessionDep,
+    current_user: CurrentUser,
+    models: list[str] | None = Query(default=None),
+    vote: bool = False,
+) -> EnsemblePrediction:
+    """
+    Score one input with several models in a single call, by default every
+    model the user paid for, charging their combined price once.
+    """
+    catalog = model_catalog.get()
+    if models is not None:
+        invalid = [
+            model_name for model_name in models if model_name not in catalog.prices
+        ]
+        if invalid or not models:
+            raise HTTPException(status_code=400, detail="Invalid model name")
+
+    functions = await get_entitlements(session, current_user.id)
+    paid = catalog.entitled_models(functions.entitlements)
+    model_names = paid if models is None else list(dict.fromkeys(models))
+    unpaid = [model_name for model_name in model_names if model_name not in paid]
+    if not model_names or unpaid:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Payment required for {', '.join(unpaid) or 'a model'}",
+        )
+    cost = sum(catalog.prices[model_name] for model_name in model_names)
+    if functions.credits < cost:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Not enough credits for {', '.join(model_names)}",
+        )
+
+    # Models sharing a scaler are scored together, the groups concurrently
+    groups: dict[str, list[str]] = {}
+    for model_name in model_names:
+        scaler_sha256 = model_registry.manifest[model_name].scaler_sha256
+        groups.setdefault(scaler_sha256, []).append(model_name)
+    x_values = rows_to_matrix([input_data])
+    results = await asyncio.gather(
+        *(
+            inference_executor.run(group[0], predict_ensemble, group, x_values)
+            for group in groups.values()
+        )
+    )
+    predictions = {
+        model_name: result[model_name][0] for result in results for model_name in result
+    }
+
+    credits_left = await run_in_threadpool(
+        crud.deduct_credits,
+        session=session,
+        user_id=current_user.id,
+        amount=cost,
+        entitlement=sum(catalog.masks[model_name] for model_name in model_names),
+    )
+    if credits_left is None:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Not enough credits for {', '.join(model_names)}",
+        )
+    if prediction_log.enabled:
+        for model_name in model_names:
+            prediction_log.log(
+                current_user.id, model_name, x_values, [predictions[model_name]]
+            )
+
+    return EnsemblePrediction(
+        predictions={model_name: predictions[model_name] for model_name in model_names},
+        vote=int(2 * sum(predictions.values()) > len(predictions)) if vote else None,
+        credits_left=credits_left,
+    )
+
+
 @router.post("/predict/{model_name}")
 async def predict_endpoint(
     model_name: str,
     input_data: InputData,
     session: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
 ) -> dict[str, int]:
-    if model_name not in ["model1", "model2", "model3"]:
+    catalog = model_catalog.get()
+    if model_name not in catalog.prices:
         raise HTTPException(status_code=400, detail="Invalid model name")
 
-    functions = session.exec(
-        select(Functions).where(Functions.id == current_user.id)
-    ).first()
-    if not functions:
+    cache_key = prediction_key(model_registry.manifest[model_name], input_data)
+    prediction = prediction_cache.get(cache_key) if prediction_cache.enabled else None
+    # Database and model work is blocking, keep it off the event loop
+    if prediction is not None and not settings.PREDICT_CACHE_CHARGE_HITS:
+        functions = await get_entitlements(session, current_user.id)
+        require_paid(functions, model_name, catalog)
+        log_prediction(current_user.id, model_name, input_data, prediction)
+        return {"prediction": prediction, "credits_left": functions.credits}
+
+    cached = entitlement_cache.get(current_user.id)
+    if (
+        cached is None
+        and current_user.entitlements is not None
+        and not catalog.entitled(current_user.entitlements, model_name)
+    ):
+        # Otherwise the token's claims let it through to the charge, the
+        # models paid for since it was issued aren't in them
+        cached = await get_entitlements(session, current_user.id)
+    if cached is not None:
+        # Refuse what can't be paid without touching the database
+        require_paid(cached, model_name, catalog)
+    credits_left = None
+    if settings.CREDIT_RESERVATIONS:
+        assert current_user.id is not None
+        # Most calls are charged from this worker's reservation, in memory
+        credits_left = credit_reservations.try_charge(
+            current_user.id,
+            model_name,
+            catalog.prices[model_name],
+            catalog.masks[model_name],
+        )
+    if credits_left is None:
+        credits_left = await run_in_threadpool(
+            charge_prediction, session, current_user.id, model_name, catalog
+        )
+    if prediction is None:
+        try:
+            prediction = await run_prediction(model_name, input_data)
+        except BaseException:
+            # Not charged for predictions it didn't get, even when cancelled
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(
+                    refund_prediction, session, current_user.id, model_name, catalog
+                )
+            raise
+        prediction_cache.put(cache_key, prediction)
+    log_prediction(current_user.id, model_name, input_data, prediction)
+
+    return {
+        "prediction": prediction,
+        "credits_left": credits_left,
+    }
+
+
+@router.post("/predict/{model_name}/batch", response_model=BatchPrediction)
+async def predict_batch_endpoint(
+    model_name: str,
+    input_data: list[InputData] | InputColumns,
+    session: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+) -> BatchPrediction:
+    catalog = model_catalog.get()
+    if model_name not in catalog.prices:
+        raise HTTPException(status_code=400, detail="Invalid model name")
+
+    if isinstance(input_data, InputColumns):
+        x_values = columns_to_matrix(input_data)
+    else:
+        x_values = rows_to_matrix(input_data)
+    n_rows = len(x_values)
+    if n_rows == 0:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if n_rows > settings.PREDICT_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch size exceeds {settings.PREDICT_MAX_BATCH_SIZE} rows",
+        )
+
+    cost = catalog.prices[model_name] * n_rows
+    functions = await get_entitlements(session, current_user.id)
+    if not catalog.entitled(functions.entitlements, model_name):
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
             detail=f"Payment required for {model_name}",
         )
-
-    if model_name == "model1" and not functions.model1:
+    if functions.credits < cost:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="Payment required for model1",
+            detail=f"Not enough credits for {n_rows} {model_name} predictions",
+        )
+
+    predictions = await inference_executor.run(
+        model_name, predict_many, model_name, x_values
+    )
+
+    credits_left = await run_in_threadpool(
+        crud.deduct_credits,
+        session=session,
+        user_id=current_user.id,
+        amount=cost,
+        entitlement=catalog.masks[model_name],
+    )
+    if credits_left is None:
+        detail = await run_in_threadpool(
+            charge_refused,
+            session,
+            current_user.id,
+            model_name,
+            f"Not enough credits for {n_rows} {model_name} predictions",
+        )
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail=detail)
+    if prediction_log.enabled:
+        prediction_log.log(current_user.id, model_name, x_values, predictions)
+
+    return BatchPrediction(predictions=predictions, credits_left=credits_left)
+
+
+@router.post("/predict/{model_name}/sweep", response_model=SweepPrediction)
+async def predict_sweep_endpoint(
+    model_name: str,
+    sweep_input: SweepInput,
+    session: SessionDep,
+    current_user: CurrentUser,
+) -> SweepPrediction:
+    """
+    Score a base input over a grid of one or two features, returning where
+    the prediction changes along the last one.
+    """
+    catalog = model_catalog.get()
+    if model_name not in catalog.prices:
+        raise HTTPException(status_code=400, detail="Invalid model name")
+    features = [axis.feature for axis in sweep_input.axes]
+    if any(feature not in FEATURES for feature in features):
+        raise HTTPException(status_code=400, detail="Invalid feature")
+    if len(set(features)) != len(features):
+        raise HTTPException(status_code=400, detail="Features must be distinct")
+    points = math.prod(
+        len(axis.values) if axis.values is not None else axis.num or 0
+        for axis in sweep_input.axes
+    )
+    if points > settings.PREDICT_SWEEP_MAX_POINTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Sweep exceeds {settings.PREDICT_SWEEP_MAX_POINTS} points",
         )
-    elif model_name == "model2" and not functions.model2:
+
+    cost = catalog.prices[model_name] * math.ceil(
+        points / settings.PREDICT_SWEEP_POINTS_PER_CREDIT
+    )
+    functions = await get_entitlements(session, current_user.id)
+    if not catalog.entitled(functions.entitlements, model_name):
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="Payment required for model2",
+            detail=f"Payment required for {model_name}",
         )
-    elif model_name == "model3" and not functions.model3:
+    if functions.credits < cost:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="Payment required for model3",
+            detail=f"Not enough credits for a {points} point {model_name} sweep",
+        )
+
+    rows = await inference_executor.run(
+        model_name, sweep, model_name, sweep_input.base, sweep_input.axes
+    )
+
+    credits_left = await run_in_threadpool(
+        crud.deduct_credits,
+        session=session,
+        user_id=current_user.id,
+        amount=cost,
+        entitlement=catalog.masks[model_name],
+    )
+    if credits_left is None:
+        detail = await run_in_threadpool(
+            charge_refused,
+            session,
+            current_user.id,
+            model_name,
+            f"Not enough credits for a {points} point {model_name} sweep",
         )
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail=detail)
 
-    if model_name == "model1" and functions.credits < 1:
+    return SweepPrediction(
+        features=features, points=points, rows=rows, credits_left=credits_left
+    )
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """
+    Streaming response sent while the request body is still being read.
+
+    StreamingResponse consumes incoming messages to watch for a disconnect,
+    which would swallow the upload. Here a disconnect is noticed by the body
+    stream itself, raising ClientDisconnect.
+    """
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await anyio.sleep_forever()
+
+
+def deduct_credits(user_id: int | None, amount: int, entitlement: int) -> int | None:
+    # Streaming responses outlive the request's session, use a new one
+    with Session(engine) as session:
+        return crud.deduct_credits(
+            session=session, user_id=user_id, amount=amount, entitlement=entitlement
+        )
+
+
+def bulk_charge_refused(user_id: int | None, model_name: str, detail: str) -> str:
+    with Session(engine) as session:
+        return charge_refused(session, user_id, model_name, detail)
+
+
+async def score_bulk(
+    model_name: str,
+    price: int,
+    entitlement: int,
+    user_id: int | None,
+    chunks: AsyncGenerator[npt.NDArray[np.float32], None],
+    credits_left: int,
+) -> AsyncIterator[str]:
+    """
+    Score and charge one chunk at a time, streaming a line per prediction and
+    ending with a summary line, which carries an error when scoring stopped
+    early.
+    """
+    rows = 0
+    error = None
+    async with aclosing(chunks):
+        try:
+            async for x_values in chunks:
+                predictions = await inference_executor.run(
+                    model_name, predict_many, model_name, x_values
+                )
+                cost = price * len(x_values)
+                charged = await run_in_threadpool(
+                    deduct_credits, user_id, cost, entitlement
+                )
+                if charged is None:
+                    error = await run_in_threadpool(
+                        bulk_charge_refused,
+                        user_id,
+                        model_name,
+                        f"Not enough credits for {len(x_values)} more rows",
+                    )
+                    break
+                credits_left = charged
+                rows += len(x_values)
+                if prediction_log.enabled:
+                    prediction_log.log(user_id, model_name, x_values, predictions)
+                yield "".join(
+                    json.dumps({"prediction": prediction}) + "\n"
+                    for prediction in predictions
+                )
+        except BulkInputError as e:
+            error = str(e)
+
+    summary: dict[str, str | int] = {"rows": rows, "credits_left": credits_left}
+    if error is not None:
+        summary["error"] = error
+    yield json.dumps(summary) + "\n"
+
+
+@router.post("/predict/{model_name}/bulk")
+async def predict_bulk_endpoint(
+    model_name: str,
+    request: Request,
+    session: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Score a streamed CSV (with a header row) or NDJSON upload of InputData
+    rows. Predictions are streamed back as NDJSON, in upload order, while the
+    upload is read.
+    """
+    catalog = model_catalog.get()
+    if model_name not in catalog.prices:
+        raise HTTPException(status_code=400, detail="Invalid model name")
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    input_format = BULK_MEDIA_TYPES.get(content_type)
+    if input_format is None:
         raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="Not enough credits for model1",
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Upload one of {', '.join(BULK_MEDIA_TYPES)}",
         )
-    elif model_name == "model2" and functions.credits < 2:
+
+    functions = await get_entitlements(session, current_user.id)
+    if not catalog.entitled(functions.entitlements, model_name):
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="Not enough credits for model2",
+            detail=f"Payment required for {model_name}",
         )
-    elif model_name == "model3" and functions.credits < 3:
+    if functions.credits < catalog.prices[model_name]:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="Not enough credits for model3",
+            detail=f"Not enough credits for {model_name}",
         )
 
-    prediction_service = PredictionService(model_name)
-    prediction = prediction_service.predict(input_data)
+    chunks = read_chunks(
+        request.stream(), input_format, settings.PREDICT_BULK_CHUNK_ROWS
+    )
+    return UploadStreamingResponse(
+        score_bulk(
+            model_name,
+            catalog.prices[model_name],
+            catalog.masks[model_name],
+            current_user.id,
+            chunks,
+            functions.credits,
+        ),
+        media_type="application/x-ndjson",
+    )
 
-    # Deduct credits based on the model used
-    if model_name == "model1":
-        functions.credits -= 1
-    elif model_name == "model2":
-        functions.credits -= 2
-    elif model_name == "model3":
-        functions.credits -= 3
 
-    session.add(functions)
+def job_public(job: PredictionJob) -> PredictionJobPublic:
+    rows_per_second = None
+    if job.started_at is not None and job.scored_rows:
+        finished_at = job.finished_at or datetime.now(timezone.utc)
+        elapsed = (finished_at - job.started_at).total_seconds()
+        rows_per_second = job.scored_rows / elapsed if elapsed > 0 else None
+    return PredictionJobPublic.model_validate(
+        job,
+        update={
+            "progress": job.scored_rows / job.total_rows if job.total_rows else 0.0,
+            "rows_per_second": rows_per_second,
+        },
+    )
+
+
+def delete_job(session: Session, job: PredictionJob) -> None:
+    session.delete(job)
     session.commit()
-    session.refresh(functions)
 
-    return {
-        "prediction": prediction["prediction"],
-        "credits_left": functions.credits,
-    }
+
+@router.post(
+    "/predict/{model_name}/jobs",
+    response_model=PredictionJobPublic,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def submit_prediction_job(
+    model_name: str,
+    request: Request,
+    session: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+) -> PredictionJobPublic:
+    """
+    Queue a streamed CSV (with a header row) or NDJSON upload of InputData
+    rows to be scored by the prediction workers. Every row is charged when
+    the upload completes.
+    """
+    catalog = model_catalog.get()
+    if model_name not in catalog.prices:
+        raise HTTPException(status_code=400, detail="Invalid model name")
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    input_format = BULK_MEDIA_TYPES.get(content_type)
+    if input_format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Upload one of {', '.join(BULK_MEDIA_TYPES)}",
+        )
+
+    functions = await get_entitlements(session, current_user.id)
+    if not catalog.entitled(functions.entitlements, model_name):
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Payment required for {model_name}",
+        )
+
+    assert current_user.id is not None
+    job = await run_in_threadpool(
+        crud.create_prediction_job,
+        session=session,
+        owner_id=current_user.id,
+        model=model_name,
+    )
+    chunks = read_chunks(
+        request.stream(), input_format, settings.PREDICT_JOB_CHUNK_ROWS
+    )
+    try:
+        async with aclosing(chunks):
+            async for x_values in chunks:
+                n_rows = job.total_rows + len(x_values)
+                if n_rows > settings.PREDICT_JOB_MAX_ROWS:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Jobs are limited to {settings.PREDICT_JOB_MAX_ROWS} rows",
+                    )
+                # Give up early on uploads the user can't pay for
+                if n_rows * catalog.prices[model_name] > functions.credits:
+                    raise HTTPException(
+                        status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                        detail=f"Not enough credits for {n_rows} {model_name} predictions",
+                    )
+                await run_in_threadpool(
+                    crud.add_prediction_job_chunk,
+                    session=session,
+                    job=job,
+                    inputs=x_values.tobytes(),
+                    n_rows=len(x_values),
+                )
+        if job.total_rows == 0:
+            raise HTTPException(status_code=400, detail="Empty upload")
+        credits_left = await run_in_threadpool(
+            crud.queue_prediction_job,
+            session=session,
+            job=job,
+            price=catalog.prices[model_name],
+        )
+        if credits_left is None:
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail=f"Not enough credits for {job.total_rows} {model_name} predictions",
+            )
+    except Exception as e:
+        await run_in_threadpool(delete_job, session, job)
+        if isinstance(e, BulkInputError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+
+    return job_public(job)
+
+
+def get_own_job(
+    session: Session, current_user: UserPrincipal, job_id: int
+) -> PredictionJob:
+    job = session.get(PredictionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not current_user.is_superuser and (job.owner_id != current_user.id):
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    return job
+
+
+@router.get("/predict/jobs/{job_id}", response_model=PredictionJobPublic)
+def read_prediction_job(
+    session: SessionDep, current_user: CurrentUser, job_id: int
+) -> PredictionJobPublic:
+    """
+    Status, progress and throughput of a prediction job.
+    """
+    return job_public(get_own_job(session, current_user, job_id))
+
+
+def iter_job_results(job_id: int) -> Iterator[str]:
+    # Streaming responses outlive the request's session, use a new one
+    with Session(engine) as session:
+        statement = (
+            select(PredictionJobResult.prediction)
+            .where(col(PredictionJobResult.job_id) == job_id)
+            .order_by(col(PredictionJobResult.row))
+            .execution_options(yield_per=settings.PREDICT_JOB_CHUNK_ROWS)
+        )
+        for predictions in session.exec(statement).partitions():
+            yield "".join(
+                json.dumps({"prediction": prediction}) + "\n"
+                for prediction in predictions
+            )
+
+
+@router.get("/predict/jobs/{job_id}/results")
+def read_prediction_job_results(
+    session: SessionDep, current_user: CurrentUser, job_id: int
+) -> StreamingResponse:
+    """
+    Predictions of a completed job as NDJSON, in upload order.
+    """
+    job = get_own_job(session, current_user, job_id)
+    if job.status != "completed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {job.status}",
+        )
+    return StreamingResponse(
+        iter_job_results(job_id), media_type="application/x-ndjson"
+    )
@@ -5,11 +5,13 @@ from sqlmodel import col, delete, func, select
 
 from app import crud
 from app.api.deps import (
+    CurrentDBUser,
     CurrentUser,
     SessionDep,
     get_current_active_superuser,
 )
 from app.core.config import settings
+from app.core.principals import principal_cache
 from app.core.security import get_password_hash, verify_password
 from app.models import (
     Item,
@@ -76,7 +78,7 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
 
 @router.patch("/me", response_model=UserPublic)
 def update_user_me(
-    *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentUser
+    *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentDBUser
 ) -> Any:
     """
     Update own user.
@@ -92,13 +94,14 @@ def update_user_me(
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     session.commit()
+    principal_cache.invalidate(current_user.id)
     session.refresh(current_user)
     return current_user
 
 
 @router.patch("/me/password", response_model=Message)
 def update_password_me(
-    *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
+    *, session: SessionDep, body: UpdatePassword, current_user: CurrentDBUser
 ) -> Any:
     """
     Update own password.
@@ -111,8 +114,11 @@ def update_password_me(
         )
     hashed_password = get_password_hash(body.new_password)
     current_user.hashed_password = hashed_password
+    # Revokes the user's tokens
+    current_user.token_version += 1
     session.add(current_user)
     session.commit()
+    principal_cache.invalidate(current_user.id)
     return Message(message="Password updated successfully")
 
 
@@ -125,7 +131,7 @@ def read_user_me(current_user: CurrentUser) -> Any:
 
 
 @router.delete("/me", response_model=Message)
-def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
+def delete_user_me(session: SessionDep, current_user: CurrentDBUser) -> Any:
     """
     Delete own user.
     """
@@ -137,6 +143,7 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
     session.exec(statement)  # type: ignore
     session.delete(current_user)
     session.commit()
+    principal_cache.invalidate(current_user.id)
     return Message(message="User deleted successfully")
 
 
@@ -169,7 +176,7 @@ def read_user_by_id(
     Get a specific user by id.
     """
     user = session.get(User, user_id)
-    if user == current_user:
+    if user and user.id == current_user.id:
         return user
     if not current_user.is_superuser:
         raise HTTPException(
@@ -221,7 +228,7 @@ def delete_user(
     user = session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if user == current_user:
+    if user.id == current_user.id:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
@@ -229,4 +236,5 @@ def delete_user(
     session.exec(statement)  # type: ignore
     session.delete(user)
     session.commit()
+    principal_cache.invalidate(user_id)
     return Message(message="User deleted successfully")
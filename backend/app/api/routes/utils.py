@@ -1,7 +1,18 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
+from app.core.credits import credit_reservations
+from app.core.entitlements import entitlement_cache
+from app.core.notifications import notification_listener
+from app.core.principals import principal_cache, token_revocations
+from app.core.security import password_hasher, verified_tokens
+from app.mlmodel.batching import micro_batcher
+from app.mlmodel.cache import prediction_cache
+from app.mlmodel.prediction_log import prediction_log
+from app.mlmodel.reload import manifest_watcher
 from app.models import Message
 from app.utils import generate_test_email, send_email
 
@@ -24,3 +35,24 @@ def test_email(email_to: EmailStr) -> Message:
         html_content=email_data.html_content,
     )
     return Message(message="Test email sent")
+
+
+@router.get("/metrics/", dependencies=[Depends(get_current_active_superuser)])
+async def read_metrics() -> dict[str, Any]:
+    """
+    In-process serving metrics of this worker. Read on the event loop, which
+    updates the micro-batching counters, for a consistent snapshot.
+    """
+    return {
+        "micro_batching": micro_batcher.metrics(),
+        "prediction_cache": prediction_cache.metrics(),
+        "model_reload": manifest_watcher.metrics(),
+        "credit_reservations": credit_reservations.metrics(),
+        "verified_tokens": verified_tokens.metrics(),
+        "password_hashing": password_hasher.metrics(),
+        "entitlement_cache": entitlement_cache.metrics(),
+        "user_cache": principal_cache.metrics(),
+        "token_revocations": token_revocations.metrics(),
+        "notifications": notification_listener.metrics(),
+        "prediction_log": prediction_log.metrics(),
+    }
@@ -0,0 +1,49 @@
+"""
+Benchmark password hashes per second per core for each hash scheme and cost,
+to pick PASSWORD_HASH_SCHEME and PASSWORD_HASH_ROUNDS for the login volume.
+A login verifies one hash, which costs as much as making it.
+
+    python -m app.benchmarks.password_hash --bcrypt-rounds 10 11 12 13
+"""
+
+import argparse
+import time
+
+from app.core.security import make_password_context
+
+
+def run(scheme: str, rounds: int, seconds: float) -> tuple[float, float]:
+    """Hashes per CPU second on one thread, and milliseconds per hash."""
+    context = make_password_context(scheme, rounds)
+    context.hash("warm up")
+    hashes = 0
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    while time.perf_counter() - start < seconds or not hashes:
+        context.hash("correct horse battery staple")
+        hashes += 1
+    cpu_seconds = time.thread_time() - cpu_start
+    wall_seconds = time.perf_counter() - start
+    return hashes / cpu_seconds, wall_seconds / hashes * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bcrypt-rounds", type=int, nargs="*", default=[10, 11, 12])
+    parser.add_argument(
+        "--pbkdf2-rounds", type=int, nargs="*", default=[29_000, 100_000]
+    )
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    settings = [("bcrypt", rounds) for rounds in args.bcrypt_rounds] + [
+        ("pbkdf2_sha256", rounds) for rounds in args.pbkdf2_rounds
+    ]
+    print(f"{'scheme':>14} {'rounds':>8} {'hashes/s/core':>14} {'ms/hash':>9}")
+    for scheme, rounds in settings:
+        per_core, ms_per_hash = run(scheme, rounds, args.seconds)
+        print(f"{scheme:>14} {rounds:>8} {per_core:>14.1f} {ms_per_hash:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark model load time, per-row latency, batch throughput and RSS of the
+pickled models through the sklearn APIs, through the direct booster path and
+in the compact format.
+
+    python -m app.benchmarks.predict --rows 100000
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from app.mlmodel.compact import CompactModel, compact_path
+from app.mlmodel.mlconfig import MANIFEST, load_model, load_scaler
+
+
+def random_inputs(n_rows: int, seed: int = 0) -> npt.NDArray[np.float32]:
+    rng = np.random.default_rng(seed)
+    return np.column_stack(
+        [
+            rng.integers(0, 2, n_rows),
+            rng.uniform(500, 10_000, n_rows),
+            rng.integers(0, 2, n_rows),
+            rng.uniform(20, 700, n_rows),
+            rng.integers(0, 2, n_rows),
+        ]
+    ).astype(np.float32)
+
+
+def _run(model_format: str, model_name: str, n_rows: int) -> dict[str, Any]:
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if model_format == "compact":
+        compact = CompactModel.load(compact_path(MANIFEST[model_name]))
+
+        def predict(x_values: npt.NDArray[np.float32]) -> Any:
+            return compact.predict(x_values)
+
+    elif model_format == "booster":
+        from app.mlmodel.booster import BoosterPipeline
+
+        fast = BoosterPipeline.from_pipeline(
+            load_model(model_name), load_scaler(model_name)
+        )
+        assert fast is not None
+
+        def predict(x_values: npt.NDArray[np.float32]) -> Any:
+            return fast.predict(x_values)
+
+    else:
+        model = load_model(model_name)
+        scaler = load_scaler(model_name)
+
+        def predict(x_values: npt.NDArray[np.float32]) -> Any:
+            return model.predict(scaler.transform(x_values))
+
+    load_seconds = time.perf_counter() - start
+    x_values = random_inputs(n_rows)
+    predict(x_values[:1])
+    rss_after_load = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    n_single = min(n_rows, 1000)
+    start = time.perf_counter()
+    for i in range(n_single):
+        predict(x_values[i : i + 1])
+    single_row_us = (time.perf_counter() - start) / n_single * 1e6
+
+    start = time.perf_counter()
+    predictions = predict(x_values)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "load_ms": load_seconds * 1000,
+        "single_row_us": single_row_us,
+        "batch_rows_per_s": n_rows / batch_seconds,
+        # ru_maxrss is in KiB on Linux
+        "load_rss_mib": (rss_after_load - rss_before) / 1024,
+        "predictions": np.asarray(predictions).tolist(),
+    }
+
+
+def _run_in_child(
+    model_format: str, model_name: str, n_rows: int, results: Any
+) -> None:
+    results.put(_run(model_format, model_name, n_rows))
+
+
+def run_isolated(model_format: str, model_name: str, n_rows: int) -> dict[str, Any]:
+    """Run in a fresh process, so load time and RSS include the imports."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(
+        target=_run_in_child, args=(model_format, model_name, n_rows, results)
+    )
+    process.start()
+    result: dict[str, Any] = results.get()
+    process.join()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default="model1", choices=list(MANIFEST))
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    model_formats = ("pickle", "booster", "compact")
+    results = {
+        model_format: run_isolated(model_format, args.model, args.rows)
+        for model_format in model_formats
+    }
+    print(f"{'':>20}" + "".join(f"{fmt:>14}" for fmt in model_formats))
+    for metric in ("load_ms", "single_row_us", "batch_rows_per_s", "load_rss_mib"):
+        values = (results[fmt][metric] for fmt in model_formats)
+        print(f"{metric:>20}" + "".join(f"{value:>14.1f}" for value in values))
+    for model_format in model_formats[1:]:
+        mismatches = sum(
+            a != b
+            for a, b in zip(
+                results["pickle"]["predictions"],
+                results[model_format]["predictions"],
+                strict=True,
+            )
+        )
+        print(f"{model_format} prediction mismatches: {mismatches} / {args.rows}")
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,27 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     # 60 minutes * 24 hours * 8 days = 8 days
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Issue short-lived access tokens carrying the user's claims, checked
+    # without reading the user, with a refresh token lasting
+    # ACCESS_TOKEN_EXPIRE_MINUTES to renew them
+    ACCESS_TOKEN_CLAIMS: bool = False
+    ACCESS_TOKEN_CLAIMS_EXPIRE_MINUTES: int = 15
+    # Verified access tokens remembered per worker, 0 verifies every request
+    TOKEN_CACHE_SIZE: int = 10_000
+    # Threads hashing and verifying passwords, apart from the threadpool of
+    # the sync routes, and how many more calls may wait for one before
+    # being refused with a 503
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 8
+    # Scheme and cost of new password hashes, None rounds being the scheme's
+    # default. Hashes made otherwise are upgraded in the background on login
+    PASSWORD_HASH_SCHEME: Literal["bcrypt", "pbkdf2_sha256"] = "bcrypt"
+    PASSWORD_HASH_ROUNDS: int | None = None
+    # Authenticated users' principals cached per worker, 0 reads the user
+    # on every request. Entries are dropped by every worker when the user
+    # changes, the TTL bounds how long a missed notification goes unnoticed
+    USER_CACHE_SIZE: int = 10_000
+    USER_CACHE_TTL_SECONDS: float = 30.0
     DOMAIN: str = "localhost"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
@@ -96,6 +117,89 @@ class Settings(BaseSettings):
     FIRST_SUPERUSER_PASSWORD: str
     USERS_OPEN_REGISTRATION: bool = False
 
+    # Load every model when the app starts instead of on its first request
+    MODEL_PRELOAD: bool = True
+    # Memory budget for loaded model artifacts per worker, 0 means unlimited
+    MODEL_REGISTRY_MAX_BYTES: int = 0
+    # "compact" serves the memory-mapped arrays written by app.mlmodel.compact
+    # instead of the pickled sklearn/xgboost models
+    MODEL_FORMAT: Literal["pickle", "compact"] = "pickle"
+    # Seconds between checks of the model manifest for hot reloads, 0 disables
+    MODEL_RELOAD_INTERVAL: float = 5.0
+    # Seconds between re-reads of the model catalog (models, prices, payment
+    # options) kept in memory by every worker
+    MODEL_CATALOG_REFRESH_SECONDS: float = 60.0
+    # Maximum number of rows accepted by the batch prediction endpoint
+    PREDICT_MAX_BATCH_SIZE: int = 10_000
+    # Rows parsed, scored and charged at once by the bulk scoring endpoint
+    PREDICT_BULK_CHUNK_ROWS: int = 1000
+    # Largest grid accepted by the what-if sweep endpoint, and how many of
+    # its points are charged as one prediction
+    PREDICT_SWEEP_MAX_POINTS: int = 100_000
+    PREDICT_SWEEP_POINTS_PER_CREDIT: int = 1000
+    # Asynchronous prediction jobs: rows stored and claimed by a worker at
+    # once, largest accepted job, how often idle workers look for work and
+    # how many worker processes app/prediction_worker.py starts
+    PREDICT_JOB_CHUNK_ROWS: int = 10_000
+    PREDICT_JOB_MAX_ROWS: int = 10_000_000
+    PREDICT_JOB_POLL_SECONDS: float = 1.0
+    PREDICT_JOB_WORKERS: int = 1
+    # Group concurrent single-row predictions into vectorized batches
+    PREDICT_MICRO_BATCHING: bool = True
+    PREDICT_BATCH_MAX_WAIT_MS: float = 2.0
+    PREDICT_BATCH_MAX_SIZE: int = 64
+    # Pending single-row predictions per model before rejecting with a 503
+    PREDICT_BATCH_QUEUE_SIZE: int = 1024
+    # Single-row prediction results cached per worker, 0 disables the cache
+    PREDICT_CACHE_SIZE: int = 10_000
+    PREDICT_CACHE_TTL_SECONDS: float = 300.0
+    # Charge credits for predictions answered from the cache
+    PREDICT_CACHE_CHARGE_HITS: bool = True
+    # How long a payment's Idempotency-Key is remembered, retries with it
+    # get the first response back instead of paying again
+    PAYMENT_IDEMPOTENCY_EXPIRE_HOURS: int = 24
+    # Users' entitlements and credits cached per worker for the checks made
+    # before scoring, 0 disables the cache. Entries are dropped by every
+    # worker when a change commits, the TTL bounds how long a missed
+    # notification can go unnoticed
+    ENTITLEMENT_CACHE_SIZE: int = 10_000
+    ENTITLEMENT_CACHE_TTL_SECONDS: float = 30.0
+    # Record scored predictions in the prediction log, written with COPY
+    # every PREDICTION_LOG_FLUSH_SECONDS or PREDICTION_LOG_FLUSH_ROWS rows.
+    # At most PREDICTION_LOG_MAX_ROWS rows wait in memory, past that the
+    # newest (or oldest) rows are dropped
+    PREDICTION_LOG: bool = True
+    PREDICTION_LOG_FLUSH_SECONDS: float = 1.0
+    PREDICTION_LOG_FLUSH_ROWS: int = 10_000
+    PREDICTION_LOG_MAX_ROWS: int = 200_000
+    PREDICTION_LOG_OVERFLOW: Literal["drop_newest", "drop_oldest"] = "drop_newest"
+    # Days of daily log partitions kept, 0 keeps them all
+    PREDICTION_LOG_RETENTION_DAYS: int = 90
+    # Charge /predict from per-worker credit reservations instead of with
+    # an UPDATE per call: a worker reserves CREDIT_RESERVATION_BLOCK credits
+    # of a user at once, appends its usage to the credit ledger every
+    # CREDIT_FLUSH_SECONDS (or CREDIT_FLUSH_PREDICTIONS predictions) and
+    # returns reservations unused for CREDIT_RESERVATION_IDLE_SECONDS
+    CREDIT_RESERVATIONS: bool = False
+    CREDIT_RESERVATION_BLOCK: int = 100
+    CREDIT_FLUSH_SECONDS: float = 1.0
+    CREDIT_FLUSH_PREDICTIONS: int = 1000
+    CREDIT_RESERVATION_IDLE_SECONDS: float = 60.0
+    # Credits a reservation may take a user's balance below zero
+    CREDIT_OVERDRAFT: int = 0
+    # Threads running model inference off the event loop, and how many of
+    # them a single model may use at once
+    INFERENCE_POOL_SIZE: int = 4
+    INFERENCE_MODEL_CONCURRENCY: int = 2
+    # Threads running sync routes and dependencies (database work)
+    THREADPOOL_SIZE: int = 40
+    # Run inference in this many dedicated processes per API worker, fed
+    # through shared memory buffers, 0 runs it in the API worker itself
+    INFERENCE_PROCESSES: int = 0
+    INFERENCE_PROCESS_SLOTS: int = 8
+    INFERENCE_PROCESS_MAX_ROWS: int = 1024
+    INFERENCE_PROCESS_TIMEOUT: float = 30.0
+
     def _check_default_secret(self, var_name: str, value: str | None) -> None:
         if value == "changethis":
             message = (
@@ -0,0 +1,311 @@
+"""
+Write-behind charging of single predictions from per-worker reservations.
+
+Charging every prediction with its own UPDATE serializes a busy user's
+requests on their Functions row. With CREDIT_RESERVATIONS enabled, each
+worker instead moves a block of a user's credits into a local reservation
+(one locked UPDATE per block) and charges predictions from it in memory.
+A block takes at most half of the balance left (but always one price), so
+one worker's reservation doesn't leave the other workers, and the batch,
+bulk and job charges, with nothing to draw from.
+Usage is appended to the CreditLedger table in batches, and what is left
+of a reservation goes back to the balance once it has been idle for a
+while, and when the worker stops.
+
+A worker killed without stopping keeps its reservations: the ledger's
+reserve, use and release rows of that worker tell how many credits to
+return.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import CreditLedger
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Reservation:
+    remaining: int
+    # Stored balance after the last reservation, credits_left is reported
+    # as this plus what remains of the reservation
+    balance: int
+    entitlements: int
+    used_at: float
+    # model name -> [credits, predictions] not yet written to the ledger
+    pending: dict[str, list[int]] = field(default_factory=dict)
+
+
+class CreditReservations:
+    def __init__(
+        self,
+        *,
+        block: int,
+        overdraft: int,
+        flush_seconds: float,
+        flush_predictions: int,
+        idle_seconds: float,
+        worker: str | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.block = block
+        self.overdraft = overdraft
+        self.flush_seconds = flush_seconds
+        self.flush_predictions = flush_predictions
+        self.idle_seconds = idle_seconds
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        self._clock = clock
+        self._reservations: dict[int, _Reservation] = {}
+        # Held while a user's reservation is read or changed, including the
+        # database round trip of a new reservation
+        self._user_locks: dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._pending_predictions = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.reservations = 0
+        self.flushes = 0
+
+    def try_charge(
+        self, user_id: int, model_name: str, price: int, entitlement: int
+    ) -> int | None:
+        """
+        Charge from the current reservation without waiting, returns the
+        credits left or None when that needs ``charge`` (no reservation, not
+        enough left, or another thread is reserving).
+        """
+        user_lock = self._user_lock(user_id)
+        if not user_lock.acquire(blocking=False):
+            return None
+        try:
+            return self._charge_reserved(user_id, model_name, price, entitlement)
+        finally:
+            user_lock.release()
+
+    def charge(
+        self, user_id: int, model_name: str, price: int, entitlement: int
+    ) -> int | None:
+        """
+        Charge a prediction, reserving more credits when needed. Returns the
+        credits left, or None when the user can't pay for it.
+        """
+        with self._user_lock(user_id):
+            credits_left = self._charge_reserved(
+                user_id, model_name, price, entitlement
+            )
+            if credits_left is not None:
+                return credits_left
+            with Session(engine) as session:
+                result = crud.reserve_credits(
+                    session=session,
+                    user_id=user_id,
+                    worker=self.worker,
+                    amount=max(self.block, price),
+                    minimum=price,
+                    overdraft=self.overdraft,
+                    entitlement=entitlement,
+                )
+            if result is None:
+                return None
+            reserved, functions = result
+            self.reservations += 1
+            reservation = self._reservations.get(user_id)
+            if reservation is None:
+                reservation = _Reservation(
+                    remaining=0, balance=0, entitlements=0, used_at=self._clock()
+                )
+                self._reservations[user_id] = reservation
+            reservation.remaining += reserved
+            reservation.balance = functions.credits
+            reservation.entitlements = functions.entitlements
+            return self._charge_reserved(user_id, model_name, price, entitlement)
+
+    def refund(self, user_id: int, model_name: str, price: int) -> None:
+        """Undo a charge, for a prediction that failed."""
+        with self._user_lock(user_id):
+            reservation = self._reservations.get(user_id)
+            if reservation is not None:
+                reservation.remaining += price
+                # Negative when the charge was already flushed, correcting it
+                usage = reservation.pending.setdefault(model_name, [0, 0])
+                usage[0] -= price
+                usage[1] -= 1
+                return
+        # Released in the meantime, usage included: undo the use and return
+        # the credits as released, keeping the ledger balanced
+        with Session(engine) as session:
+            crud.flush_credit_ledger(
+                session=session,
+                worker=self.worker,
+                usage=[
+                    CreditLedger(
+                        user_id=user_id,
+                        worker=self.worker,
+                        kind="use",
+                        model=model_name,
+                        credits=-price,
+                        predictions=-1,
+                    )
+                ],
+                releases={user_id: price},
+            )
+
+    def _charge_reserved(
+        self, user_id: int, model_name: str, price: int, entitlement: int
+    ) -> int | None:
+        reservation = self._reservations.get(user_id)
+        if (
+            reservation is None
+            or reservation.remaining < price
+            or reservation.entitlements & entitlement != entitlement
+        ):
+            return None
+        reservation.remaining -= price
+        reservation.used_at = self._clock()
+        usage = reservation.pending.setdefault(model_name, [0, 0])
+        usage[0] += price
+        usage[1] += 1
+        with self._lock:
+            self._pending_predictions += 1
+            if self._pending_predictions >= self.flush_predictions:
+                self._wake.set()
+        return reservation.balance + reservation.remaining
+
+    def _user_lock(self, user_id: int) -> threading.Lock:
+        user_lock = self._user_locks.get(user_id)
+        if user_lock is None:
+            with self._lock:
+                user_lock = self._user_locks.setdefault(user_id, threading.Lock())
+        return user_lock
+
+    def flush(self, release_all: bool = False) -> None:
+        """
+        Append pending usage to the ledger, and release the reservations
+        idle for ``idle_seconds`` (or all of them).
+        """
+        usage: list[CreditLedger] = []
+        released: dict[int, _Reservation] = {}
+        idle_since = self._clock() - self.idle_seconds
+        with self._lock:
+            self._pending_predictions = 0
+            self._wake.clear()
+            user_ids = list(self._reservations)
+        for user_id in user_ids:
+            with self._user_lock(user_id):
+                reservation = self._reservations[user_id]
+                usage += [
+                    CreditLedger(
+                        user_id=user_id,
+                        worker=self.worker,
+                        kind="use",
+                        model=model_name,
+                        credits=credits,
+                        predictions=predictions,
+                    )
+                    for model_name, (
+                        credits,
+                        predictions,
+                    ) in reservation.pending.items()
+                    if predictions
+                ]
+                reservation.pending = {}
+                if release_all or reservation.used_at <= idle_since:
+                    released[user_id] = self._reservations.pop(user_id)
+        if not usage and not released:
+            return
+        try:
+            with Session(engine) as session:
+                crud.flush_credit_ledger(
+                    session=session,
+                    worker=self.worker,
+                    usage=usage,
+                    releases={
+                        user_id: reservation.remaining
+                        for user_id, reservation in released.items()
+                        if reservation.remaining
+                    },
+                )
+        except SQLAlchemyError:
+            self._restore(usage, released)
+            raise
+        self.flushes += 1
+
+    def _restore(
+        self, usage: list[CreditLedger], released: dict[int, _Reservation]
+    ) -> None:
+        """Put back what a failed flush took, to be flushed again."""
+        for user_id, reservation in released.items():
+            with self._user_lock(user_id):
+                current = self._reservations.setdefault(user_id, reservation)
+                if current is not reservation:
+                    current.remaining += reservation.remaining
+        for entry in usage:
+            with self._user_lock(entry.user_id):
+                reservation = self._reservations[entry.user_id]
+                assert entry.model is not None
+                pending = reservation.pending.setdefault(entry.model, [0, 0])
+                pending[0] += entry.credits
+                pending[1] += entry.predictions
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="credit-reservations", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Flush the usage and give back every reservation."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(release_all=True)
+
+    def metrics(self) -> dict[str, Any]:
+        # Copied at once, request threads add and remove reservations
+        reservations = list(self._reservations.values())
+        return {
+            "reserved_users": len(reservations),
+            "reserved_credits": sum(
+                reservation.remaining for reservation in reservations
+            ),
+            "reservations": self.reservations,
+            "flushes": self.flushes,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+            except SQLAlchemyError:
+                logger.exception("Could not flush the credit ledger")
+
+
+credit_reservations = CreditReservations(
+    block=settings.CREDIT_RESERVATION_BLOCK,
+    overdraft=settings.CREDIT_OVERDRAFT,
+    flush_seconds=settings.CREDIT_FLUSH_SECONDS,
+    flush_predictions=settings.CREDIT_FLUSH_PREDICTIONS,
+    idle_seconds=settings.CREDIT_RESERVATION_IDLE_SECONDS,
+)
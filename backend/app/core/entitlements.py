@@ -0,0 +1,74 @@
+"""
+Per-worker cache of users' entitlements and credits, read before scoring
+instead of their Functions row.
+
+Entries expire after ``ttl_seconds``. Besides, triggers on the functions
+table NOTIFY the user's id on the ``functions_changed`` channel when a
+transaction changing their entitlements, or adding to their credits,
+commits (payments, refunds, changes made by hand), and every worker drops
+the entry (see app/core/notifications.py). Charging doesn't notify: cached
+credits are an upper bound of the balance, enough to refuse requests that
+can't be paid before scoring them, and charging itself stays the
+conditional UPDATE of crud.deduct_credits.
+"""
+
+from dataclasses import dataclass
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.notifications import notification_listener
+
+CHANNEL = "functions_changed"
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    # Bitmask of the CatalogModel bits the user paid for
+    entitlements: int
+    credits: int
+
+
+class EntitlementCache(TTLCache[int, Entitlements]):
+    """
+    Bounded LRU cache of users' Entitlements whose entries expire after
+    ``ttl_seconds``. A ``max_size`` of 0 disables it.
+    """
+
+    def get(self, user_id: int | None) -> Entitlements | None:
+        """The cached entitlements, or None when they need ``load``."""
+        if user_id is None:
+            return None
+        return super().get(user_id)
+
+    def load(self, session: Session, user_id: int | None) -> Entitlements:
+        """Read a user's entitlements from the database and cache them."""
+        generation = self.generation
+        functions = crud.get_functions(session=session, user_id=user_id)
+        if functions is None:
+            entitlements = Entitlements(entitlements=0, credits=0)
+        else:
+            entitlements = Entitlements(
+                entitlements=functions.entitlements, credits=functions.credits
+            )
+        if user_id is not None:
+            self.put(user_id, entitlements, generation=generation)
+        return entitlements
+
+    def invalidate(self, user_id: int | None) -> None:
+        if user_id is not None:
+            super().invalidate(user_id)
+
+    def on_notify(self, payload: str) -> None:
+        self.invalidate(int(payload))
+
+
+entitlement_cache = EntitlementCache(
+    max_size=settings.ENTITLEMENT_CACHE_SIZE,
+    ttl_seconds=settings.ENTITLEMENT_CACHE_TTL_SECONDS,
+)
+notification_listener.subscribe(
+    CHANNEL, entitlement_cache.on_notify, entitlement_cache.clear
+)
@@ -0,0 +1,54 @@
+import asyncio
+import weakref
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking work awaited from async routes, so it doesn't run
+    on (and stall) the event loop.
+
+    ``max_workers`` bounds the work running at once in the whole pool and,
+    when set, ``max_concurrency_per_key`` bounds it per key (e.g. per model),
+    so a burst on one key can't take every thread of the pool.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int,
+        max_concurrency_per_key: int = 0,
+        thread_name_prefix: str = "",
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_concurrency_per_key = max_concurrency_per_key
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix
+        )
+        # asyncio semaphores are bound to the loop they are first used on
+        self._semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]
+        ] = weakref.WeakKeyDictionary()
+
+    async def run(self, key: str, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        if not self.max_concurrency_per_key:
+            return await loop.run_in_executor(self._pool, fn, *args)
+        semaphores = self._semaphores.setdefault(loop, {})
+        if key not in semaphores:
+            semaphores[key] = asyncio.Semaphore(self.max_concurrency_per_key)
+        async with semaphores[key]:
+            return await loop.run_in_executor(self._pool, fn, *args)
+
+
+inference_executor = BoundedExecutor(
+    max_workers=settings.INFERENCE_POOL_SIZE,
+    max_concurrency_per_key=settings.INFERENCE_MODEL_CONCURRENCY,
+    thread_name_prefix="inference",
+)
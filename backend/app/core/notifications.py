@@ -0,0 +1,104 @@
+"""
+Invalidation of per-worker caches across workers through PostgreSQL
+LISTEN/NOTIFY.
+
+Triggers on the cached tables NOTIFY the id of a changed row when its
+transaction commits (see the migrations adding them). Each worker holds one
+connection listening on every subscribed channel and passes the payloads to
+the channel's handlers. Notifications sent while not listening are lost, so
+subscribers are reset whenever the listener (re)connects.
+"""
+
+import logging
+import select
+import threading
+from collections.abc import Callable
+from typing import Any
+
+import psycopg
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationListener:
+    def __init__(self) -> None:
+        # channel -> handlers of its payloads
+        self._handlers: dict[str, list[Callable[[str], None]]] = {}
+        self._resets: list[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.listening = threading.Event()
+        self.notifications = 0
+        self.reconnects = 0
+
+    def subscribe(
+        self, channel: str, handler: Callable[[str], None], reset: Callable[[], None]
+    ) -> None:
+        """
+        Call ``handler`` with the payload of each notification on
+        ``channel``, and ``reset`` when notifications may have been missed.
+        """
+        self._handlers.setdefault(channel, []).append(handler)
+        self._resets.append(reset)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="notification-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "listening": self.listening.is_set(),
+            "channels": sorted(self._handlers),
+            "notifications": self.notifications,
+            "reconnects": self.reconnects,
+        }
+
+    def _on_notify(self, notify: psycopg.Notify) -> None:
+        self.notifications += 1
+        for handler in self._handlers.get(notify.channel, []):
+            handler(notify.payload)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(
+                    host=settings.POSTGRES_SERVER,
+                    port=settings.POSTGRES_PORT,
+                    user=settings.POSTGRES_USER,
+                    password=settings.POSTGRES_PASSWORD,
+                    dbname=settings.POSTGRES_DB,
+                    autocommit=True,
+                ) as connection:
+                    connection.add_notify_handler(self._on_notify)
+                    for channel in self._handlers:
+                        connection.execute(f"LISTEN {channel}")
+                    for reset in self._resets:
+                        reset()
+                    self.listening.set()
+                    while not self._stop.is_set():
+                        readable, _, _ = select.select([connection], [], [], 1.0)
+                        if readable:
+                            # Receives the pending notifications
+                            connection.execute("SELECT 1")
+            except psycopg.Error:
+                logger.warning("Notification listener failed", exc_info=True)
+                self.reconnects += 1
+                self._stop.wait(1.0)
+            finally:
+                self.listening.clear()
+
+
+notification_listener = NotificationListener()
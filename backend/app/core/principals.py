@@ -0,0 +1,159 @@
+"""
+Per-worker cache of the authenticated user's principal: the few fields of
+their User row that authorization needs, so that authenticating a request
+doesn't read the row.
+
+Entries expire after ``ttl_seconds``. Besides, a trigger on the user table
+NOTIFYs the user's id and token_version on the ``user_changed`` channel
+when a transaction updating or deleting them commits, and every worker
+drops the entry (see app/core/notifications.py). The code paths changing
+users also drop it right away in their own worker.
+
+Self-contained access tokens (ACCESS_TOKEN_CLAIMS) carry the principal
+instead. The notified versions tell the workers which of them were revoked.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from sqlmodel import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.notifications import notification_listener
+from app.models import User
+
+CHANNEL = "user_changed"
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    id: int
+    email: str
+    is_active: bool
+    is_superuser: bool
+    full_name: str | None
+    token_version: int
+    # CatalogModel bits granted by the access token, None unless it carries
+    # claims
+    entitlements: int | None = None
+
+
+class PrincipalCache(TTLCache[int, UserPrincipal]):
+    """
+    Bounded LRU cache of UserPrincipals whose entries expire after
+    ``ttl_seconds``. A ``max_size`` of 0 disables it.
+    """
+
+    def get(self, user_id: int | None) -> UserPrincipal | None:
+        """The cached principal, or None when it needs ``load``."""
+        if user_id is None:
+            return None
+        return super().get(user_id)
+
+    def load(self, session: Session, user_id: int | None) -> UserPrincipal | None:
+        """Read a user from the database and cache their principal."""
+        generation = self.generation
+        user = session.get(User, user_id)
+        if user is None or user.id is None:
+            return None
+        principal = UserPrincipal(
+            id=user.id,
+            email=user.email,
+            is_active=user.is_active,
+            is_superuser=user.is_superuser,
+            full_name=user.full_name,
+            token_version=user.token_version,
+        )
+        self.put(user.id, principal, generation=generation)
+        return principal
+
+    def invalidate(self, user_id: int | None) -> None:
+        if user_id is not None:
+            super().invalidate(user_id)
+
+    def on_notify(self, payload: str) -> None:
+        user_id, _, _version = payload.partition(":")
+        self.invalidate(int(user_id))
+
+
+class TokenRevocations:
+    """
+    The token_version last notified for the users changed within the lifetime
+    of an access token, revoking their tokens of older versions.
+    """
+
+    def __init__(
+        self,
+        lifetime_seconds: float,
+        listening: threading.Event,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.lifetime_seconds = lifetime_seconds
+        # Set while notifications are received
+        self._listening = listening
+        self._clock = clock
+        # user id -> (version, noted_at), in the order noted
+        self._versions: OrderedDict[int, tuple[int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Notifications before aren't known
+        self._reset_at = clock()
+        self.revoked = 0
+
+    def check(self, user_id: int, version: int, issued_at: float) -> bool | None:
+        """
+        Whether a token of ``version`` issued at ``issued_at`` still holds, or
+        None when it can't be told without reading the user: notifications
+        aren't being received, or may have been missed since it was issued.
+        """
+        if not self._listening.is_set():
+            return None
+        with self._lock:
+            if issued_at < self._reset_at:
+                return None
+            entry = self._versions.get(user_id)
+            if entry is not None and version < entry[0]:
+                self.revoked += 1
+                return False
+            return True
+
+    def note(self, user_id: int, version: int) -> None:
+        now = self._clock()
+        with self._lock:
+            self._versions.pop(user_id, None)
+            self._versions[user_id] = (version, now)
+            # Tokens issued before the oldest entries have expired
+            while next(iter(self._versions.values()))[1] < now - self.lifetime_seconds:
+                self._versions.popitem(last=False)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._versions.clear()
+            self._reset_at = self._clock()
+
+    def metrics(self) -> dict[str, Any]:
+        return {"size": len(self._versions), "revoked": self.revoked}
+
+    def on_notify(self, payload: str) -> None:
+        user_id, _, version = payload.partition(":")
+        self.note(int(user_id), int(version))
+
+
+principal_cache = PrincipalCache(
+    max_size=settings.USER_CACHE_SIZE,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+)
+token_revocations = TokenRevocations(
+    lifetime_seconds=settings.ACCESS_TOKEN_CLAIMS_EXPIRE_MINUTES * 60,
+    listening=notification_listener.listening,
+)
+notification_listener.subscribe(
+    CHANNEL, principal_cache.on_notify, principal_cache.clear
+)
+notification_listener.subscribe(
+    CHANNEL, token_revocations.on_notify, token_revocations.reset
+)
@@ -1,27 +1,219 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any
+from typing import Any, TypeVar
 
 import jwt
 from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
 
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.models import TokenPayload
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_SCHEMES = ["bcrypt", "pbkdf2_sha256"]
+
+
+def make_password_context(scheme: str, rounds: int | None = None) -> CryptContext:
+    """
+    Hashes passwords with ``scheme`` at ``rounds``, and verifies the hashes of
+    every scheme. Those of another scheme or cost need an update.
+    """
+    if rounds is None:
+        rounds = get_crypt_handler(scheme).default_rounds
+    options: dict[str, Any] = {
+        f"{scheme}__{option}": rounds
+        for option in ("rounds", "min_rounds", "max_rounds")
+    }
+    return CryptContext(
+        schemes=PASSWORD_HASH_SCHEMES, default=scheme, deprecated="auto", **options
+    )
+
+
+pwd_context = make_password_context(
+    settings.PASSWORD_HASH_SCHEME, settings.PASSWORD_HASH_ROUNDS
+)
 
 
 ALGORITHM = "HS256"
 
+T = TypeVar("T")
+
 
-def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
-    expire = datetime.utcnow() + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject)}
+def create_access_token(
+    subject: str | Any,
+    expires_delta: timedelta,
+    claims: dict[str, Any] | None = None,
+) -> str:
+    now = datetime.utcnow()
+    to_encode = {"exp": now + expires_delta, "sub": str(subject)}
+    if claims is not None:
+        to_encode.update(claims, iat=now)
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def create_refresh_token(
+    subject: str | Any, version: int, expires_delta: timedelta
+) -> str:
+    """A token renewing the access tokens of its user while their version holds."""
+    to_encode = {
+        "exp": datetime.utcnow() + expires_delta,
+        "sub": str(subject),
+        "type": "refresh",
+        "ver": version,
+    }
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of access tokens already verified, from the SHA-256 digest of
+    the token to its payload and expiry, so that a token reused for many
+    requests is decoded once. Entries are dropped when the token expires and
+    all of them when SECRET_KEY changes. A ``max_size`` of 0 disables it.
+    """
+
+    def __init__(self, max_size: int, clock: Callable[[], float] = time.time) -> None:
+        # Entries expire with their token
+        self._cache = TTLCache[bytes, TokenPayload](max_size, math.inf, clock)
+        self._secret_key = settings.SECRET_KEY
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> TokenPayload | None:
+        """The payload of a verified, unexpired token, or None."""
+        digest = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            if self._secret_key != settings.SECRET_KEY:
+                self._cache.clear()
+                self._secret_key = settings.SECRET_KEY
+            return self._cache.get(digest)
+
+    def put(self, token: str, payload: TokenPayload, exp: float) -> None:
+        digest = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            if self._secret_key != settings.SECRET_KEY:
+                # Verified with another key
+                return
+            self._cache.put(digest, payload, expires_at=exp)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def metrics(self) -> dict[str, Any]:
+        return self._cache.metrics()
+
+
+verified_tokens = VerifiedTokenCache(max_size=settings.TOKEN_CACHE_SIZE)
+
+
+class PasswordHashingBusyError(Exception):
+    pass
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification, tens to hundreds of ms of CPU
+    each, on ``max_workers`` threads of its own rather than the threadpool
+    shared by every sync route. Up to ``max_queue`` more calls wait for a
+    thread, the others are refused at once with PasswordHashingBusyError, so
+    a burst of logins holds a bounded number of threadpool threads.
+    """
+
+    def __init__(self, *, max_workers: int, max_queue: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hash"
+        )
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.calls = 0
+        self.rejected = 0
+        # Waiting for a thread, and hashing on it
+        self.queue_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordHashingBusyError("Too many passwords being checked")
+            self.pending += 1
+        try:
+            future = self._pool.submit(self._timed, time.perf_counter(), fn, *args)
+            return future.result()
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def submit(self, fn: Callable[[], None]) -> bool:
+        """
+        Run ``fn`` in the background, unless every thread and queue slot is
+        taken. Whether it was submitted.
+        """
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                return False
+            self.pending += 1
+        future = self._pool.submit(self._timed, time.perf_counter(), fn)
+        future.add_done_callback(self._background_done)
+        return True
+
+    def _background_done(self, future: Future[None]) -> None:
+        with self._lock:
+            self.pending -= 1
+        error = future.exception()
+        if error is not None:
+            logger.error("Background password hashing failed", exc_info=error)
+
+    def _timed(self, submitted_at: float, fn: Callable[..., T], *args: Any) -> T:
+        started_at = time.perf_counter()
+        cpu_started_at = time.thread_time()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.calls += 1
+                self.queue_seconds += started_at - submitted_at
+                self.cpu_seconds += time.thread_time() - cpu_started_at
+
+    def metrics(self) -> dict[str, Any]:
+        calls = self.calls
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "calls": calls,
+            "rejected": self.rejected,
+            "queue_seconds": self.queue_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "mean_queue_ms": self.queue_seconds / calls * 1e3 if calls else 0.0,
+            "mean_cpu_ms": self.cpu_seconds / calls * 1e3 if calls else 0.0,
+        }
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_QUEUE_SIZE,
+)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.run(pwd_context.verify, plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_hasher.run(pwd_context.hash, password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
@@ -1,9 +1,30 @@
+from datetime import datetime
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, delete, select, update
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.core.principals import principal_cache
+from app.core.security import (
+    get_password_hash,
+    password_hasher,
+    password_needs_rehash,
+    pwd_context,
+    verify_password,
+)
+from app.models import (
+    CreditLedger,
+    Functions,
+    Item,
+    ItemCreate,
+    PaymentIdempotencyKey,
+    PredictionJob,
+    PredictionJobChunk,
+    User,
+    UserCreate,
+    UserUpdate,
+    utcnow,
+)
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -24,8 +45,13 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
         hashed_password = get_password_hash(password)
         extra_data["hashed_password"] = hashed_password
     db_user.sqlmodel_update(user_data, update=extra_data)
+    if "password" in user_data:
+        # Revokes the user's tokens
+        db_user.token_version += 1
     session.add(db_user)
     session.commit()
+    # Other workers are notified by the user table trigger
+    principal_cache.invalidate(db_user.id)
     session.refresh(db_user)
     return db_user
 
@@ -42,12 +68,296 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
         return None
     if not verify_password(password, db_user.hashed_password):
         return None
+    if password_needs_rehash(db_user.hashed_password):
+        schedule_rehash(session=session, db_user=db_user, password=password)
     return db_user
 
 
+def schedule_rehash(*, session: Session, db_user: User, password: str) -> bool:
+    """
+    Upgrade the outdated hash of a user's password in the background, off the
+    login. When hashing is busy, a later login will.
+    """
+    bind = session.get_bind()
+    user_id = db_user.id
+    hashed_password = db_user.hashed_password
+
+    def rehash() -> None:
+        # Already on a hashing thread
+        new_hashed_password = pwd_context.hash(password)
+        with Session(bind) as rehash_session:
+            update_password_hash(
+                session=rehash_session,
+                user_id=user_id,
+                hashed_password=hashed_password,
+                new_hashed_password=new_hashed_password,
+            )
+
+    return password_hasher.submit(rehash)
+
+
+def update_password_hash(
+    *,
+    session: Session,
+    user_id: int | None,
+    hashed_password: str,
+    new_hashed_password: str,
+) -> bool:
+    """
+    Replace a user's password hash by another of the same password, unless
+    their password was changed meanwhile. Whether it was replaced.
+    """
+    statement = (
+        update(User)
+        .where(
+            col(User.id) == user_id,
+            col(User.hashed_password) == hashed_password,
+        )
+        .values(hashed_password=new_hashed_password)
+        .returning(col(User.id))
+    )
+    replaced = session.execute(statement).first() is not None
+    session.commit()
+    return replaced
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: int) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
     session.commit()
     session.refresh(db_item)
     return db_item
+
+
+def get_functions(*, session: Session, user_id: int | None) -> Functions | None:
+    statement = select(Functions).where(Functions.id == user_id)
+    return session.exec(statement).first()
+
+
+def deduct_credits(
+    *, session: Session, user_id: int | None, amount: int, entitlement: int = 0
+) -> int | None:
+    """
+    Atomically charge credits, returns the remaining credits or None when the
+    user doesn't have enough of them, or lacks one of the ``entitlement``
+    bits.
+    """
+    credits_left = _charge_credits(
+        session=session, user_id=user_id, amount=amount, entitlement=entitlement
+    )
+    session.commit()
+    return credits_left
+
+
+def refund_credits(*, session: Session, user_id: int | None, amount: int) -> None:
+    """Give back credits charged for work that failed."""
+    session.execute(
+        update(Functions)
+        .where(col(Functions.id) == user_id)
+        .values(credits=col(Functions.credits) + amount)
+    )
+    session.commit()
+
+
+def add_credits(
+    *, session: Session, user_id: int, credits: int, entitlements: int
+) -> tuple[int, int]:
+    """
+    Add paid credits and entitlement bits to a user's balance in the
+    session's transaction, relative to the balance it finds so concurrent
+    charges aren't overwritten. Returns the new entitlements and credits.
+    """
+    values = insert(Functions).values(
+        id=user_id, credits=credits, entitlements=entitlements
+    )
+    statement = values.on_conflict_do_update(
+        index_elements=["id"],
+        set_={
+            "credits": col(Functions.credits) + values.excluded.credits,
+            "entitlements": col(Functions.entitlements).op("|")(
+                values.excluded.entitlements
+            ),
+        },
+    ).returning(col(Functions.entitlements), col(Functions.credits))
+    new_entitlements, new_credits = session.execute(statement).one()
+    return new_entitlements, new_credits
+
+
+def claim_payment_key(
+    *, session: Session, user_id: int, key: str, option: str, expired_before: datetime
+) -> bool:
+    """
+    Insert a payment's Idempotency-Key in the session's transaction, to be
+    committed with the payment. Returns False when the key was already used,
+    after waiting for a concurrent request using it to finish. A key created
+    before ``expired_before`` is claimed again, as if it were new.
+    """
+    values = insert(PaymentIdempotencyKey).values(
+        user_id=user_id, key=key, option=option, created_at=utcnow()
+    )
+    statement = values.on_conflict_do_update(
+        index_elements=["user_id", "key"],
+        set_={
+            "option": values.excluded.option,
+            "created_at": values.excluded.created_at,
+            "response": None,
+        },
+        where=col(PaymentIdempotencyKey.created_at) < expired_before,
+    ).returning(col(PaymentIdempotencyKey.key))
+    return session.execute(statement).first() is not None
+
+
+def get_payment_key(
+    *, session: Session, user_id: int, key: str
+) -> PaymentIdempotencyKey | None:
+    return session.get(PaymentIdempotencyKey, (user_id, key))
+
+
+def store_payment_response(
+    *,
+    session: Session,
+    user_id: int,
+    key: str,
+    response: dict[str, Any],
+    purge_before: datetime,
+) -> None:
+    """
+    Keep the response of a claimed key, in the payment's transaction, and
+    purge the keys created before ``purge_before``.
+    """
+    session.execute(
+        update(PaymentIdempotencyKey)
+        .where(col(PaymentIdempotencyKey.user_id) == user_id)
+        .where(col(PaymentIdempotencyKey.key) == key)
+        .values(response=response)
+    )
+    session.execute(
+        delete(PaymentIdempotencyKey).where(
+            col(PaymentIdempotencyKey.created_at) < purge_before
+        )
+    )
+
+
+def reserve_credits(
+    *,
+    session: Session,
+    user_id: int,
+    worker: str,
+    amount: int,
+    minimum: int,
+    overdraft: int = 0,
+    entitlement: int = 0,
+) -> tuple[int, Functions] | None:
+    """
+    Move up to ``amount`` credits (at least ``minimum``) from a user's
+    balance to a worker reservation, the balance going no lower than
+    ``-overdraft``. Above ``minimum``, no more than half of what is left is
+    reserved, so other workers' reservations and direct charges still find
+    credits. Returns the reserved credits and the updated Functions, or None
+    when the user can't cover ``minimum`` or lacks ``entitlement``.
+    """
+    functions = session.exec(
+        select(Functions).where(col(Functions.id) == user_id).with_for_update()
+    ).first()
+    if functions is None or functions.entitlements & entitlement != entitlement:
+        session.rollback()
+        return None
+    available = functions.credits + overdraft
+    if available < minimum:
+        session.rollback()
+        return None
+    reserved = min(amount, max(minimum, available // 2))
+    functions.credits -= reserved
+    session.add(functions)
+    session.add(
+        CreditLedger(user_id=user_id, worker=worker, kind="reserve", credits=reserved)
+    )
+    session.commit()
+    session.refresh(functions)
+    return reserved, functions
+
+
+def flush_credit_ledger(
+    *,
+    session: Session,
+    worker: str,
+    usage: list[CreditLedger],
+    releases: dict[int, int],
+) -> None:
+    """
+    Append a worker's usage entries to the ledger and return the unused part
+    of its released reservations (user id -> credits) to the balances, in
+    one transaction.
+    """
+    session.add_all(usage)
+    for user_id, amount in releases.items():
+        session.execute(
+            update(Functions)
+            .where(col(Functions.id) == user_id)
+            .values(credits=col(Functions.credits) + amount)
+        )
+        session.add(
+            CreditLedger(user_id=user_id, worker=worker, kind="release", credits=amount)
+        )
+    session.commit()
+
+
+def _charge_credits(
+    *, session: Session, user_id: int | None, amount: int, entitlement: int = 0
+) -> int | None:
+    statement = (
+        update(Functions)
+        .where(col(Functions.id) == user_id)
+        .where(col(Functions.credits) >= amount)
+        .values(credits=col(Functions.credits) - amount)
+        .returning(col(Functions.credits))
+    )
+    if entitlement:
+        entitlements = col(Functions.entitlements).op("&")(entitlement)
+        statement = statement.where(entitlements == entitlement)
+    return session.execute(statement).scalar_one_or_none()
+
+
+def create_prediction_job(
+    *, session: Session, owner_id: int, model: str
+) -> PredictionJob:
+    job = PredictionJob(owner_id=owner_id, model=model)
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def add_prediction_job_chunk(
+    *, session: Session, job: PredictionJob, inputs: bytes, n_rows: int
+) -> None:
+    assert job.id is not None
+    session.add(
+        PredictionJobChunk(
+            job_id=job.id, first_row=job.total_rows, n_rows=n_rows, inputs=inputs
+        )
+    )
+    job.total_rows += n_rows
+    session.add(job)
+    session.commit()
+
+
+def queue_prediction_job(
+    *, session: Session, job: PredictionJob, price: int
+) -> int | None:
+    """
+    Charge every row of an uploaded job and hand it to the workers, in one
+    transaction. Returns the remaining credits, or None when the owner can't
+    pay for the job, which is then left unqueued.
+    """
+    cost = job.total_rows * price
+    credits_left = _charge_credits(session=session, user_id=job.owner_id, amount=cost)
+    if credits_left is None:
+        session.rollback()
+        return None
+    job.status = "queued"
+    job.credits = cost
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return credits_left
@@ -1,16 +1,62 @@
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+import anyio
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.credits import credit_reservations
+from app.core.notifications import notification_listener
+from app.core.security import PasswordHashingBusyError
+from app.mlmodel.batching import micro_batcher
+from app.mlmodel.catalog import model_catalog
+from app.mlmodel.prediction_log import prediction_log
+from app.mlmodel.registry import model_registry
+from app.mlmodel.reload import manifest_watcher
+from app.mlmodel.workers import inference_pool
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None, None]:
+    anyio.to_thread.current_default_thread_limiter().total_tokens = (
+        settings.THREADPOOL_SIZE
+    )
+    if settings.INFERENCE_PROCESSES:
+        inference_pool.start()
+    elif settings.MODEL_PRELOAD:
+        model_registry.preload(compact=settings.MODEL_FORMAT == "compact")
+    if settings.MODEL_RELOAD_INTERVAL:
+        # The inference processes load the models, this one only needs the
+        # manifest for the prediction cache keys
+        manifest_watcher.start(load_models=not settings.INFERENCE_PROCESSES)
+    model_catalog.get()
+    model_catalog.start()
+    notification_listener.start()
+    if settings.CREDIT_RESERVATIONS:
+        credit_reservations.start()
+    if settings.PREDICTION_LOG:
+        prediction_log.start()
+    yield
+    prediction_log.stop()
+    if settings.CREDIT_RESERVATIONS:
+        credit_reservations.stop()
+    notification_listener.stop()
+    model_catalog.stop()
+    manifest_watcher.stop()
+    await micro_batcher.stop()
+    if inference_pool.running:
+        inference_pool.stop()
+
+
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
@@ -18,6 +64,7 @@ app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -32,4 +79,17 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+
+@app.exception_handler(PasswordHashingBusyError)
+async def password_hashing_busy_handler(
+    _request: Request, exc: PasswordHashingBusyError
+) -> JSONResponse:
+    # Logins, signups and password changes, refused rather than queued
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.core.config import settings
+from app.core.executor import inference_executor
+from app.mlmodel.prediction import PredictionService, rows_to_matrix
+from app.models import InputData
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _predict_batch(model_name: str, rows: list[InputData]) -> list[int]:
+    return PredictionService(model_name).predict_batch(rows_to_matrix(rows))
+
+
+@dataclass
+class BatchSizeHistogram:
+    """Number of flushed batches per power-of-two batch size bucket."""
+
+    max_batch_size: int
+    batches: int = 0
+    rows: int = 0
+    buckets: dict[int, int] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        upper_bound = 1
+        while upper_bound < self.max_batch_size:
+            self.buckets[upper_bound] = 0
+            upper_bound *= 2
+        self.buckets[self.max_batch_size] = 0
+
+    def observe(self, batch_size: int) -> None:
+        self.batches += 1
+        self.rows += batch_size
+        for upper_bound in self.buckets:
+            if batch_size <= upper_bound:
+                self.buckets[upper_bound] += 1
+                break
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "batch_size_buckets": {
+                f"le_{upper_bound}": count
+                for upper_bound, count in self.buckets.items()
+            },
+        }
+
+
+@dataclass
+class _PendingPrediction:
+    input_data: InputData
+    future: "asyncio.Future[int]"
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-row predictions per model for up to
+    ``max_wait_ms`` or ``max_batch_size`` rows and scores them with one
+    vectorized call.
+
+    A worker task per model is started lazily on the running event loop, call
+    ``stop`` from that same loop on shutdown (see the app lifespan).
+    """
+
+    def __init__(
+        self, *, max_wait_ms: float, max_batch_size: int, max_queue_size: int
+    ) -> None:
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.histograms: dict[str, BatchSizeHistogram] = {}
+        self._queues: dict[str, asyncio.Queue[_PendingPrediction]] = {}
+        self._wakeups: dict[str, asyncio.Event] = {}
+        self._workers: dict[str, asyncio.Task[None]] = {}
+
+    async def predict(self, model_name: str, input_data: InputData) -> int:
+        worker = self._workers.get(model_name)
+        if worker is None or worker.done():
+            # Started lazily, and again should it have died
+            self._start_worker(model_name)
+        future: asyncio.Future[int] = asyncio.get_running_loop().create_future()
+        try:
+            self._queues[model_name].put_nowait(
+                _PendingPrediction(input_data=input_data, future=future)
+            )
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Prediction queue for {model_name} is full")
+        self._wakeups[model_name].set()
+        return await future
+
+    async def stop(self) -> None:
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            while not queue.empty():
+                queue.get_nowait().future.cancel()
+        self._workers.clear()
+        self._queues.clear()
+        self._wakeups.clear()
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            model_name: histogram.snapshot()
+            for model_name, histogram in self.histograms.items()
+        }
+
+    def _start_worker(self, model_name: str) -> None:
+        # A restarted worker takes over the predictions already queued
+        self._queues.setdefault(model_name, asyncio.Queue(maxsize=self.max_queue_size))
+        self._wakeups.setdefault(model_name, asyncio.Event())
+        self.histograms.setdefault(
+            model_name, BatchSizeHistogram(max_batch_size=self.max_batch_size)
+        )
+        self._workers[model_name] = asyncio.create_task(self._run(model_name))
+
+    async def _run(self, model_name: str) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queues[model_name]
+        wakeup = self._wakeups[model_name]
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(model_name, batch)
+
+    async def _flush(self, model_name: str, batch: list[_PendingPrediction]) -> None:
+        batch = [pending for pending in batch if not pending.future.done()]
+        if not batch:
+            return
+        self.histograms[model_name].observe(len(batch))
+        try:
+            predictions = await inference_executor.run(
+                model_name,
+                _predict_batch,
+                model_name,
+                [pending.input_data for pending in batch],
+            )
+        except Exception as e:
+            logger.exception("Batched prediction failed for %s", model_name)
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        # Callers may have been cancelled while it was scored
+        for pending, prediction in zip(batch, predictions, strict=True):
+            if not pending.future.done():
+                pending.future.set_result(prediction)
+
+
+micro_batcher = MicroBatcher(
+    max_wait_ms=settings.PREDICT_BATCH_MAX_WAIT_MS,
+    max_batch_size=settings.PREDICT_BATCH_MAX_SIZE,
+    max_queue_size=settings.PREDICT_BATCH_QUEUE_SIZE,
+)
@@ -0,0 +1,95 @@
+import json
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from sklearn.preprocessing import StandardScaler  # type: ignore
+from xgboost import Booster, XGBClassifier
+
+
+@dataclass(frozen=True)
+class BoosterPipeline:
+    """
+    Scaler + classifier pair scored without going through the sklearn APIs.
+
+    ``StandardScaler.transform`` and ``XGBClassifier.predict`` validate their
+    input and build a DMatrix on every call, which dominates the cost of
+    scoring a handful of rows. This keeps the scaler's mean/scale as arrays
+    and calls the booster's ``inplace_predict`` directly, with the same
+    float32 arithmetic, so predictions are identical.
+    """
+
+    mean: npt.NDArray[np.float64]
+    scale: npt.NDArray[np.float64]
+    booster: Booster
+    iteration_range: tuple[int, int]
+    # Sorted distinct split thresholds of each feature, on the scaled values
+    splits: tuple[npt.NDArray[np.float32], ...] = ()
+
+    @classmethod
+    def from_pipeline(cls, model: Any, scaler: Any) -> "BoosterPipeline | None":
+        """The fast path for a model/scaler pair, None if it isn't supported."""
+        if type(model) is not XGBClassifier or type(scaler) is not StandardScaler:
+            return None
+        if model.objective != "binary:logistic" or model.n_classes_ != 2:
+            return None
+        n_features = scaler.n_features_in_
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+        booster = model.get_booster()
+        best_iteration = booster.attr("best_iteration")
+        iteration_range = (
+            0,
+            int(best_iteration) + 1 if best_iteration is not None else 0,
+        )
+        return cls(
+            mean=np.asarray(mean, dtype=np.float64),
+            scale=np.asarray(scale, dtype=np.float64),
+            booster=booster,
+            iteration_range=iteration_range,
+            splits=_split_values(booster, n_features),
+        )
+
+    def split_values(self, feature: int) -> npt.NDArray[np.float32]:
+        """
+        Thresholds the trees compare ``feature`` against, rows whose scaled
+        values fall between the same two thresholds take the same paths.
+        """
+        return self.splits[feature]
+
+    def predict(self, x_values: npt.NDArray[Any]) -> npt.NDArray[np.int64]:
+        return self.predict_scaled(self.transform(x_values))
+
+    def transform(self, x_values: npt.NDArray[Any]) -> npt.NDArray[np.float32]:
+        scaled_x_values = np.array(x_values, dtype=np.float64)
+        scaled_x_values -= self.mean
+        scaled_x_values /= self.scale
+        return scaled_x_values.astype(np.float32)
+
+    def predict_scaled(
+        self, scaled_x_values: npt.NDArray[np.float32]
+    ) -> npt.NDArray[np.int64]:
+        probabilities = self.booster.inplace_predict(
+            scaled_x_values, iteration_range=self.iteration_range
+        )
+        return (probabilities > 0.5).astype(np.int64)  # type: ignore[no-any-return]
+
+
+def _split_values(
+    booster: Booster, n_features: int
+) -> tuple[npt.NDArray[np.float32], ...]:
+    trees = json.loads(booster.save_raw("json"))["learner"]["gradient_booster"][
+        "model"
+    ]["trees"]
+    thresholds: list[list[float]] = [[] for _ in range(n_features)]
+    for tree in trees:
+        for left, feature, threshold in zip(
+            tree["left_children"],
+            tree["split_indices"],
+            tree["split_conditions"],
+            strict=True,
+        ):
+            if left != -1:
+                thresholds[feature].append(threshold)
+    return tuple(np.unique(np.array(values, dtype=np.float32)) for values in thresholds)
@@ -0,0 +1,100 @@
+"""
+Incremental parsing of bulk scoring uploads into fixed-size feature matrices.
+
+Uploads are CSV files with a header row naming the InputData columns, or
+NDJSON files with one InputData object per line. Only the current partial
+line and one chunk of rows are held in memory, whatever the upload size.
+"""
+
+import csv
+import json
+from collections.abc import AsyncGenerator, AsyncIterable, AsyncIterator
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+
+from app.mlmodel.mlconfig import FEATURES
+
+BulkFormat = Literal["csv", "ndjson"]
+
+BULK_MEDIA_TYPES: dict[str, BulkFormat] = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+MAX_LINE_BYTES = 64 * 1024
+
+
+class BulkInputError(ValueError):
+    pass
+
+
+async def iter_lines(
+    stream: AsyncIterable[bytes], max_line_bytes: int = MAX_LINE_BYTES
+) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines, without their line terminator."""
+    pending = b""
+    async for data in stream:
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+        if len(pending) > max_line_bytes:
+            raise BulkInputError(f"Line longer than {max_line_bytes} bytes")
+    if pending.strip():
+        yield pending.rstrip(b"\r")
+
+
+def _parse_csv_header(line: bytes) -> list[int]:
+    header = next(csv.reader([line.decode("utf-8-sig")]), [])
+    columns = [column.strip() for column in header]
+    missing = [feature for feature in FEATURES if feature not in columns]
+    if missing:
+        raise BulkInputError(f"Missing CSV columns: {', '.join(missing)}")
+    return [columns.index(feature) for feature in FEATURES]
+
+
+def _parse_chunk(
+    lines: list[tuple[int, bytes]],
+    input_format: BulkFormat,
+    column_indexes: list[int],
+) -> npt.NDArray[np.float32]:
+    x_values = np.empty((len(lines), len(FEATURES)), dtype=np.float32)
+    for i, (line_number, line) in enumerate(lines):
+        try:
+            if input_format == "csv":
+                fields = next(csv.reader([line.decode()]))
+                x_values[i] = [float(fields[j]) for j in column_indexes]
+            else:
+                row = json.loads(line)
+                x_values[i] = [float(row[feature]) for feature in FEATURES]
+        except (IndexError, KeyError, TypeError, ValueError):
+            raise BulkInputError(f"Invalid row on line {line_number}")
+    return x_values
+
+
+async def read_chunks(
+    stream: AsyncIterable[bytes], input_format: BulkFormat, chunk_rows: int
+) -> AsyncGenerator[npt.NDArray[np.float32], None]:
+    """
+    Parse an upload into (n_rows, len(FEATURES)) float32 matrices of at most
+    ``chunk_rows`` rows, in file order. Blank lines are skipped.
+    """
+    line_number = 0
+    column_indexes: list[int] = []
+    pending: list[tuple[int, bytes]] = []
+    async for line in iter_lines(stream):
+        line_number += 1
+        if not line.strip():
+            continue
+        if input_format == "csv" and not column_indexes:
+            column_indexes = _parse_csv_header(line)
+            continue
+        pending.append((line_number, line))
+        if len(pending) == chunk_rows:
+            yield _parse_chunk(pending, input_format, column_indexes)
+            pending = []
+    if pending:
+        yield _parse_chunk(pending, input_format, column_indexes)
@@ -0,0 +1,32 @@
+from collections.abc import Hashable
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.mlmodel.mlconfig import FEATURES, ModelSpec
+from app.models import InputData
+
+
+def prediction_key(spec: ModelSpec, input_data: InputData) -> tuple[Hashable, ...]:
+    """
+    Cache key of a single-row prediction: the content hashes of the model
+    artifacts, so entries computed by a replaced model are never returned,
+    followed by the input features in model column order.
+    """
+    return (
+        spec.model_sha256,
+        spec.scaler_sha256,
+        *(float(getattr(input_data, feature)) for feature in FEATURES),
+    )
+
+
+class PredictionCache(TTLCache[Hashable, int]):
+    """
+    Bounded LRU cache of prediction results whose entries expire after
+    ``ttl_seconds``. A ``max_size`` of 0 disables it.
+    """
+
+
+prediction_cache = PredictionCache(
+    max_size=settings.PREDICT_CACHE_SIZE,
+    ttl_seconds=settings.PREDICT_CACHE_TTL_SECONDS,
+)
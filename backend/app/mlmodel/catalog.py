@@ -0,0 +1,105 @@
+"""
+In-memory copy of the model catalog: which models are sold, their price
+and entitlement bit, and the payment options.
+
+Every process keeps a snapshot of the CatalogModel and PaymentOption tables,
+re-read every MODEL_CATALOG_REFRESH_SECONDS, so that request handling checks
+entitlements and prices with dictionary lookups and bitwise ands. Adding a
+model is a catalog row (next to its manifest entry), not a schema change.
+"""
+
+import logging
+import threading
+from dataclasses import dataclass
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.mlmodel.mlconfig import MANIFEST
+from app.models import CatalogModel, PaymentOption
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Catalog:
+    # Credits per prediction of each model
+    prices: dict[str, int]
+    # Entitlement bitmask of each model (one bit)
+    masks: dict[str, int]
+    options: dict[str, PaymentOption]
+
+    @classmethod
+    def load(cls, session: Session) -> "Catalog":
+        models = session.exec(select(CatalogModel)).all()
+        # Models without artifacts in the manifest can't be served
+        served = [model for model in models if model.name in MANIFEST]
+        for model in models:
+            if model.name not in MANIFEST:
+                logger.warning("Catalog model %s isn't in the manifest", model.name)
+        return cls(
+            prices={model.name: model.price for model in served},
+            masks={model.name: 1 << model.bit for model in served},
+            options={
+                option.name: option
+                for option in session.exec(select(PaymentOption)).all()
+            },
+        )
+
+    def entitled(self, entitlements: int, model_name: str) -> bool:
+        return entitlements & self.masks[model_name] != 0
+
+    def entitled_models(self, entitlements: int) -> list[str]:
+        return [name for name, mask in self.masks.items() if entitlements & mask]
+
+
+class ModelCatalog:
+    """Process-wide catalog snapshot, refreshed by a background thread."""
+
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._catalog: Catalog | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def get(self) -> Catalog:
+        catalog = self._catalog
+        if catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    self.refresh()
+                catalog = self._catalog
+        assert catalog is not None
+        return catalog
+
+    def refresh(self) -> None:
+        with Session(engine) as session:
+            self._catalog = Catalog.load(session)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="model-catalog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except SQLAlchemyError:
+                logger.warning("Could not refresh the model catalog", exc_info=True)
+
+
+model_catalog = ModelCatalog(refresh_seconds=settings.MODEL_CATALOG_REFRESH_SECONDS)
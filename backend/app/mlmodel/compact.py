@@ -0,0 +1,250 @@
+"""
+Compact array-backed format for the loan models, and its NumPy evaluator.
+
+A converted model is a directory of ``.npy`` arrays describing every node of
+every tree (split feature, threshold, children, default direction, leaf
+value) plus a ``meta.json``. The scaler's affine transform is folded into the
+split thresholds, so raw features are compared directly, and the arrays can
+be memory-mapped instead of unpickling sklearn/xgboost objects.
+
+Convert the models listed in the manifest with:
+
+    python -m app.mlmodel.compact
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from app.mlmodel.mlconfig import MANIFEST, ModelSpec, load_artifact, this_dir
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+COMPACT_DIR: str = f"{this_dir}/models/compact"
+# Rows scored at once, keeps the (rows, trees) working arrays in cache
+_CHUNK_ROWS = 1024
+_ARRAYS = ("feature", "threshold", "left", "default_left", "value", "roots")
+
+
+def compact_key(spec: ModelSpec) -> str:
+    """Content key of a model/scaler pair, identical pairs share one output."""
+    pair = f"{spec.model_sha256}:{spec.scaler_sha256}".encode()
+    return hashlib.sha256(pair).hexdigest()[:16]
+
+
+def compact_path(spec: ModelSpec) -> str:
+    return f"{COMPACT_DIR}/{compact_key(spec)}"
+
+
+def _scale(
+    x_values: npt.NDArray[np.float32], mean: float, scale: float
+) -> npt.NDArray[np.float32]:
+    # Same arithmetic as StandardScaler.transform on float32 input: in-place
+    # float64 operations rounded back to float32 after each step
+    centered = (x_values.astype(np.float64) - mean).astype(np.float32)
+    return (centered.astype(np.float64) / scale).astype(np.float32)
+
+
+def fold_threshold(threshold: np.float32, mean: float, scale: float) -> np.float32:
+    """
+    Smallest raw float32 value whose scaled value is >= ``threshold``, so that
+    ``x < folded`` holds exactly when ``scale(x) < threshold``.
+    """
+    candidate = np.float32(float(threshold) * scale + mean)
+    while _scale(np.array([candidate]), mean, scale)[0] >= threshold:
+        candidate = np.nextafter(candidate, np.float32(-np.inf))
+    while _scale(np.array([candidate]), mean, scale)[0] < threshold:
+        candidate = np.nextafter(candidate, np.float32(np.inf))
+    return candidate
+
+
+def convert(
+    model: Any, scaler: Any
+) -> tuple[dict[str, npt.NDArray[Any]], dict[str, Any]]:
+    """Turn a fitted XGBClassifier and StandardScaler into compact arrays."""
+    learner = json.loads(model.get_booster().save_raw("json"))["learner"]
+    if learner["objective"]["name"] != "binary:logistic":
+        raise ValueError(f"Unsupported objective {learner['objective']['name']}")
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(scaler.n_features_in_)
+    scale = scaler.scale_ if scaler.with_std else np.ones(scaler.n_features_in_)
+
+    trees = learner["gradient_booster"]["model"]["trees"]
+    n_nodes = sum(len(tree["left_children"]) for tree in trees)
+    arrays: dict[str, npt.NDArray[Any]] = {
+        "feature": np.zeros(n_nodes, dtype=np.int32),
+        "threshold": np.full(n_nodes, np.nan, dtype=np.float32),
+        "left": np.zeros(n_nodes, dtype=np.int32),
+        "default_left": np.ones(n_nodes, dtype=np.bool_),
+        "value": np.zeros(n_nodes, dtype=np.float32),
+        "roots": np.zeros(len(trees), dtype=np.int32),
+    }
+    max_depth = 0
+    offset = 0
+    for t, tree in enumerate(trees):
+        if any(tree["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        arrays["roots"][t] = offset
+        # Renumber nodes breadth first so the right child always directly
+        # follows the left one
+        order = [(0, 0)]
+        new_ids = {0: offset}
+        for node, depth in order:
+            i = new_ids[node]
+            left = tree["left_children"][node]
+            if left == -1:
+                # Leaves point to themselves and their NaN threshold never
+                # sends a row right, so traversal can run a fixed number of
+                # steps for every tree
+                arrays["left"][i] = i
+                arrays["value"][i] = tree["split_conditions"][node]
+                continue
+            right = tree["right_children"][node]
+            feature = tree["split_indices"][node]
+            new_ids[left] = offset + len(order)
+            new_ids[right] = new_ids[left] + 1
+            order += [(left, depth + 1), (right, depth + 1)]
+            max_depth = max(max_depth, depth + 1)
+            arrays["feature"][i] = feature
+            arrays["threshold"][i] = fold_threshold(
+                np.float32(tree["split_conditions"][node]),
+                float(mean[feature]),
+                float(scale[feature]),
+            )
+            arrays["left"][i] = new_ids[left]
+            arrays["default_left"][i] = bool(tree["default_left"][node])
+        offset += len(tree["left_children"])
+
+    base_score = np.float32(learner["learner_model_param"]["base_score"])
+    base_margin = -np.log(np.float32(1) / base_score - np.float32(1))
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "n_features": int(learner["learner_model_param"]["num_feature"]),
+        "max_depth": max_depth,
+        "base_margin": float(np.float32(base_margin)),
+    }
+    return arrays, meta
+
+
+def save(path: str, arrays: dict[str, npt.NDArray[Any]], meta: dict[str, Any]) -> None:
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(f"{path}/{name}.npy", array)
+    with open(f"{path}/meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+@dataclass(frozen=True)
+class CompactModel:
+    feature: npt.NDArray[np.int32]
+    threshold: npt.NDArray[np.float32]
+    left: npt.NDArray[np.int32]
+    default_left: npt.NDArray[np.bool_]
+    value: npt.NDArray[np.float32]
+    roots: npt.NDArray[np.int32]
+    n_features: int
+    max_depth: int
+    base_margin: np.float32
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompactModel":
+        with open(f"{path}/meta.json") as f:
+            meta = json.load(f)
+        if meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact model format in {path}")
+        arrays = {
+            name: np.load(f"{path}/{name}.npy", mmap_mode="r" if mmap else None)
+            for name in _ARRAYS
+        }
+        return cls(
+            **arrays,
+            n_features=meta["n_features"],
+            max_depth=meta["max_depth"],
+            base_margin=np.float32(meta["base_margin"]),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (getattr(self, name) for name in _ARRAYS)
+        return sum(array.nbytes for array in arrays)
+
+    def split_values(self, feature: int) -> npt.NDArray[np.float32]:
+        """
+        Thresholds the trees compare raw ``feature`` values against, sorted
+        and distinct.
+        """
+        # Leaves have a NaN threshold
+        splits = self.threshold[self.feature == feature]
+        return np.unique(splits[~np.isnan(splits)])  # type: ignore[no-any-return]
+
+    def predict_margin(self, x_values: npt.NDArray[Any]) -> npt.NDArray[np.float32]:
+        x_values = np.ascontiguousarray(x_values, dtype=np.float32)
+        margin = np.empty(len(x_values), dtype=np.float32)
+        for start in range(0, len(x_values), _CHUNK_ROWS):
+            chunk = x_values[start : start + _CHUNK_ROWS]
+            margin[start : start + _CHUNK_ROWS] = self._predict_margin(chunk)
+        return margin
+
+    def _predict_margin(
+        self, x_values: npt.NDArray[np.float32]
+    ) -> npt.NDArray[np.float32]:
+        n_rows = len(x_values)
+        flat_x = x_values.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int32) * self.n_features)[:, None]
+        has_nan = bool(np.isnan(flat_x).any())
+        # Walk every (row, tree) pair down one level per step
+        node = np.repeat(self.roots[None, :], n_rows, axis=0)
+        for _ in range(self.max_depth):
+            x = flat_x[row_offsets + self.feature[node]]
+            go_right = x >= self.threshold[node]
+            if has_nan:
+                go_right = np.where(np.isnan(x), ~self.default_left[node], go_right)
+            node = self.left[node] + go_right
+        # Accumulate in tree order in float32, like xgboost does
+        leaves = np.empty((n_rows, len(self.roots) + 1), dtype=np.float32)
+        leaves[:, 0] = self.base_margin
+        leaves[:, 1:] = self.value[node]
+        margin: npt.NDArray[np.float32] = np.add.accumulate(
+            leaves, axis=1, dtype=np.float32
+        )[:, -1]
+        return margin
+
+    def predict(self, x_values: npt.NDArray[Any]) -> npt.NDArray[np.int64]:
+        margin = self.predict_margin(x_values)
+        probability = np.float32(1) / (np.float32(1) + np.exp(-margin))
+        return (probability > np.float32(0.5)).astype(np.int64)
+
+
+def convert_manifest(output_dir: str = COMPACT_DIR) -> None:
+    converted = set()
+    for spec in MANIFEST.values():
+        key = compact_key(spec)
+        if key in converted:
+            continue
+        model = load_artifact(spec.model_path, spec.model_sha256)
+        scaler = load_artifact(spec.scaler_path, spec.scaler_sha256)
+        arrays, meta = convert(model, scaler)
+        meta["model_sha256"] = spec.model_sha256
+        meta["scaler_sha256"] = spec.scaler_sha256
+        save(f"{output_dir}/{key}", arrays, meta)
+        converted.add(key)
+        logger.info("Converted %s to %s/%s", spec.name, output_dir, key)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output-dir", default=COMPACT_DIR)
+    args = parser.parse_args()
+    convert_manifest(args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Scoring of asynchronous prediction jobs, run by app/prediction_worker.py.
+
+Workers claim one pending chunk at a time with SELECT ... FOR UPDATE SKIP
+LOCKED, so any number of them can share the queue. The chunk row stays
+locked while it is scored, and its results, its deletion and the job's
+progress are committed in the same transaction: a worker dying midway
+leaves the chunk to be claimed again.
+"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, cast
+
+import numpy as np
+import psycopg
+from sqlalchemy import case, delete, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, col, select, update
+
+from app.core.config import settings
+from app.core.db import engine
+from app.mlmodel.mlconfig import FEATURES
+from app.mlmodel.prediction import PredictionService
+from app.mlmodel.registry import model_registry
+from app.mlmodel.reload import manifest_watcher
+from app.models import Functions, PredictionJob, PredictionJobChunk, PredictionJobResult
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def score_next_chunk(session: Session) -> bool:
+    """Claim, score and store one chunk, returns False when none is pending."""
+    claimed_at = datetime.now(timezone.utc)
+    statement = (
+        select(PredictionJobChunk, PredictionJob.model)
+        .join(PredictionJob)
+        .where(col(PredictionJob.status).in_(ACTIVE_STATUSES))
+        .order_by(col(PredictionJobChunk.id))
+        .limit(1)
+        .with_for_update(of=PredictionJobChunk, skip_locked=True)
+    )
+    claimed = session.exec(statement).first()
+    if claimed is None:
+        session.rollback()
+        return False
+    chunk, model = claimed
+    job_id = chunk.job_id
+
+    x_values = np.frombuffer(chunk.inputs, dtype=np.float32).reshape(
+        chunk.n_rows, len(FEATURES)
+    )
+    try:
+        predictions = PredictionService(model).predict_batch(x_values)
+    except Exception as e:
+        # Scoring is deterministic, retrying the chunk would fail again
+        logger.exception("Prediction job %s failed", job_id)
+        session.rollback()
+        fail_job(session, job_id, f"{type(e).__name__}: {e}"[:255])
+        return True
+
+    copy_results(session, job_id, chunk.first_row, predictions)
+    session.delete(chunk)
+    # Update the job row last, it is shared by every worker scoring this job
+    scored_rows = col(PredictionJob.scored_rows) + chunk.n_rows
+    completed = scored_rows >= col(PredictionJob.total_rows)
+    session.execute(
+        update(PredictionJob)
+        .where(col(PredictionJob.id) == job_id)
+        .values(
+            scored_rows=scored_rows,
+            status=case((completed, "completed"), else_="running"),
+            started_at=func.coalesce(col(PredictionJob.started_at), claimed_at),
+            finished_at=case((completed, datetime.now(timezone.utc)), else_=None),
+        )
+    )
+    session.commit()
+    return True
+
+
+def copy_results(
+    session: Session, job_id: int, first_row: int, predictions: list[int]
+) -> None:
+    """Bulk insert a chunk's results with COPY, in the session's transaction."""
+    connection = cast(
+        psycopg.Connection[Any], session.connection().connection.driver_connection
+    )
+    data = "".join(
+        f"{job_id}\t{first_row + i}\t{prediction}\n"
+        for i, prediction in enumerate(predictions)
+    )
+    with connection.cursor() as cursor:
+        with cursor.copy(
+            f"COPY {PredictionJobResult.__tablename__} (job_id, row, prediction) "
+            "FROM STDIN"
+        ) as copy:
+            copy.write(data)
+
+
+def fail_job(session: Session, job_id: int, error: str) -> None:
+    """Stop a job, dropping its pending chunks and refunding their rows."""
+    job = session.exec(
+        select(PredictionJob)
+        .where(col(PredictionJob.id) == job_id)
+        .where(col(PredictionJob.status).in_(ACTIVE_STATUSES))
+        .with_for_update()
+    ).first()
+    if job is None:
+        session.rollback()
+        return
+    session.execute(
+        delete(PredictionJobChunk).where(col(PredictionJobChunk.job_id) == job_id)
+    )
+    refund = job.credits * (job.total_rows - job.scored_rows) // job.total_rows
+    session.execute(
+        update(Functions)
+        .where(col(Functions.id) == job.owner_id)
+        .values(credits=col(Functions.credits) + refund)
+    )
+    job.status = "failed"
+    job.error = error
+    job.credits -= refund
+    job.finished_at = datetime.now(timezone.utc)
+    session.add(job)
+    session.commit()
+
+
+def run_worker(stop: threading.Event) -> None:
+    """Score pending chunks until ``stop`` is set, polling when idle."""
+    model_registry.preload(compact=settings.MODEL_FORMAT == "compact")
+    if manifest_watcher.interval:
+        manifest_watcher.start()
+    logger.info("Prediction worker started")
+    with Session(engine) as session:
+        while not stop.is_set():
+            try:
+                scored = score_next_chunk(session)
+            except (SQLAlchemyError, psycopg.Error):
+                logger.exception("Prediction worker database error")
+                session.rollback()
+                scored = False
+            if not scored:
+                stop.wait(settings.PREDICT_JOB_POLL_SECONDS)
+    manifest_watcher.stop()
+    logger.info("Prediction worker stopped")
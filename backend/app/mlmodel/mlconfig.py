@@ -1,14 +1,85 @@
+import hashlib
+import io
+import json
 import os
+from dataclasses import dataclass
 from typing import Any
 
 import joblib  # type: ignore
 
 this_dir: str = os.path.dirname(__file__)
 
+MANIFEST_PATH: str = f"{this_dir}/models/manifest.json"
+
+# Column order the scalers and models were fitted with
+FEATURES: tuple[str, ...] = (
+    "married",
+    "income",
+    "education",
+    "loan_amount",
+    "credit_history",
+)
+
+
+class ArtifactHashError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    name: str
+    model_path: str
+    model_sha256: str
+    scaler_path: str
+    scaler_sha256: str
+    input_schema: tuple[str, ...]
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict[str, ModelSpec]:
+    """
+    Read the model manifest, mapping each model name to its artifacts (paths
+    relative to the manifest), their content hashes and input schema.
+    """
+    models_dir = os.path.dirname(path)
+    with open(path) as f:
+        manifest = json.load(f)
+    specs = {}
+    for model_name, entry in manifest.items():
+        input_schema = tuple(entry["input_schema"])
+        if input_schema != FEATURES:
+            raise ValueError(f"Unsupported input schema for {model_name}")
+        specs[model_name] = ModelSpec(
+            name=model_name,
+            model_path=os.path.join(models_dir, entry["model"]),
+            model_sha256=entry["model_sha256"],
+            scaler_path=os.path.join(models_dir, entry["scaler"]),
+            scaler_sha256=entry["scaler_sha256"],
+            input_schema=input_schema,
+        )
+    return specs
+
+
+MANIFEST: dict[str, ModelSpec] = load_manifest()
+MODEL_NAMES: list[str] = list(MANIFEST)
+
+
+def load_artifact(path: str, sha256: str) -> Any:
+    """
+    Unpickle an artifact, refusing it when its content doesn't match the hash
+    recorded in the manifest.
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    if hashlib.sha256(content).hexdigest() != sha256:
+        raise ArtifactHashError(f"{path} doesn't match its manifest hash")
+    return joblib.load(io.BytesIO(content))
+
 
 def load_model(model_name: str) -> Any:
-    return joblib.load(f"{this_dir}/models/{model_name}.pkl")
+    spec = MANIFEST[model_name]
+    return load_artifact(spec.model_path, spec.model_sha256)
 
 
 def load_scaler(model_name: str) -> Any:
-    return joblib.load(f"{this_dir}/models/Scaler{model_name[-1]}.pkl")
+    spec = MANIFEST[model_name]
+    return load_artifact(spec.scaler_path, spec.scaler_sha256)
@@ -1,15 +1,61 @@
+from collections.abc import Sequence
+from typing import Any
+
 import numpy as np
+import numpy.typing as npt
+
+from app.core.config import settings
+from app.mlmodel.booster import BoosterPipeline
+from app.mlmodel.compact import CompactModel
+from app.mlmodel.mlconfig import FEATURES
+from app.mlmodel.registry import LoadedModel, model_registry
+from app.mlmodel.workers import inference_pool
+from app.models import InputColumns, InputData
+
+
+def rows_to_matrix(rows: Sequence[InputData]) -> npt.NDArray[np.float64]:
+    # Kept in float64 until scaled, like the scaler of the sklearn pipeline
+    x_values = np.empty((len(rows), len(FEATURES)), dtype=np.float64)
+    for i, row in enumerate(rows):
+        x_values[i] = (
+            row.married,
+            row.income,
+            row.education,
+            row.loan_amount,
+            row.credit_history,
+        )
+    return x_values
+
 
-from app.mlmodel.mlconfig import load_model, load_scaler
-from app.models import InputData
+def columns_to_matrix(columns: InputColumns) -> npt.NDArray[np.float64]:
+    n_rows = len(columns.married)
+    x_values = np.empty((n_rows, len(FEATURES)), dtype=np.float64)
+    for j, feature in enumerate(FEATURES):
+        x_values[:, j] = getattr(columns, feature)
+    return x_values
 
 
 class PredictionService:
     def __init__(self, model_name: str) -> None:
-        self.model = load_model(model_name)
-        self.scaler = load_scaler(model_name)  # Pass the model_name to load_scaler
+        self.model_name = model_name
+        # With inference worker processes the models live in those processes
+        self.pool = inference_pool if inference_pool.running else None
+        self.compact: CompactModel | None = None
+        self.loaded: LoadedModel | None = None
+        self.fast: BoosterPipeline | None = None
+        if self.pool is None and settings.MODEL_FORMAT == "compact":
+            self.compact = model_registry.get_compact(model_name)
+        elif self.pool is None:
+            self.loaded = model_registry.get(model_name)
+            self.model = self.loaded.model
+            self.scaler = self.loaded.scaler
+            self.fast = self.loaded.fast
 
     def predict(self, input_data: InputData) -> dict[str, int]:
+        if self.pool is not None or self.compact is not None or self.fast is not None:
+            predictions = self.predict_batch(rows_to_matrix([input_data]))
+            return {"prediction": predictions[0]}
+
         x_values = np.array(
             [
                 [
@@ -26,3 +72,50 @@ class PredictionService:
         prediction = self.model.predict(scaled_x_values)
 
         return {"prediction": int(prediction[0])}
+
+    def predict_batch(self, x_values: npt.NDArray[Any]) -> list[int]:
+        """
+        Score every row of a (n_rows, len(FEATURES)) matrix with a single
+        transform and predict call, keeping the input row order.
+        """
+        if self.pool is not None:
+            return self.pool.predict(self.model_name, x_values)
+
+        if self.compact is not None:
+            return self.compact.predict(x_values).tolist()  # type: ignore[no-any-return]
+
+        assert self.loaded is not None
+        return self.loaded.predict_batch(x_values)
+
+
+def predict_ensemble(
+    model_names: Sequence[str], x_values: npt.NDArray[Any]
+) -> dict[str, list[int]]:
+    """
+    Score the same rows with several models. Inputs are scaled once per
+    distinct scaler and each distinct model/scaler artifact pair predicts
+    once, so models whose manifest entries share artifacts cost one call.
+    """
+    predictions: dict[str, list[int]] = {}
+    by_artifacts: dict[tuple[str, str], list[int]] = {}
+    scaled: dict[tuple[str, bool], npt.NDArray[Any]] = {}
+    for model_name in model_names:
+        service = PredictionService(model_name)
+        if service.loaded is None:
+            # Worker processes and compact models scale internally
+            spec = model_registry.manifest[model_name]
+            key = (spec.model_sha256, spec.scaler_sha256)
+            if key not in by_artifacts:
+                by_artifacts[key] = service.predict_batch(x_values)
+            predictions[model_name] = by_artifacts[key]
+            continue
+        loaded = service.loaded
+        key = (loaded.spec.model_sha256, loaded.spec.scaler_sha256)
+        if key not in by_artifacts:
+            # The booster fast path returns float32, sklearn float64
+            scaler_key = (loaded.spec.scaler_sha256, loaded.fast is not None)
+            if scaler_key not in scaled:
+                scaled[scaler_key] = loaded.transform(x_values)
+            by_artifacts[key] = loaded.predict_scaled(scaled[scaler_key])
+        predictions[model_name] = by_artifacts[key]
+    return predictions
@@ -0,0 +1,368 @@
+"""
+Append-only log of scored predictions: who called which model, when, with
+what input and what result.
+
+Request handlers only append to an in-memory buffer. A background thread
+writes it to the PredictionLog table with COPY every ``flush_seconds``, or
+as soon as ``flush_rows`` rows are waiting. The buffer holds at most
+``max_rows`` rows, past that rows are dropped and counted (the newest or the
+oldest, per ``overflow``), so a slow or unavailable database never holds up
+predictions nor grows the worker's memory.
+
+The table is partitioned by day (UTC). The same thread creates the
+partitions of the coming days and drops those older than
+``retention_days``, which is cheap compared to deleting their rows.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Literal, cast
+
+import numpy as np
+import numpy.typing as npt
+import psycopg
+from sqlalchemy import text
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import PredictionLog
+
+logger = logging.getLogger(__name__)
+
+# Partitions are created this many days ahead of the current day
+PARTITIONS_AHEAD = 2
+MAINTENANCE_SECONDS = 3600.0
+
+# Errors of rows the database won't store, failing again when retried
+_REJECTED = (
+    psycopg.DataError,
+    psycopg.IntegrityError,
+    DataError,
+    IntegrityError,
+)
+
+_PARTITION_NAME = re.compile(rf"{PredictionLog.__tablename__}_p(\d{{8}})")
+
+
+@dataclass
+class _Batch:
+    user_id: int | None
+    model_name: str
+    created_at: datetime
+    # Stored as REAL
+    x_values: npt.NDArray[np.float32]
+    predictions: list[int]
+
+
+def partition_name(day: date) -> str:
+    return f"{PredictionLog.__tablename__}_p{day:%Y%m%d}"
+
+
+class PredictionLogger:
+    def __init__(
+        self,
+        *,
+        enabled: bool,
+        flush_seconds: float,
+        flush_rows: int,
+        max_rows: int,
+        overflow: Literal["drop_newest", "drop_oldest"],
+        retention_days: int,
+    ) -> None:
+        self.enabled = enabled
+        self.flush_seconds = flush_seconds
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self.overflow = overflow
+        self.retention_days = retention_days
+        self._batches: deque[_Batch] = deque()
+        self._rows = 0
+        self._lock = threading.Lock()
+        # Serializes flushes, the buffer is swapped out under _lock only
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.written_rows = 0
+        self.dropped_rows = 0
+        # Rows the database refused to store
+        self.rejected_rows = 0
+        self.flushes = 0
+        self.last_error: str | None = None
+
+    def log(
+        self,
+        user_id: int | None,
+        model_name: str,
+        x_values: npt.NDArray[Any],
+        predictions: list[int],
+    ) -> None:
+        """Buffer the predictions of one call, never blocks on the database."""
+        # Values past the range of REAL are logged as infinite rather than
+        # failing the COPY of every row written with them
+        with np.errstate(over="ignore"):
+            x_values = x_values.astype(np.float32)
+        batch = _Batch(
+            user_id, model_name, datetime.now(timezone.utc), x_values, predictions
+        )
+        with self._lock:
+            self._batches.append(batch)
+            self._rows += len(predictions)
+            self._trim()
+            if self._rows >= self.flush_rows:
+                self._wake.set()
+
+    def _trim(self) -> None:
+        while self._rows > self.max_rows:
+            if self.overflow == "drop_oldest":
+                dropped = self._batches.popleft()
+            else:
+                dropped = self._batches.pop()
+            self._rows -= len(dropped.predictions)
+            self.dropped_rows += len(dropped.predictions)
+
+    def flush(self) -> int:
+        """
+        Write the buffered rows with one COPY, returns how many. When the
+        database rejects some of them (rather than being unavailable), the
+        calls are written one at a time and those rejected again dropped.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batches = list(self._batches)
+                rows = self._rows
+                self._batches.clear()
+                self._rows = 0
+                self._wake.clear()
+            if not batches:
+                return 0
+            try:
+                self._copy(batches)
+            except _REJECTED:
+                logger.warning("Prediction log rows rejected, writing them apart")
+                return self._copy_each(batches)
+            except (SQLAlchemyError, psycopg.Error):
+                self._put_back(batches)
+                raise
+            self.written_rows += rows
+            self.flushes += 1
+            return rows
+
+    def _copy_each(self, batches: list[_Batch]) -> int:
+        written = 0
+        for index, batch in enumerate(batches):
+            try:
+                self._copy([batch])
+            except _REJECTED:
+                self.rejected_rows += len(batch.predictions)
+                logger.exception(
+                    "Dropped %d prediction log rows of %s",
+                    len(batch.predictions),
+                    batch.model_name,
+                )
+            except (SQLAlchemyError, psycopg.Error):
+                self.written_rows += written
+                self._put_back(batches[index:])
+                raise
+            else:
+                written += len(batch.predictions)
+        self.written_rows += written
+        self.flushes += 1
+        return written
+
+    @staticmethod
+    def _copy(batches: list[_Batch]) -> None:
+        with Session(engine) as session:
+            copy_batches(session, batches)
+            session.commit()
+
+    def _put_back(self, batches: list[_Batch]) -> None:
+        # Retried with the next flush, as far as the buffer allows
+        with self._lock:
+            self._batches.extendleft(reversed(batches))
+            self._rows += sum(len(batch.predictions) for batch in batches)
+            self._trim()
+
+    def maintain_partitions(self, today: date | None = None) -> None:
+        """
+        Create the partitions of today and the next days, and drop those
+        past the retention period.
+        """
+        today = today or datetime.now(timezone.utc).date()
+        # Separate transactions, so a drop that times out doesn't hold back
+        # the new partitions
+        self._create_partitions(today)
+        if self.retention_days:
+            self._drop_partitions(today - timedelta(days=self.retention_days))
+
+    @staticmethod
+    def _lock_partitions(session: Session) -> None:
+        # Every worker runs the maintenance, creating a partition isn't
+        # idempotent under concurrency
+        session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:table))"),
+            {"table": PredictionLog.__tablename__},
+        )
+        # Changing partitions waits for the queries reading the table, give
+        # up until the next run rather than queueing writes behind
+        session.execute(text("SET LOCAL lock_timeout = '5s'"))
+
+    def _create_partitions(self, today: date) -> None:
+        table = PredictionLog.__tablename__
+        with Session(engine) as session:
+            self._lock_partitions(session)
+            partitions = set(self.partitions(session))
+            for days in range(PARTITIONS_AHEAD + 1):
+                day = today + timedelta(days=days)
+                name = partition_name(day)
+                if name in partitions:
+                    continue
+                start = datetime.combine(day, datetime.min.time(), timezone.utc)
+                end = start + timedelta(days=1)
+                # The day's rows already in the default partition (written
+                # while the partition was missing) would fail attaching it
+                session.execute(text(f"CREATE TABLE {name} (LIKE {table})"))
+                moved = session.execute(
+                    text(
+                        f"WITH moved AS (DELETE FROM {table}_default "
+                        "WHERE created_at >= :start AND created_at < :end "
+                        f"RETURNING *), inserted AS (INSERT INTO {name} "
+                        "SELECT * FROM moved RETURNING 1) "
+                        "SELECT count(*) FROM inserted"
+                    ),
+                    {"start": start, "end": end},
+                ).scalar_one()
+                session.execute(
+                    text(
+                        f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                        f"FOR VALUES FROM ('{start.isoformat()}') "
+                        f"TO ('{end.isoformat()}')"
+                    )
+                )
+                if moved:
+                    logger.info(
+                        "Moved %d prediction log rows to partition %s", moved, name
+                    )
+            session.commit()
+
+    def _drop_partitions(self, oldest: date) -> None:
+        table = PredictionLog.__tablename__
+        with Session(engine) as session:
+            self._lock_partitions(session)
+            for name in self.partitions(session):
+                match = _PARTITION_NAME.fullmatch(name)
+                if match is None:
+                    continue
+                day = datetime.strptime(match.group(1), "%Y%m%d").date()
+                if day < oldest:
+                    session.execute(text(f"DROP TABLE {name}"))
+                    logger.info("Dropped prediction log partition %s", name)
+            # Rows that missed the daily partitions
+            session.execute(
+                text(f"DELETE FROM {table}_default WHERE created_at < :oldest"),
+                {"oldest": datetime.combine(oldest, datetime.min.time(), timezone.utc)},
+            )
+            session.commit()
+
+    @staticmethod
+    def partitions(session: Session) -> list[str]:
+        return list(
+            session.execute(
+                text(
+                    "SELECT child.relname FROM pg_inherits "
+                    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                    "WHERE pg_inherits.inhparent = CAST(:table AS regclass) "
+                    "ORDER BY child.relname"
+                ),
+                {"table": PredictionLog.__tablename__},
+            ).scalars()
+        )
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="prediction-log", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write what is still buffered."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except (SQLAlchemyError, psycopg.Error):
+            logger.exception("Could not write the prediction log")
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "buffered_rows": self._rows,
+            "written_rows": self.written_rows,
+            "dropped_rows": self.dropped_rows,
+            "rejected_rows": self.rejected_rows,
+            "flushes": self.flushes,
+            "last_error": self.last_error,
+        }
+
+    def _run(self) -> None:
+        maintained_at = -MAINTENANCE_SECONDS
+        while not self._stop.is_set():
+            if time.monotonic() - maintained_at >= MAINTENANCE_SECONDS:
+                try:
+                    self.maintain_partitions()
+                    maintained_at = time.monotonic()
+                except SQLAlchemyError as e:
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    logger.exception("Could not maintain the prediction log")
+            self._wake.wait(self.flush_seconds)
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+                self.last_error = None
+            except (SQLAlchemyError, psycopg.Error) as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.exception("Could not write the prediction log")
+
+
+def copy_batches(session: Session, batches: list[_Batch]) -> None:
+    """Bulk insert log rows with COPY, in the session's transaction."""
+    connection = cast(
+        psycopg.Connection[Any], session.connection().connection.driver_connection
+    )
+    lines = []
+    for batch in batches:
+        prefix = f"{batch.created_at.isoformat()}\t{batch.user_id}\t{batch.model_name}"
+        for row, prediction in zip(
+            batch.x_values.tolist(), batch.predictions, strict=True
+        ):
+            inputs = ",".join(map(str, row))
+            lines.append(f"{prefix}\t{{{inputs}}}\t{prediction}\n")
+    with connection.cursor() as cursor:
+        with cursor.copy(
+            f"COPY {PredictionLog.__tablename__} "
+            "(created_at, user_id, model, inputs, prediction) FROM STDIN"
+        ) as copy:
+            copy.write("".join(lines))
+
+
+prediction_log = PredictionLogger(
+    enabled=settings.PREDICTION_LOG,
+    flush_seconds=settings.PREDICTION_LOG_FLUSH_SECONDS,
+    flush_rows=settings.PREDICTION_LOG_FLUSH_ROWS,
+    max_rows=settings.PREDICTION_LOG_MAX_ROWS,
+    overflow=settings.PREDICTION_LOG_OVERFLOW,
+    retention_days=settings.PREDICTION_LOG_RETENTION_DAYS,
+)
@@ -0,0 +1,283 @@
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from app.core.config import settings
+from app.mlmodel.booster import BoosterPipeline
+from app.mlmodel.compact import CompactModel, compact_key, compact_path
+from app.mlmodel.mlconfig import MANIFEST, MODEL_NAMES, ModelSpec, load_artifact
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    """A model/scaler pair shared by every request served by this worker.
+
+    Instances are handed out to concurrent requests, treat them as read-only.
+    """
+
+    name: str
+    model: Any
+    scaler: Any
+    spec: ModelSpec
+    # Direct booster scoring path, None for unsupported model types
+    fast: BoosterPipeline | None = None
+
+    def predict_batch(self, x_values: npt.NDArray[Any]) -> list[int]:
+        return self.predict_scaled(self.transform(x_values))
+
+    def transform(self, x_values: npt.NDArray[Any]) -> npt.NDArray[Any]:
+        """Scale the inputs, the result can be shared by every model whose
+        spec has the same ``scaler_sha256``."""
+        if self.fast is not None:
+            return self.fast.transform(x_values)
+        # In float64 whatever the input, float32 is rounded after each step
+        return self.scaler.transform(  # type: ignore[no-any-return]
+            np.asarray(x_values, dtype=np.float64)
+        )
+
+    def predict_scaled(self, scaled_x_values: npt.NDArray[Any]) -> list[int]:
+        if self.fast is not None:
+            return self.fast.predict_scaled(scaled_x_values).tolist()  # type: ignore[no-any-return]
+        predictions = self.model.predict(scaled_x_values)
+        return [int(prediction) for prediction in predictions]
+
+
+@dataclass(frozen=True)
+class _Artifact:
+    value: Any
+    size_bytes: int
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded model/scaler pairs.
+
+    Each pair is unpickled once per worker and reused by every request.
+    Artifacts are keyed on their content hash, so models whose manifest
+    entries point to byte-identical files share a single loaded instance.
+    When ``max_bytes`` is set, the least recently used pairs are evicted once
+    the distinct artifacts held in memory exceed the budget (the pair being
+    requested is never evicted).
+    """
+
+    def __init__(
+        self, max_bytes: int = 0, manifest: dict[str, ModelSpec] | None = None
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.manifest = MANIFEST if manifest is None else manifest
+        self._models: OrderedDict[str, LoadedModel] = OrderedDict()
+        self._artifacts: dict[str, _Artifact] = {}
+        self._compact: dict[str, CompactModel] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, model_name: str) -> bool:
+        return model_name in self._models
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    @property
+    def loaded_bytes(self) -> int:
+        return sum(artifact.size_bytes for artifact in self._artifacts.values())
+
+    def get(self, model_name: str) -> LoadedModel:
+        loaded = self._models.get(model_name)
+        if loaded is not None:
+            with self._lock:
+                if model_name in self._models:
+                    self._models.move_to_end(model_name)
+            return loaded
+        with self._lock:
+            # Another thread may have loaded it while we waited for the lock
+            loaded = self._models.get(model_name)
+            if loaded is None:
+                loaded = self._load(model_name)
+                self._models[model_name] = loaded
+                self._evict_over_budget()
+            return loaded
+
+    def get_compact(self, model_name: str) -> CompactModel:
+        """
+        Memory-mapped compact form of a model (see app.mlmodel.compact), shared
+        by every model converted from the same artifacts.
+        """
+        spec = self.manifest[model_name]
+        key = compact_key(spec)
+        compact = self._compact.get(key)
+        if compact is None:
+            with self._lock:
+                compact = self._compact.get(key)
+                if compact is None:
+                    logger.info("Loading compact model %s", model_name)
+                    compact = CompactModel.load(compact_path(spec))
+                    self._compact[key] = compact
+        return compact
+
+    def preload(
+        self, model_names: Iterable[str] = MODEL_NAMES, compact: bool = False
+    ) -> None:
+        for model_name in model_names:
+            if compact:
+                self.get_compact(model_name)
+            else:
+                self.get(model_name)
+
+    def reload(
+        self,
+        manifest: dict[str, ModelSpec],
+        validate: Callable[[str, Callable[[Any], Any]], None] | None = None,
+        compact: bool = False,
+        load: bool = True,
+    ) -> list[str]:
+        """
+        Switch to a new manifest, returns the names of the models it changed.
+
+        Changed models are loaded and passed to ``validate`` (with their
+        batch predict function) in the calling thread while the current ones
+        keep serving, then all of them are swapped in at once. Requests that
+        already hold a previous model finish with it, it is released with
+        their last reference.
+
+        With ``load`` False only the manifest is switched, and the changed
+        models dropped, for a process whose models are served by others.
+        """
+        if {name: spec.input_schema for name, spec in manifest.items()} != {
+            name: spec.input_schema for name, spec in self.manifest.items()
+        }:
+            raise ValueError("Adding or removing models needs a restart")
+        changed = [
+            name for name, spec in manifest.items() if spec != self.manifest[name]
+        ]
+        if not load:
+            with self._lock:
+                self.manifest = manifest
+                for model_name in changed:
+                    self._models.pop(model_name, None)
+                self._release_unused_artifacts()
+                self._compact.clear()
+            return changed
+        staged_artifacts: dict[str, _Artifact] = {}
+        staged_models: dict[str, LoadedModel] = {}
+        staged_compact: dict[str, CompactModel] = {}
+        for model_name in changed:
+            spec = manifest[model_name]
+            if compact:
+                key = compact_key(spec)
+                compact_model = staged_compact.get(key) or self._compact.get(key)
+                if compact_model is None:
+                    compact_model = CompactModel.load(compact_path(spec))
+                staged_compact[key] = compact_model
+                if validate is not None:
+                    validate(model_name, compact_model.predict)
+                continue
+            model = self._staged_artifact(
+                spec.model_path, spec.model_sha256, staged_artifacts
+            )
+            scaler = self._staged_artifact(
+                spec.scaler_path, spec.scaler_sha256, staged_artifacts
+            )
+            loaded = LoadedModel(
+                name=model_name,
+                model=model,
+                scaler=scaler,
+                spec=spec,
+                fast=BoosterPipeline.from_pipeline(model, scaler),
+            )
+            if validate is not None:
+                validate(model_name, loaded.predict_batch)
+            staged_models[model_name] = loaded
+
+        with self._lock:
+            self.manifest = manifest
+            self._artifacts.update(staged_artifacts)
+            for model_name, loaded in staged_models.items():
+                previous = self._models.get(model_name)
+                if previous is not None:
+                    weakref.finalize(
+                        previous, logger.info, "Released previous %s", model_name
+                    )
+                self._models[model_name] = loaded
+            self._release_unused_artifacts()
+            self._evict_over_budget()
+            self._compact.update(staged_compact)
+            in_use = {compact_key(spec) for spec in manifest.values()}
+            for key in list(self._compact):
+                if key not in in_use:
+                    del self._compact[key]
+        if changed:
+            logger.info("Reloaded models %s", ", ".join(changed))
+        return changed
+
+    def evict(self, model_name: str) -> None:
+        with self._lock:
+            self._models.pop(model_name, None)
+            self._release_unused_artifacts()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._artifacts.clear()
+            self._compact.clear()
+
+    def _load(self, model_name: str) -> LoadedModel:
+        spec = self.manifest[model_name]
+        model = self._artifact(spec.model_path, spec.model_sha256)
+        scaler = self._artifact(spec.scaler_path, spec.scaler_sha256)
+        return LoadedModel(
+            name=model_name,
+            model=model,
+            scaler=scaler,
+            spec=spec,
+            fast=BoosterPipeline.from_pipeline(model, scaler),
+        )
+
+    def _artifact(self, path: str, sha256: str) -> Any:
+        artifact = self._artifacts.get(sha256)
+        if artifact is None:
+            logger.info("Loading model artifact %s", path)
+            artifact = _Artifact(
+                value=load_artifact(path, sha256), size_bytes=os.path.getsize(path)
+            )
+            self._artifacts[sha256] = artifact
+        return artifact.value
+
+    def _staged_artifact(
+        self, path: str, sha256: str, staged: dict[str, _Artifact]
+    ) -> Any:
+        artifact = staged.get(sha256) or self._artifacts.get(sha256)
+        if artifact is None:
+            logger.info("Loading model artifact %s", path)
+            artifact = _Artifact(
+                value=load_artifact(path, sha256), size_bytes=os.path.getsize(path)
+            )
+        staged[sha256] = artifact
+        return artifact.value
+
+    def _release_unused_artifacts(self) -> None:
+        in_use = set()
+        for loaded in self._models.values():
+            in_use.add(loaded.spec.model_sha256)
+            in_use.add(loaded.spec.scaler_sha256)
+        for sha256 in list(self._artifacts):
+            if sha256 not in in_use:
+                del self._artifacts[sha256]
+
+    def _evict_over_budget(self) -> None:
+        if not self.max_bytes:
+            return
+        while len(self._models) > 1 and self.loaded_bytes > self.max_bytes:
+            model_name, _ = self._models.popitem(last=False)
+            self._release_unused_artifacts()
+            logger.info("Evicted model %s from the registry", model_name)
+
+
+model_registry = ModelRegistry(max_bytes=settings.MODEL_REGISTRY_MAX_BYTES)
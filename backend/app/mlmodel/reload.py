@@ -0,0 +1,202 @@
+"""
+Hot reload of the models listed in the manifest.
+
+Every process serving predictions (API workers, inference worker processes,
+prediction job workers) runs a ManifestWatcher, which notices changes to the
+manifest or the golden set and reloads its registry: ship new artifacts,
+then update ``manifest.json`` (and the golden expectations, regenerated with
+``python -m app.mlmodel.reload``). A model whose golden predictions don't
+match is refused and the previous one keeps serving. API workers scoring in
+inference processes (INFERENCE_PROCESSES) only follow the manifest, the
+inference processes load and check the models.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import threading
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from app.core.config import settings
+from app.mlmodel.mlconfig import MANIFEST_PATH, load_manifest, this_dir
+from app.mlmodel.registry import ModelRegistry, model_registry
+
+logger = logging.getLogger(__name__)
+
+GOLDEN_PATH: str = f"{this_dir}/models/golden.json"
+
+
+class ModelValidationError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class GoldenSet:
+    """Inputs every model must score, and the predictions expected per model."""
+
+    inputs: npt.NDArray[np.float32]
+    expected: dict[str, list[int]]
+
+    @classmethod
+    def load(cls, path: str = GOLDEN_PATH) -> "GoldenSet":
+        with open(path) as f:
+            golden = json.load(f)
+        return cls(
+            inputs=np.array(golden["inputs"], dtype=np.float32),
+            expected=golden["expected"],
+        )
+
+    def validate(
+        self, model_name: str, predict: Callable[[Any], Sequence[int]]
+    ) -> None:
+        predictions = [int(prediction) for prediction in predict(self.inputs)]
+        if len(predictions) != len(self.inputs) or not set(predictions) <= {0, 1}:
+            raise ModelValidationError(f"{model_name} returned invalid predictions")
+        expected = self.expected.get(model_name)
+        if expected is not None and predictions != expected:
+            mismatches = sum(a != b for a, b in zip(predictions, expected, strict=True))
+            raise ModelValidationError(
+                f"{model_name} differs from its golden predictions on "
+                f"{mismatches} of {len(expected)} inputs"
+            )
+
+
+class ManifestWatcher:
+    """
+    Background thread reloading a registry when the manifest or golden set
+    files change, checked every ``interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        interval: float,
+        manifest_path: str = MANIFEST_PATH,
+        golden_path: str = GOLDEN_PATH,
+    ) -> None:
+        self.registry = registry
+        self.interval = interval
+        self.manifest_path = manifest_path
+        self.golden_path = golden_path
+        # False in a process whose models are loaded by others
+        self.load_models = True
+        self.reloads = 0
+        self.last_reload_at: datetime | None = None
+        self.last_error: str | None = None
+        self._digest = ""
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self, load_models: bool = True) -> None:
+        if self._thread is not None:
+            return
+        self.load_models = load_models
+        self._digest = self._files_digest()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="manifest-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self) -> list[str]:
+        """Reload when the files changed since the last check."""
+        digest = self._files_digest()
+        if digest == self._digest:
+            return []
+        # Remember failed attempts too, they are retried once the files change
+        self._digest = digest
+        try:
+            if self.load_models:
+                changed = self.registry.reload(
+                    load_manifest(self.manifest_path),
+                    GoldenSet.load(self.golden_path).validate,
+                    compact=settings.MODEL_FORMAT == "compact",
+                )
+            else:
+                changed = self.registry.reload(
+                    load_manifest(self.manifest_path), load=False
+                )
+        except Exception as e:
+            logger.exception("Model reload failed, keeping the current models")
+            self.last_error = f"{type(e).__name__}: {e}"
+            return []
+        self.reloads += 1
+        self.last_reload_at = datetime.now(timezone.utc)
+        self.last_error = None
+        return changed
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "reloads": self.reloads,
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error,
+            "models": {
+                name: spec.model_sha256 for name, spec in self.registry.manifest.items()
+            },
+        }
+
+    def _files_digest(self) -> str:
+        digest = hashlib.sha256()
+        for path in (self.manifest_path, self.golden_path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except OSError:
+                # Files being replaced, try again on the next tick
+                logger.warning("Could not read the model manifest", exc_info=True)
+
+
+manifest_watcher = ManifestWatcher(
+    model_registry, interval=settings.MODEL_RELOAD_INTERVAL
+)
+
+
+def write_golden(path: str = GOLDEN_PATH) -> None:
+    """Record the current models' predictions on the golden inputs."""
+    golden = GoldenSet.load(path)
+    registry = ModelRegistry(manifest=load_manifest())
+    expected = {
+        model_name: registry.get(model_name).predict_batch(golden.inputs)
+        for model_name in registry.manifest
+    }
+    # One input row or model per line, so that diffs stay readable
+    inputs = ",\n".join(f"    {json.dumps(row)}" for row in golden.inputs.tolist())
+    predictions = ",\n".join(
+        f"    {json.dumps(name)}: {json.dumps(values)}"
+        for name, values in expected.items()
+    )
+    with open(path, "w") as f:
+        f.write(f'{{\n  "inputs": [\n{inputs}\n  ],\n')
+        f.write(f'  "expected": {{\n{predictions}\n  }}\n}}\n')
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Regenerate the golden predictions for the manifest's models"
+    )
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    args = parser.parse_args()
+    write_golden(args.golden)
+
+
+if __name__ == "__main__":
+    main()
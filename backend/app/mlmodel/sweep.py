@@ -0,0 +1,123 @@
+"""
+What-if sweeps: a base input scored over a grid of one or two features.
+
+Tree models only compare each feature against a fixed set of thresholds, so
+grid values falling between the same two thresholds are scored once, then
+the predictions are expanded back to the whole grid. The result is
+summarized as runs of equal predictions along the last swept feature, so
+the response size follows the number of decision boundaries rather than
+the number of grid points.
+"""
+
+from collections.abc import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from app.mlmodel.mlconfig import FEATURES
+from app.mlmodel.prediction import PredictionService, rows_to_matrix
+from app.models import InputData, SweepAxis, SweepRow, SweepRun
+
+
+def axis_values(axis: SweepAxis) -> npt.NDArray[np.float64]:
+    if axis.values is not None:
+        return np.asarray(axis.values, dtype=np.float64)
+    assert axis.start is not None and axis.stop is not None and axis.num is not None
+    return np.linspace(axis.start, axis.stop, axis.num)
+
+
+def grid_matrix(
+    base: InputData,
+    features: Sequence[str],
+    values: Sequence[npt.NDArray[np.float64]],
+) -> npt.NDArray[np.float64]:
+    """
+    The base input repeated once per grid point, with the swept features
+    set to the grid values. The last feature varies fastest.
+    """
+    grids = np.meshgrid(*values, indexing="ij")
+    x_values = np.repeat(rows_to_matrix([base]), grids[0].size, axis=0)
+    for feature, grid in zip(features, grids, strict=True):
+        x_values[:, FEATURES.index(feature)] = grid.ravel()
+    return x_values
+
+
+def decision_bins(
+    service: PredictionService, feature: str, values: npt.NDArray[np.float64]
+) -> npt.NDArray[np.intp] | None:
+    """
+    Index of the interval between the model's thresholds on ``feature`` each
+    value falls in, values in the same interval get the same prediction. None
+    when the thresholds aren't known (sklearn models, inference processes).
+    """
+    j = FEATURES.index(feature)
+    if service.fast is not None:
+        x_values = np.zeros((len(values), len(FEATURES)), dtype=np.float64)
+        x_values[:, j] = values
+        scaled = service.fast.transform(x_values)[:, j]
+        return np.searchsorted(service.fast.split_values(j), scaled, side="right")
+    if service.compact is not None:
+        x = values.astype(np.float32)
+        return np.searchsorted(service.compact.split_values(j), x, side="right")
+    return None
+
+
+def decision_runs(
+    predictions: npt.NDArray[np.int64], last_values: npt.NDArray[np.float64]
+) -> list[list[SweepRun]]:
+    """
+    Run-length encode a (n_rows, n_values) prediction grid along its last
+    axis, one list of runs per row.
+    """
+    starts = np.ones(predictions.shape, dtype=bool)
+    starts[:, 1:] = predictions[:, 1:] != predictions[:, :-1]
+    ends = np.ones(predictions.shape, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    start_rows, start_columns = np.nonzero(starts)
+    _, end_columns = np.nonzero(ends)
+    runs: list[list[SweepRun]] = [[] for _ in range(len(predictions))]
+    for row, start, end in zip(
+        start_rows.tolist(), start_columns.tolist(), end_columns.tolist(), strict=True
+    ):
+        runs[row].append(
+            SweepRun(
+                start=float(last_values[start]),
+                stop=float(last_values[end]),
+                prediction=int(predictions[row, start]),
+            )
+        )
+    return runs
+
+
+def sweep(
+    model_name: str, base: InputData, axes: Sequence[SweepAxis]
+) -> list[SweepRow]:
+    """Score the grid with one batch predict and summarize the surface."""
+    service = PredictionService(model_name)
+    features = [axis.feature for axis in axes]
+    values = [axis_values(axis) for axis in axes]
+    # One representative value per threshold interval of each feature, and
+    # the representative standing for each grid value
+    representatives = []
+    inverses = []
+    for feature, axis in zip(features, values, strict=True):
+        bins = decision_bins(service, feature, axis)
+        if bins is None:
+            representatives.append(axis)
+            inverses.append(np.arange(len(axis)))
+            continue
+        _, first, inverse = np.unique(bins, return_index=True, return_inverse=True)
+        representatives.append(axis[first])
+        inverses.append(inverse)
+
+    x_values = grid_matrix(base, features, representatives)
+    predictions = np.asarray(service.predict_batch(x_values), dtype=np.int64)
+    predictions = predictions.reshape([len(axis) for axis in representatives])
+    grid = predictions[np.ix_(*inverses)].reshape(-1, len(values[-1]))
+    runs = decision_runs(grid, values[-1])
+    if len(axes) == 1:
+        return [SweepRow(runs=runs[0])]
+    return [
+        SweepRow(value=value, runs=row_runs)
+        for value, row_runs in zip(values[0].tolist(), runs, strict=True)
+    ]
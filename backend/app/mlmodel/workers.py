@@ -0,0 +1,271 @@
+import logging
+import multiprocessing
+import queue
+import struct
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from app.core.config import settings
+from app.mlmodel.mlconfig import FEATURES, MODEL_NAMES
+
+logger = logging.getLogger(__name__)
+
+N_FEATURES = len(FEATURES)
+# Control messages are fixed-size structs, row data never goes through the pipe
+_REQUEST = struct.Struct("<iii")  # slot, model index, number of rows
+_RESPONSE = struct.Struct("<ii")  # slot, status
+_OK = 0
+_FAILED = 1
+
+
+class InferenceWorkerError(Exception):
+    pass
+
+
+def _slot_arrays(
+    buf: memoryview, slots: int, max_rows: int
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.int32]]:
+    # float64 inputs, scaled before they are rounded to float32
+    inputs: npt.NDArray[np.float64] = np.ndarray(
+        (slots, max_rows, N_FEATURES), dtype=np.float64, buffer=buf
+    )
+    outputs: npt.NDArray[np.int32] = np.ndarray(
+        (slots, max_rows), dtype=np.int32, buffer=buf, offset=inputs.nbytes
+    )
+    return inputs, outputs
+
+
+def _worker_main(shm_name: str, slots: int, max_rows: int, conn: Connection) -> None:
+    # Imported here, the parent process imports this module from prediction
+    from app.mlmodel.prediction import PredictionService
+    from app.mlmodel.registry import model_registry
+    from app.mlmodel.reload import manifest_watcher
+
+    logging.basicConfig(level=logging.INFO)
+    shm = SharedMemory(name=shm_name)
+    inputs, outputs = _slot_arrays(shm.buf, slots, max_rows)
+    model_registry.preload(compact=settings.MODEL_FORMAT == "compact")
+    if manifest_watcher.interval:
+        manifest_watcher.start()
+    try:
+        while True:
+            message = conn.recv_bytes()
+            if not message:
+                break
+            slot, model_index, n_rows = _REQUEST.unpack(message)
+            status = _OK
+            try:
+                # A new service per request picks up reloaded models
+                service = PredictionService(MODEL_NAMES[model_index])
+                outputs[slot, :n_rows] = service.predict_batch(inputs[slot, :n_rows])
+            except Exception:
+                logger.exception("Inference failed in worker process")
+                status = _FAILED
+            conn.send_bytes(_RESPONSE.pack(slot, status))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del inputs, outputs
+        shm.close()
+
+
+@dataclass
+class _Worker:
+    index: int
+    process: BaseProcess
+    conn: Connection
+    shm: SharedMemory
+    inputs: npt.NDArray[np.float64]
+    outputs: npt.NDArray[np.int32]
+    send_lock: threading.Lock = field(default_factory=threading.Lock)
+    pending: dict[int, "Future[int]"] = field(default_factory=dict)
+    reader: threading.Thread | None = None
+    # Set once the process is gone, under send_lock
+    exited: bool = False
+
+
+class InferenceProcessPool:
+    """
+    Long-lived inference processes fed through shared memory.
+
+    Every process loads the models once and owns a ring of ``slots``
+    preallocated input/output buffers of ``max_rows`` rows in shared memory.
+    A caller claims a free slot, writes its rows in place and only sends the
+    slot number through the pipe, then reads the predictions back from the
+    same slot, so no row data is pickled.
+
+    A slot whose caller timed out returns to the ring once the late response
+    arrives, and a process that exits is respawned on the same buffers, its
+    slots returning to the ring.
+    """
+
+    def __init__(self, *, processes: int, slots: int, max_rows: int) -> None:
+        self.processes = processes
+        self.slots = slots
+        self.max_rows = max_rows
+        self.respawns = 0
+        self._workers: list[_Worker] = []
+        self._free_slots: queue.Queue[tuple[int, int]] = queue.Queue()
+        # Guards respawning against stop
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        self._running = True
+        slot_bytes = self.max_rows * (N_FEATURES * 8 + 4)
+        for index in range(self.processes):
+            shm = SharedMemory(create=True, size=self.slots * slot_bytes)
+            self._workers.append(self._spawn(index, shm))
+        # Interleave workers so consecutive requests go to different processes
+        for slot in range(self.slots):
+            for index in range(self.processes):
+                self._free_slots.put((index, slot))
+
+    def stop(self) -> None:
+        with self._lock:
+            self._running = False
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            with worker.send_lock:
+                try:
+                    worker.conn.send_bytes(b"")
+                except OSError:
+                    pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            if worker.reader:
+                worker.reader.join(timeout=5)
+            worker.conn.close()
+            del worker.inputs, worker.outputs
+            worker.shm.close()
+            worker.shm.unlink()
+        self._free_slots = queue.Queue()
+
+    def predict(self, model_name: str, x_values: npt.NDArray[Any]) -> list[int]:
+        model_index = MODEL_NAMES.index(model_name)
+        predictions: list[int] = []
+        for start in range(0, len(x_values), self.max_rows):
+            chunk = x_values[start : start + self.max_rows]
+            predictions.extend(self._predict_chunk(model_index, chunk))
+        return predictions
+
+    def _spawn(self, index: int, shm: SharedMemory) -> _Worker:
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=_worker_main,
+            args=(shm.name, self.slots, self.max_rows, child_conn),
+            name=f"inference-{index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        inputs, outputs = _slot_arrays(shm.buf, self.slots, self.max_rows)
+        worker = _Worker(
+            index=index,
+            process=process,
+            conn=parent_conn,
+            shm=shm,
+            inputs=inputs,
+            outputs=outputs,
+        )
+        worker.reader = threading.Thread(
+            target=self._read_responses, args=(worker,), daemon=True
+        )
+        worker.reader.start()
+        return worker
+
+    def _predict_chunk(self, model_index: int, x_values: npt.NDArray[Any]) -> list[int]:
+        try:
+            index, slot = self._free_slots.get(
+                timeout=settings.INFERENCE_PROCESS_TIMEOUT
+            )
+        except queue.Empty:
+            raise InferenceWorkerError("No inference slot freed up in time")
+        worker = self._workers[index]
+        n_rows = len(x_values)
+        worker.inputs[slot, :n_rows] = x_values
+        future: Future[int] = Future()
+        with worker.send_lock:
+            try:
+                if worker.exited:
+                    raise InferenceWorkerError(f"Inference worker {index} exited")
+                worker.pending[slot] = future
+                worker.conn.send_bytes(_REQUEST.pack(slot, model_index, n_rows))
+            except (InferenceWorkerError, OSError) as e:
+                # Not sent, the slot is still free
+                worker.pending.pop(slot, None)
+                self._free_slots.put((index, slot))
+                raise InferenceWorkerError(f"Inference worker {index} exited") from e
+        try:
+            status = future.result(timeout=settings.INFERENCE_PROCESS_TIMEOUT)
+        except FutureTimeoutError:
+            # Unless the response just arrived, the worker may still write to
+            # this slot: it returns to the ring with the response instead
+            if future.cancel():
+                logger.error("Inference worker %s timed out", index)
+                raise InferenceWorkerError(f"Inference worker {index} timed out")
+            status = future.result()
+        try:
+            if status != _OK:
+                raise InferenceWorkerError("Inference failed in worker process")
+            return worker.outputs[slot, :n_rows].tolist()  # type: ignore[no-any-return]
+        finally:
+            self._free_slots.put((index, slot))
+
+    def _read_responses(self, worker: _Worker) -> None:
+        while True:
+            try:
+                slot, status = _RESPONSE.unpack(worker.conn.recv_bytes())
+            except (EOFError, OSError):
+                break
+            with worker.send_lock:
+                future = worker.pending.pop(slot, None)
+            if future is None:
+                continue
+            if not future.set_running_or_notify_cancel():
+                # Its caller timed out
+                self._free_slots.put((worker.index, slot))
+                continue
+            future.set_result(status)
+        with worker.send_lock:
+            worker.exited = True
+            pending, worker.pending = worker.pending, {}
+        for future in pending.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(
+                    InferenceWorkerError(f"Inference worker {worker.index} exited")
+                )
+        with self._lock:
+            if not self._running:
+                return
+            logger.error("Inference worker %s exited, respawning it", worker.index)
+            worker.process.join(timeout=5)
+            worker.conn.close()
+            self._workers[worker.index] = self._spawn(worker.index, worker.shm)
+            self.respawns += 1
+        # The slots it was answering, or would have
+        for slot in pending:
+            self._free_slots.put((worker.index, slot))
+
+
+inference_pool = InferenceProcessPool(
+    processes=settings.INFERENCE_PROCESSES,
+    slots=settings.INFERENCE_PROCESS_SLOTS,
+    max_rows=settings.INFERENCE_PROCESS_MAX_ROWS,
+)
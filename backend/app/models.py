@@ -1,5 +1,11 @@
-from pydantic import BaseModel, EmailStr
+from datetime import datetime, timezone
+from typing import Any
+
+from pydantic import BaseModel, EmailStr, model_validator
+from sqlalchemy import REAL, BigInteger, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlmodel import Field, Relationship, SQLModel
+from typing_extensions import Self
 
 
 # Shared properties
@@ -41,6 +47,9 @@ class UpdatePassword(SQLModel):
 class User(UserBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     hashed_password: str
+    # Bumped when the claims of the user's access tokens change, or their
+    # password does, revoking the tokens issued before
+    token_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
     items: list["Item"] = Relationship(back_populates="owner")
 
 
@@ -98,11 +107,27 @@ class Message(SQLModel):
 class Token(SQLModel):
     access_token: str
     token_type: str = "bearer"
+    # Only with ACCESS_TOKEN_CLAIMS
+    refresh_token: str | None = None
+
+
+class RefreshToken(SQLModel):
+    refresh_token: str
 
 
 # Contents of JWT token
 class TokenPayload(SQLModel):
     sub: int | None = None
+    # "refresh" for refresh tokens
+    type: str | None = None
+    iat: float | None = None
+    # Claims of self-contained access tokens, their user's token_version and
+    # principal at the time they were issued
+    ver: int | None = None
+    email: str | None = None
+    full_name: str | None = None
+    is_superuser: bool | None = None
+    entitlements: int | None = None
 
 
 class NewPassword(SQLModel):
@@ -118,13 +143,233 @@ class InputData(BaseModel):
     credit_history: float
 
 
+# Column-oriented batch of InputData, every list holds one value per row
+class InputColumns(BaseModel):
+    married: list[float]
+    income: list[float]
+    education: list[float]
+    loan_amount: list[float]
+    credit_history: list[float]
+
+    @model_validator(mode="after")
+    def _check_same_length(self) -> Self:
+        lengths = {len(values) for values in self.model_dump().values()}
+        if len(lengths) > 1:
+            raise ValueError("All columns must have the same number of rows")
+        return self
+
+
+class BatchPrediction(BaseModel):
+    predictions: list[int]
+    credits_left: int
+
+
+# One feature varied by a what-if sweep, over explicit values or over
+# ``num`` evenly spaced values from ``start`` to ``stop`` inclusive
+class SweepAxis(BaseModel):
+    feature: str
+    values: list[float] | None = Field(default=None, min_length=1)
+    start: float | None = None
+    stop: float | None = None
+    num: int | None = Field(default=None, ge=1)
+
+    @model_validator(mode="after")
+    def _check_values_or_range(self) -> Self:
+        has_range = None not in (self.start, self.stop, self.num)
+        if (self.values is None) == (not has_range):
+            raise ValueError("Give either values or start, stop and num")
+        return self
+
+
+class SweepInput(BaseModel):
+    base: InputData
+    axes: list[SweepAxis] = Field(min_length=1, max_length=2)
+
+
+# Consecutive grid points of a sweep row sharing a prediction, ``start`` and
+# ``stop`` are the first and last values of the last swept feature
+class SweepRun(BaseModel):
+    start: float
+    stop: float
+    prediction: int
+
+
+class SweepRow(BaseModel):
+    # Value of the first feature of a two-feature sweep
+    value: float | None = None
+    runs: list[SweepRun]
+
+
+class SweepPrediction(BaseModel):
+    features: list[str]
+    points: int
+    rows: list[SweepRow]
+    credits_left: int
+
+
+class EnsemblePrediction(BaseModel):
+    predictions: dict[str, int]
+    # Majority vote of the predictions when requested, ties predict 0
+    vote: int | None = None
+    credits_left: int
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# Asynchronous bulk prediction job, its status goes from "uploading" to
+# "queued" once paid for, then "running" and "completed" or "failed"
+class PredictionJob(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    owner_id: int = Field(
+        index=True, sa_column_args=[ForeignKey("user.id", ondelete="CASCADE")]
+    )
+    model: str = Field(max_length=255)
+    status: str = Field(default="uploading", max_length=16)
+    total_rows: int = 0
+    scored_rows: int = 0
+    # Credits charged when the job was queued
+    credits: int = 0
+    error: str | None = Field(default=None, max_length=255)
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    started_at: datetime | None = Field(
+        default=None,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    finished_at: datetime | None = Field(
+        default=None,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+
+
+# Rows of a job waiting to be scored, deleted once scored
+class PredictionJobChunk(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    job_id: int = Field(
+        index=True,
+        sa_column_args=[ForeignKey("predictionjob.id", ondelete="CASCADE")],
+    )
+    first_row: int
+    n_rows: int
+    # (n_rows, len(FEATURES)) float32 matrix in row-major order
+    inputs: bytes
+
+
+class PredictionJobResult(SQLModel, table=True):
+    job_id: int = Field(
+        primary_key=True,
+        sa_column_args=[ForeignKey("predictionjob.id", ondelete="CASCADE")],
+    )
+    row: int = Field(primary_key=True)
+    prediction: int
+
+
+class PredictionJobPublic(SQLModel):
+    id: int
+    model: str
+    status: str
+    total_rows: int
+    scored_rows: int
+    progress: float
+    rows_per_second: float | None
+    credits: int
+    error: str | None
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+
+
+# Model sold through the API, usable by users whose entitlements have its bit
+class CatalogModel(SQLModel, table=True):
+    name: str = Field(primary_key=True, max_length=255)
+    bit: int = Field(unique=True, ge=0, lt=63)
+    # Credits charged per prediction
+    price: int
+
+
+# Credits and entitlements (a bitmask of CatalogModel bits) a payment buys
+class PaymentOption(SQLModel, table=True):
+    name: str = Field(primary_key=True, max_length=255)
+    credits: int
+    entitlements: int = Field(sa_type=BigInteger)
+
+
 class Functions(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    model1: bool = Field(default=False)
-    model2: bool = Field(default=False)
-    model3: bool = Field(default=False)
+    # Bitmask of the CatalogModel bits the user paid for
+    entitlements: int = Field(default=0, sa_type=BigInteger)
     credits: int = Field(default=0)
 
+
+# Idempotency-Key of a processed payment and its response, returned again to
+# retries of the same request instead of paying twice. Rows are purged
+# after PAYMENT_IDEMPOTENCY_EXPIRE_HOURS
+class PaymentIdempotencyKey(SQLModel, table=True):
+    user_id: int = Field(
+        primary_key=True,
+        sa_column_args=[ForeignKey("user.id", ondelete="CASCADE")],
+    )
+    key: str = Field(primary_key=True, max_length=255)
+    option: str = Field(max_length=255)
+    response: dict[str, Any] | None = Field(default=None, sa_type=JSONB)
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        index=True,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+
+
+# Append-only record of credits moved through worker reservations: "reserve"
+# takes credits from the balance, "use" records predictions charged from the
+# reservation and "release" gives back what was left
+class CreditLedger(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(
+        index=True, sa_column_args=[ForeignKey("user.id", ondelete="CASCADE")]
+    )
+    worker: str = Field(max_length=255)
+    kind: str = Field(max_length=16)
+    model: str | None = Field(default=None, max_length=255)
+    credits: int
+    predictions: int = 0
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+
+
+# Append-only record of scored predictions, written in batches by
+# app/mlmodel/prediction_log.py. The table is partitioned by day of
+# created_at, so that retention drops whole partitions
+class PredictionLog(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_predictionlog_user_id_created_at", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    # Partitioned tables need the partition key in their primary key
+    id: int | None = Field(
+        default=None,
+        primary_key=True,
+        sa_type=BigInteger,
+        sa_column_kwargs={"autoincrement": True},
+    )
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        primary_key=True,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    # Not a foreign key, the log outlives deleted users
+    user_id: int
+    model: str = Field(max_length=255)
+    inputs: list[float] = Field(sa_type=ARRAY(REAL))  # type: ignore
+    prediction: int
+
+
 class CommercialCustomer(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True)
     company_name: str
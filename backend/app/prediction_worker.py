@@ -0,0 +1,60 @@
+import argparse
+import logging
+import multiprocessing
+import signal
+import threading
+from types import FrameType
+
+from app.core.config import settings
+from app.mlmodel.jobs import run_worker
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def serve() -> None:
+    stop = threading.Event()
+
+    def request_stop(signum: int, _frame: FrameType | None) -> None:
+        logger.info("Received signal %s, finishing the current chunk", signum)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    run_worker(stop)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Score prediction jobs")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=settings.PREDICT_JOB_WORKERS,
+        help="Worker processes to run, each scoring one chunk at a time",
+    )
+    args = parser.parse_args()
+    if args.processes <= 1:
+        serve()
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=serve, name=f"prediction-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward_stop(_signum: int, _frame: FrameType | None) -> None:
+        for process in processes:
+            if process.pid is not None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward_stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
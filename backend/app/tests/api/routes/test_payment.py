@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.mlmodel.catalog import model_catalog
+from app.tests.utils.utils import random_lower_string
+
+
+def test_payment(client: TestClient, normal_user_token_headers: dict[str, str]) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model2", headers=normal_user_token_headers
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["paid_models"]["model2"]
+    assert content["credits_added"] == model_catalog.get().options["model2"].credits
+
+
+def test_payment_invalid_option(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model9", headers=normal_user_token_headers
+    )
+    assert r.status_code == 400
+
+
+def test_payment_retries_with_idempotency_key(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    headers = {**normal_user_token_headers, "Idempotency-Key": random_lower_string()}
+    r = client.post(f"{settings.API_V1_STR}/payment/model1", headers=headers)
+    assert r.status_code == 200
+    first = r.json()
+    r = client.post(f"{settings.API_V1_STR}/payment/model1", headers=headers)
+    assert r.status_code == 200
+    assert r.json() == first
+
+    # Credits were added once
+    headers["Idempotency-Key"] = random_lower_string()
+    r = client.post(f"{settings.API_V1_STR}/payment/model1", headers=headers)
+    assert r.json()["total_credits"] == first["total_credits"] + first["credits_added"]
+
+
+def test_payment_idempotency_key_of_another_option(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    headers = {**normal_user_token_headers, "Idempotency-Key": random_lower_string()}
+    r = client.post(f"{settings.API_V1_STR}/payment/model1", headers=headers)
+    assert r.status_code == 200
+    r = client.post(f"{settings.API_V1_STR}/payment/model2", headers=headers)
+    assert r.status_code == 422
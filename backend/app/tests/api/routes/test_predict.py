@@ -0,0 +1,570 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import crud
+from app.core.config import settings
+from app.core.credits import credit_reservations
+from app.core.entitlements import Entitlements, entitlement_cache
+from app.mlmodel.cache import prediction_cache
+from app.mlmodel.catalog import model_catalog
+from app.mlmodel.jobs import score_next_chunk
+from app.models import Functions, InputData, PredictionJob, UserCreate
+from app.tests.utils.user import user_authentication_headers
+from app.tests.utils.utils import random_email, random_lower_string
+
+input_rows = [
+    {
+        "married": 1,
+        "income": 5000,
+        "education": 1,
+        "loan_amount": 100,
+        "credit_history": 1,
+    },
+    {
+        "married": 0,
+        "income": 1500,
+        "education": 0,
+        "loan_amount": 300,
+        "credit_history": 0,
+    },
+    {
+        "married": 1,
+        "income": 3000,
+        "education": 0,
+        "loan_amount": 120,
+        "credit_history": 1,
+    },
+]
+
+
+def test_predict_payment_required(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model3",
+        headers=superuser_token_headers,
+        json=input_rows[0],
+    )
+    assert r.status_code == 402
+
+
+def test_predict(client: TestClient, normal_user_token_headers: dict[str, str]) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model1", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1",
+        headers=normal_user_token_headers,
+        json=input_rows[0],
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["prediction"] in (0, 1)
+    assert content["credits_left"] == total_credits - 1
+
+
+def test_predict_refunds_failed_prediction(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model2", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+
+    async def fail(_model_name: str, _input_data: InputData) -> int:
+        raise RuntimeError("model failed")
+
+    prediction_cache.clear()
+    with monkeypatch.context() as m:
+        m.setattr("app.api.routes.predict.run_prediction", fail)
+        with pytest.raises(RuntimeError):
+            client.post(
+                f"{settings.API_V1_STR}/predict/model2",
+                headers=normal_user_token_headers,
+                json=input_rows[2],
+            )
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model2",
+        headers=normal_user_token_headers,
+        json=input_rows[2],
+    )
+    assert r.json()["credits_left"] == total_credits - 2
+
+
+def test_predict_with_credit_reservations(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "CREDIT_RESERVATIONS", True)
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model1", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    prediction_cache.clear()
+    for i, row in enumerate(input_rows):
+        r = client.post(
+            f"{settings.API_V1_STR}/predict/model1",
+            headers=normal_user_token_headers,
+            json=row,
+        )
+        assert r.status_code == 200
+        assert r.json()["credits_left"] == total_credits - i - 1
+    credit_reservations.flush(release_all=True)
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model1", headers=normal_user_token_headers
+    )
+    # The unused rest of the reservation is back in the balance
+    option = model_catalog.get().options["model1"]
+    assert r.json()["total_credits"] == (
+        total_credits - len(input_rows) + option.credits
+    )
+
+
+def test_predict_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model2", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    expected = [
+        client.post(
+            f"{settings.API_V1_STR}/predict/model2",
+            headers=normal_user_token_headers,
+            json=row,
+        ).json()["prediction"]
+        for row in input_rows
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model2/batch",
+        headers=normal_user_token_headers,
+        json=input_rows,
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["predictions"] == expected
+    assert content["credits_left"] == total_credits - 2 * 2 * len(input_rows)
+
+
+def test_predict_batch_columns(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    client.post(
+        f"{settings.API_V1_STR}/payment/model1", headers=normal_user_token_headers
+    )
+    rows = client.post(
+        f"{settings.API_V1_STR}/predict/model1/batch",
+        headers=normal_user_token_headers,
+        json=input_rows,
+    ).json()
+    columns = {
+        feature: [row[feature] for row in input_rows] for feature in input_rows[0]
+    }
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1/batch",
+        headers=normal_user_token_headers,
+        json=columns,
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["predictions"] == rows["predictions"]
+    assert content["credits_left"] == rows["credits_left"] - len(input_rows)
+
+
+def test_predict_batch_too_large(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1/batch",
+        headers=normal_user_token_headers,
+        json=input_rows * settings.PREDICT_MAX_BATCH_SIZE,
+    )
+    assert r.status_code == 413
+
+
+def test_predict_batch_not_enough_credits(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model3", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model3/batch",
+        headers=normal_user_token_headers,
+        json=input_rows[:1] * (total_credits // 3 + 1),
+    )
+    assert r.status_code == 402
+
+
+def test_predict_cached(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model1", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    prediction_cache.clear()
+    hits = prediction_cache.hits
+    responses = [
+        client.post(
+            f"{settings.API_V1_STR}/predict/model1",
+            headers=normal_user_token_headers,
+            json=input_rows[1],
+        ).json()
+        for _ in range(2)
+    ]
+    assert prediction_cache.hits == hits + 1
+    assert responses[0]["prediction"] == responses[1]["prediction"]
+    assert responses[1]["credits_left"] == total_credits - 2
+
+    monkeypatch.setattr(settings, "PREDICT_CACHE_CHARGE_HITS", False)
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1",
+        headers=normal_user_token_headers,
+        json=input_rows[1],
+    )
+    assert prediction_cache.hits == hits + 2
+    assert r.json()["credits_left"] == total_credits - 2
+
+
+def test_predict_ensemble(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/all", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    expected = {
+        model_name: client.post(
+            f"{settings.API_V1_STR}/predict/{model_name}/batch",
+            headers=normal_user_token_headers,
+            json=input_rows[:1],
+        ).json()["predictions"][0]
+        for model_name in ("model1", "model2", "model3")
+    }
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/ensemble",
+        headers=normal_user_token_headers,
+        params={"vote": True},
+        json=input_rows[0],
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["predictions"] == expected
+    assert content["vote"] == int(sum(expected.values()) >= 2)
+    assert content["credits_left"] == total_credits - 2 * (1 + 2 + 3)
+
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/ensemble",
+        headers=normal_user_token_headers,
+        params={"models": ["model3", "model1"]},
+        json=input_rows[0],
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert list(content["predictions"]) == ["model3", "model1"]
+    assert content["vote"] is None
+    assert content["credits_left"] == total_credits - 2 * (1 + 2 + 3) - 4
+
+
+def test_predict_ensemble_payment_required(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/ensemble",
+        headers=superuser_token_headers,
+        params={"models": ["model3"]},
+        json=input_rows[0],
+    )
+    assert r.status_code == 402
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/ensemble",
+        headers=superuser_token_headers,
+        params={"models": ["model4"]},
+        json=input_rows[0],
+    )
+    assert r.status_code == 400
+
+
+def test_predict_sweep(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model1", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1/sweep",
+        headers=normal_user_token_headers,
+        json={
+            "base": input_rows[0],
+            "axes": [{"feature": "income", "start": 0, "stop": 20000, "num": 1500}],
+        },
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["features"] == ["income"]
+    assert content["points"] == 1500
+    runs = content["rows"][0]["runs"]
+    assert runs[0]["start"] == 0
+    assert runs[-1]["stop"] == 20000
+    assert all(run["prediction"] in (0, 1) for run in runs)
+    assert content["credits_left"] == total_credits - 2
+
+
+def test_predict_sweep_invalid(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1/sweep",
+        headers=normal_user_token_headers,
+        json={"base": input_rows[0], "axes": [{"feature": "age", "values": [1]}]},
+    )
+    assert r.status_code == 400
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1/sweep",
+        headers=normal_user_token_headers,
+        json={
+            "base": input_rows[0],
+            "axes": [
+                {"feature": "income", "start": 0, "stop": 1, "num": 1000},
+                {"feature": "loan_amount", "start": 0, "stop": 1, "num": 1000},
+            ],
+        },
+    )
+    assert r.status_code == 413
+
+
+def test_predict_bulk_csv(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model1", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    expected = client.post(
+        f"{settings.API_V1_STR}/predict/model1/batch",
+        headers=normal_user_token_headers,
+        json=input_rows,
+    ).json()["predictions"]
+    columns = list(reversed(input_rows[0]))
+    lines = [",".join(columns)] + [
+        ",".join(str(row[column]) for column in columns) for row in input_rows
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1/bulk",
+        headers={**normal_user_token_headers, "Content-Type": "text/csv"},
+        content="\r\n".join(lines).encode(),
+    )
+    assert r.status_code == 200
+    *predictions, summary = (json.loads(line) for line in r.text.splitlines())
+    assert [line["prediction"] for line in predictions] == expected
+    assert summary == {
+        "rows": len(input_rows),
+        "credits_left": total_credits - 2 * len(input_rows),
+    }
+
+
+def test_predict_bulk_ndjson_stops_when_out_of_credits(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "PREDICT_BULK_CHUNK_ROWS", 1)
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model3", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    n_rows = total_credits // 3 + 2
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model3/bulk",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content=b"".join(
+            json.dumps(input_rows[i % 3]).encode() + b"\n" for i in range(n_rows)
+        ),
+    )
+    assert r.status_code == 200
+    *predictions, summary = (json.loads(line) for line in r.text.splitlines())
+    assert len(predictions) == total_credits // 3
+    assert summary["rows"] == total_credits // 3
+    assert summary["credits_left"] == total_credits % 3
+    assert "error" in summary
+
+
+def test_predict_bulk_invalid_row(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    client.post(
+        f"{settings.API_V1_STR}/payment/model1", headers=normal_user_token_headers
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1/bulk",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content=json.dumps(input_rows[0]) + '\n{"married": 1}\n',
+    )
+    assert r.status_code == 200
+    summary = json.loads(r.text.splitlines()[-1])
+    assert summary["rows"] == 0
+    assert summary["error"] == "Invalid row on line 2"
+
+
+def test_predict_bulk_unsupported_media_type(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model1/bulk",
+        headers={**normal_user_token_headers, "Content-Type": "application/json"},
+        content=json.dumps(input_rows),
+    )
+    assert r.status_code == 415
+
+
+def test_prediction_job(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "PREDICT_JOB_CHUNK_ROWS", 2)
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model2", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    expected = client.post(
+        f"{settings.API_V1_STR}/predict/model2/batch",
+        headers=normal_user_token_headers,
+        json=input_rows,
+    ).json()["predictions"]
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model2/jobs",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content="".join(json.dumps(row) + "\n" for row in input_rows),
+    )
+    assert r.status_code == 202
+    job = r.json()
+    assert job["status"] == "queued"
+    assert job["total_rows"] == len(input_rows)
+    assert job["credits"] == 2 * len(input_rows)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/predict/jobs/{job['id']}/results",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 409
+
+    while score_next_chunk(db):
+        pass
+
+    r = client.get(
+        f"{settings.API_V1_STR}/predict/jobs/{job['id']}",
+        headers=normal_user_token_headers,
+    )
+    job = r.json()
+    assert job["status"] == "completed"
+    assert job["progress"] == 1.0
+    assert job["rows_per_second"] > 0
+    r = client.get(
+        f"{settings.API_V1_STR}/predict/jobs/{job['id']}/results",
+        headers=normal_user_token_headers,
+    )
+    assert [json.loads(line)["prediction"] for line in r.text.splitlines()] == expected
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model2", headers=normal_user_token_headers
+    )
+    assert r.json()["total_credits"] == total_credits + 60 - 4 * len(input_rows)
+
+
+def test_prediction_job_not_enough_credits(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/payment/model3", headers=normal_user_token_headers
+    )
+    total_credits = r.json()["total_credits"]
+    r = client.post(
+        f"{settings.API_V1_STR}/predict/model3/jobs",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content=(json.dumps(input_rows[0]) + "\n") * (total_credits // 3 + 1),
+    )
+    assert r.status_code == 402
+    assert not db.exec(
+        select(PredictionJob).where(PredictionJob.model == "model3")
+    ).all()
+
+
+def test_read_prediction_job_of_other_user(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.FIRST_SUPERUSER)
+    assert user and user.id
+    job = crud.create_prediction_job(session=db, owner_id=user.id, model="model1")
+    r = client.get(
+        f"{settings.API_V1_STR}/predict/jobs/{job.id}",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 400
+    r = client.get(
+        f"{settings.API_V1_STR}/predict/jobs/{job.id}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert r.json()["status"] == "uploading"
+
+
+@pytest.mark.parametrize("endpoint", ["batch", "sweep", "bulk"])
+def test_charge_checks_revoked_entitlement(
+    client: TestClient,
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    endpoint: str,
+) -> None:
+    email, password = random_email(), random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    functions = Functions(id=user.id, credits=100, entitlements=0)
+    db.add(functions)
+    db.commit()
+    # Cached before model1 was revoked
+    stale = Entitlements(entitlements=model_catalog.get().masks["model1"], credits=100)
+    monkeypatch.setattr(entitlement_cache, "get", lambda _user_id: stale)
+
+    url = f"{settings.API_V1_STR}/predict/model1/{endpoint}"
+    if endpoint == "batch":
+        r = client.post(url, headers=headers, json=input_rows)
+    elif endpoint == "sweep":
+        axes = [{"feature": "income", "start": 0, "stop": 1, "num": 2}]
+        r = client.post(
+            url, headers=headers, json={"base": input_rows[0], "axes": axes}
+        )
+    else:
+        r = client.post(
+            url,
+            headers={**headers, "Content-Type": "application/x-ndjson"},
+            content=json.dumps(input_rows[0]).encode() + b"\n",
+        )
+        assert r.status_code == 200
+        assert json.loads(r.text.splitlines()[-1]) == {
+            "rows": 0,
+            "credits_left": 100,
+            "error": "Payment required for model1",
+        }
+    if endpoint != "bulk":
+        assert r.status_code == 402
+        assert r.json()["detail"] == "Payment required for model1"
+    db.refresh(functions)
+    assert functions.credits == 100
@@ -0,0 +1,24 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_read_metrics(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert "micro_batching" in content
+    assert content["credit_reservations"]["reserved_users"] >= 0
+
+
+def test_read_metrics_requires_superuser(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=normal_user_token_headers
+    )
+    assert r.status_code == 403
@@ -0,0 +1,141 @@
+import threading
+
+from sqlalchemy import func
+from sqlmodel import Session, col, select
+
+from app import crud
+from app.core.credits import CreditReservations
+from app.mlmodel.catalog import model_catalog
+from app.models import CreditLedger
+from app.tests.utils.functions import create_functions
+
+
+def make_reservations(block: int, overdraft: int = 0) -> CreditReservations:
+    return CreditReservations(
+        block=block,
+        overdraft=overdraft,
+        flush_seconds=60,
+        flush_predictions=1_000_000,
+        idle_seconds=60,
+        worker="test",
+    )
+
+
+def ledger_totals(db: Session, user_id: int | None) -> dict[str, int]:
+    rows = db.exec(
+        select(CreditLedger.kind, func.sum(col(CreditLedger.credits)))
+        .where(CreditLedger.user_id == user_id)
+        .group_by(CreditLedger.kind)
+    ).all()
+    return {kind: int(credits) for kind, credits in rows}
+
+
+def test_charges_from_reserved_blocks(db: Session) -> None:
+    functions = create_functions(db, 250, "model1")
+    assert functions.id is not None
+    mask = model_catalog.get().masks["model1"]
+    reservations = make_reservations(block=100)
+
+    assert reservations.try_charge(functions.id, "model1", 1, mask) is None
+    credits_left = [
+        reservations.charge(functions.id, "model1", 1, mask) for _ in range(150)
+    ]
+
+    assert credits_left == list(range(249, 99, -1))
+    # The second block is half of the 150 credits left
+    assert reservations.reservations == 2
+    db.refresh(functions)
+    assert functions.credits == 75
+    reservations.refund(functions.id, "model1", 1)
+    reservations.flush(release_all=True)
+    db.refresh(functions)
+    assert functions.credits == 101
+    assert ledger_totals(db, functions.id) == {
+        "reserve": 175,
+        "use": 149,
+        "release": 26,
+    }
+
+
+def test_overdraft(db: Session) -> None:
+    functions = create_functions(db, 5, "model1")
+    assert functions.id is not None
+    mask = model_catalog.get().masks["model1"]
+    reservations = make_reservations(block=100, overdraft=10)
+
+    charged = [reservations.charge(functions.id, "model1", 2, mask) for _ in range(8)]
+
+    assert charged[:7] == [3, 1, -1, -3, -5, -7, -9]
+    assert charged[7] is None
+    reservations.flush(release_all=True)
+    db.refresh(functions)
+    assert functions.credits == -9
+
+
+def test_reservation_leaves_credits_for_other_workers(db: Session) -> None:
+    functions = create_functions(db, 100, "model1")
+    assert functions.id is not None
+    mask = model_catalog.get().masks["model1"]
+    first, second = make_reservations(block=100), make_reservations(block=100)
+
+    assert first.charge(functions.id, "model1", 1, mask) == 99
+    assert second.charge(functions.id, "model1", 1, mask) == 49
+    db.refresh(functions)
+    assert functions.credits == 25
+    # Direct charges of batch requests still find credits
+    assert crud.deduct_credits(session=db, user_id=functions.id, amount=20) == 5
+
+    first.flush(release_all=True)
+    second.flush(release_all=True)
+    db.refresh(functions)
+    assert functions.credits == 78
+
+
+def test_refund_after_release_keeps_ledger_balanced(db: Session) -> None:
+    functions = create_functions(db, 100, "model1")
+    assert functions.id is not None
+    mask = model_catalog.get().masks["model1"]
+    reservations = make_reservations(block=10)
+
+    assert reservations.charge(functions.id, "model1", 2, mask) == 98
+    reservations.flush(release_all=True)
+    reservations.refund(functions.id, "model1", 2)
+
+    db.refresh(functions)
+    assert functions.credits == 100
+    totals = ledger_totals(db, functions.id)
+    assert totals["use"] == 0
+    assert totals["reserve"] - totals["use"] - totals["release"] == 0
+    assert 100 - totals["reserve"] + totals["release"] == functions.credits
+
+
+def test_concurrent_charges_stay_consistent(db: Session) -> None:
+    functions = create_functions(db, 300, "model1")
+    assert functions.id is not None
+    mask = model_catalog.get().masks["model1"]
+    # Two workers sharing the balance
+    workers = [make_reservations(block=25), make_reservations(block=25)]
+    charged: list[int] = []
+
+    def spend(reservations: CreditReservations) -> None:
+        for _ in range(50):
+            assert functions.id is not None
+            if reservations.charge(functions.id, "model1", 1, mask) is not None:
+                charged.append(1)
+            if len(charged) % 40 == 0:
+                reservations.flush()
+
+    threads = [threading.Thread(target=spend, args=(workers[i % 2],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for reservations in workers:
+        reservations.flush(release_all=True)
+
+    assert len(charged) == 300
+    db.refresh(functions)
+    assert functions.credits == 0
+    totals = ledger_totals(db, functions.id)
+    assert totals["use"] == 300
+    assert totals["reserve"] - totals["use"] - totals.get("release", 0) == 0
@@ -0,0 +1,82 @@
+import pytest
+from sqlmodel import Session
+
+from app import crud
+from app.core.entitlements import CHANNEL, EntitlementCache, Entitlements
+from app.core.notifications import NotificationListener
+from app.models import Functions
+from app.tests.utils.functions import create_functions
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import FakeClock, wait_for_invalidations
+
+
+def test_load_and_expire(db: Session) -> None:
+    functions = create_functions(db, 10, "model1", "model3")
+    clock = FakeClock()
+    cache = EntitlementCache(max_size=10, ttl_seconds=30, clock=clock)
+
+    assert cache.get(functions.id) is None
+    assert cache.load(db, functions.id) == Entitlements(entitlements=0b101, credits=10)
+    assert cache.get(functions.id) == Entitlements(entitlements=0b101, credits=10)
+    clock.now = 30
+    assert cache.get(functions.id) is None
+    # Users who never paid are cached too
+    user = create_random_user(db)
+    assert cache.load(db, user.id) == Entitlements(entitlements=0, credits=0)
+    assert cache.get(user.id) == Entitlements(entitlements=0, credits=0)
+
+
+def test_load_racing_invalidation_isnt_cached(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    functions = create_functions(db, 10, "model1", "model3")
+    cache = EntitlementCache(max_size=10, ttl_seconds=30)
+    get_functions = crud.get_functions
+
+    def invalidated_meanwhile(
+        *, session: Session, user_id: int | None
+    ) -> Functions | None:
+        cache.invalidate(user_id)
+        return get_functions(session=session, user_id=user_id)
+
+    monkeypatch.setattr(crud, "get_functions", invalidated_meanwhile)
+    cache.load(db, functions.id)
+    assert cache.get(functions.id) is None
+
+
+def test_committed_changes_invalidate_every_worker(db: Session) -> None:
+    functions = create_functions(db, 10, "model1", "model3")
+    cache = EntitlementCache(max_size=10, ttl_seconds=300)
+    listener = NotificationListener()
+    listener.subscribe(CHANNEL, cache.on_notify, cache.clear)
+    listener.start()
+    try:
+        assert listener.listening.wait(5)
+        cache.load(db, functions.id)
+
+        # Charging only lowers the credits, the entry stays. Notifications
+        # arrive in commit order: once another user's has arrived, one for
+        # the charge would have too
+        crud.deduct_credits(session=db, user_id=functions.id, amount=3)
+        other = create_functions(db, 10, "model1", "model3")
+        cache.load(db, other.id)
+        db.delete(other)
+        db.commit()
+        wait_for_invalidations(cache, 1)
+        assert cache.get(other.id) is None
+        assert cache.get(functions.id) == Entitlements(entitlements=0b101, credits=10)
+
+        # Refunds add credits
+        crud.refund_credits(session=db, user_id=functions.id, amount=1)
+        wait_for_invalidations(cache, 2)
+        assert cache.get(functions.id) is None
+
+        cache.load(db, functions.id)
+        db.refresh(functions)
+        functions.entitlements |= 0b010
+        db.add(functions)
+        db.commit()
+        wait_for_invalidations(cache, 3)
+        assert cache.get(functions.id) is None
+    finally:
+        listener.stop()
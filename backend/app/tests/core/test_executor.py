@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import time
+
+from app.core.executor import BoundedExecutor
+
+
+def test_run_off_event_loop() -> None:
+    executor = BoundedExecutor(max_workers=2)
+
+    async def run() -> int | None:
+        return await executor.run("model1", threading.get_ident)
+
+    assert asyncio.run(run()) != threading.get_ident()
+
+
+def test_concurrency_per_key() -> None:
+    executor = BoundedExecutor(max_workers=4, max_concurrency_per_key=1)
+    running: dict[str, int] = {"model1": 0, "model2": 0}
+    max_running: dict[str, int] = {"model1": 0, "model2": 0}
+    lock = threading.Lock()
+
+    def work(key: str) -> None:
+        with lock:
+            running[key] += 1
+            max_running[key] = max(max_running[key], running[key])
+        time.sleep(0.01)
+        with lock:
+            running[key] -= 1
+
+    async def run() -> None:
+        await asyncio.gather(
+            *(executor.run(key, work, key) for key in ["model1", "model2"] * 4)
+        )
+
+    asyncio.run(run())
+    assert max_running == {"model1": 1, "model2": 1}
@@ -0,0 +1,62 @@
+from sqlmodel import Session
+
+from app import crud
+from app.core.notifications import NotificationListener
+from app.core.principals import CHANNEL, PrincipalCache
+from app.models import UserUpdate
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import FakeClock, wait_for_invalidations
+
+
+def test_load_and_expire(db: Session) -> None:
+    user = create_random_user(db)
+    clock = FakeClock()
+    cache = PrincipalCache(max_size=10, ttl_seconds=30, clock=clock)
+
+    assert cache.get(user.id) is None
+    principal = cache.load(db, user.id)
+    assert principal
+    assert principal.id == user.id
+    assert principal.email == user.email
+    assert principal.is_active
+    assert not principal.is_superuser
+    assert cache.get(user.id) == principal
+    clock.now = 30
+    assert cache.get(user.id) is None
+    # Missing users aren't cached
+    assert cache.load(db, -1) is None
+    assert cache.get(-1) is None
+
+
+def test_committed_changes_invalidate_every_worker(db: Session) -> None:
+    user = create_random_user(db)
+    cache = PrincipalCache(max_size=10, ttl_seconds=300)
+    listener = NotificationListener()
+    listener.subscribe(CHANNEL, cache.on_notify, cache.clear)
+    listener.start()
+    try:
+        assert listener.listening.wait(5)
+        cache.load(db, user.id)
+
+        user.is_active = False
+        db.add(user)
+        db.commit()
+        wait_for_invalidations(cache, 1)
+        assert cache.get(user.id) is None
+        principal = cache.load(db, user.id)
+        assert principal
+        assert not principal.is_active
+
+        crud.update_user(
+            session=db, db_user=user, user_in=UserUpdate(full_name="Renamed")
+        )
+        wait_for_invalidations(cache, 2)
+        assert cache.get(user.id) is None
+
+        cache.load(db, user.id)
+        db.delete(user)
+        db.commit()
+        wait_for_invalidations(cache, 3)
+        assert cache.get(user.id) is None
+    finally:
+        listener.stop()
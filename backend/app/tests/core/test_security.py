@@ -0,0 +1,181 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session
+
+from app.api import deps
+from app.api.deps import get_current_user
+from app.api.routes.login import create_tokens
+from app.core import security
+from app.core.config import settings
+from app.core.notifications import NotificationListener
+from app.core.principals import TokenRevocations
+from app.core.security import (
+    PasswordHasher,
+    PasswordHashingBusyError,
+    VerifiedTokenCache,
+    pwd_context,
+)
+from app.models import TokenPayload
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import FakeClock
+
+
+def test_verified_token_cache_expiry() -> None:
+    clock = FakeClock(1000.0)
+    cache = VerifiedTokenCache(max_size=2, clock=clock)
+    cache.put("token1", TokenPayload(sub=1), exp=1060)
+    cache.put("token2", TokenPayload(sub=2), exp=2000)
+    assert cache.get("token1") == TokenPayload(sub=1)
+    assert cache.get("token2") == TokenPayload(sub=2)
+    clock.now = 1060
+    assert cache.get("token1") is None
+    assert cache.get("token2") == TokenPayload(sub=2)
+    cache.put("token3", TokenPayload(sub=3), exp=2000)
+    cache.put("token4", TokenPayload(sub=4), exp=2000)
+    assert cache.get("token2") is None
+
+
+def test_verified_token_cache_secret_key_rotation(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    cache = VerifiedTokenCache(max_size=10)
+    cache.put("token", TokenPayload(sub=1), exp=float("inf"))
+    monkeypatch.setattr(settings, "SECRET_KEY", "rotated")
+    assert cache.get("token") is None
+
+
+def test_current_user_from_cached_token(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user = create_random_user(db)
+    token = security.create_access_token(user.id, expires_delta=timedelta(days=1))
+    cache = VerifiedTokenCache(max_size=10)
+    monkeypatch.setattr(security, "verified_tokens", cache)
+
+    assert get_current_user(db, token).id == user.id
+    assert get_current_user(db, token).id == user.id
+    assert cache.metrics()["hits"] == 1
+
+    # Tokens signed with the previous key are refused
+    monkeypatch.setattr(settings, "SECRET_KEY", "rotated")
+    with pytest.raises(HTTPException) as e:
+        get_current_user(db, token)
+    assert e.value.status_code == 403
+
+
+def test_token_revocations() -> None:
+    clock = FakeClock(1000.0)
+    listening = threading.Event()
+    listening.set()
+    revocations = TokenRevocations(
+        lifetime_seconds=60, listening=listening, clock=clock
+    )
+    # Issued before notifications were known
+    assert revocations.check(1, 0, issued_at=999) is None
+    assert revocations.check(1, 0, issued_at=1000) is True
+
+    clock.now = 1010
+    revocations.on_notify("1:1")
+    assert revocations.check(1, 0, issued_at=1005) is False
+    assert revocations.check(1, 1, issued_at=1010) is True
+    assert revocations.check(2, 0, issued_at=1005) is True
+    # Forgotten once the tokens it revokes have expired
+    clock.now = 1071
+    revocations.note(2, 3)
+    assert revocations.metrics() == {"size": 1, "revoked": 1}
+
+    revocations.reset()
+    assert revocations.check(2, 0, issued_at=1070) is None
+    assert revocations.check(2, 0, issued_at=1071) is True
+    # Nor known while not listening
+    listening.clear()
+    assert revocations.check(2, 0, issued_at=1071) is None
+
+
+def test_current_user_from_claims(db: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    user = create_random_user(db)
+    monkeypatch.setattr(settings, "ACCESS_TOKEN_CLAIMS", True)
+    monkeypatch.setattr(security, "verified_tokens", VerifiedTokenCache(max_size=10))
+    clock = FakeClock(1000.0)
+    listener = NotificationListener()
+    listener.start()
+    try:
+        assert listener.listening.wait(5)
+        revocations = TokenRevocations(
+            lifetime_seconds=900, listening=listener.listening, clock=clock
+        )
+        monkeypatch.setattr(deps, "token_revocations", revocations)
+        token = create_tokens(db, user).access_token
+
+        # Answered from the token alone
+        no_session: Session = None  # type: ignore[assignment]
+        principal = get_current_user(no_session, token)
+        assert principal.id == user.id
+        assert principal.email == user.email
+        assert not principal.is_superuser
+        assert principal.entitlements == 0
+
+        # Changing the user's claims revokes their tokens
+        user.is_superuser = True
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        assert user.token_version == 1
+        revocations.note(user.id, user.token_version)
+        with pytest.raises(HTTPException) as e:
+            get_current_user(db, token)
+        assert e.value.status_code == 401
+        token = create_tokens(db, user).access_token
+        assert get_current_user(no_session, token).is_superuser
+
+        # With the listener stopped, changes may go unnoticed: the version is
+        # checked against the user
+        listener.stop()
+        user.is_superuser = False
+        db.add(user)
+        db.commit()
+        with pytest.raises(HTTPException) as e:
+            get_current_user(db, token)
+        assert e.value.status_code == 401
+
+        # As it is for tokens issued before the listener reconnected
+        listener.start()
+        assert listener.listening.wait(5)
+        clock.now = float("inf")
+        revocations.reset()
+        with pytest.raises(HTTPException) as e:
+            get_current_user(db, token)
+        assert e.value.status_code == 401
+    finally:
+        listener.stop()
+
+
+def test_password_hasher_refuses_when_full() -> None:
+    hasher = PasswordHasher(max_workers=1, max_queue=1)
+    release = threading.Event()
+    running = [
+        threading.Thread(target=hasher.run, args=(release.wait,)) for _ in range(2)
+    ]
+    for thread in running:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while hasher.pending < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    with pytest.raises(PasswordHashingBusyError):
+        hasher.run(pwd_context.hash, "password")
+    release.set()
+    for thread in running:
+        thread.join()
+    assert pwd_context.verify("password", hasher.run(pwd_context.hash, "password"))
+    metrics = hasher.metrics()
+    assert metrics["calls"] == 3
+    assert metrics["rejected"] == 1
+    assert metrics["pending"] == 0
+    # The second call waited for the first
+    assert metrics["queue_seconds"] > 0
+    assert metrics["cpu_seconds"] > 0
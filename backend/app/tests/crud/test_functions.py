@@ -0,0 +1,179 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.db import engine
+from app.mlmodel.catalog import model_catalog
+from app.tests.utils.functions import create_functions
+from app.tests.utils.user import create_random_user
+
+
+def test_deduct_credits_requires_model(db: Session) -> None:
+    functions = create_functions(db, 10, "model1")
+    masks = model_catalog.get().masks
+    credits_left = crud.deduct_credits(
+        session=db, user_id=functions.id, amount=2, entitlement=masks["model2"]
+    )
+    assert credits_left is None
+    credits_left = crud.deduct_credits(
+        session=db, user_id=functions.id, amount=2, entitlement=masks["model1"]
+    )
+    assert credits_left == 8
+    crud.refund_credits(session=db, user_id=functions.id, amount=2)
+    db.refresh(functions)
+    assert functions.credits == 10
+
+
+def test_concurrent_deductions_never_overdraw(db: Session) -> None:
+    functions = create_functions(db, 100, "model3")
+    charged: list[int] = []
+    masks = model_catalog.get().masks
+
+    def spend() -> None:
+        with Session(engine) as session:
+            for _ in range(10):
+                credits_left = crud.deduct_credits(
+                    session=session,
+                    user_id=functions.id,
+                    amount=3,
+                    entitlement=masks["model3"],
+                )
+                if credits_left is not None:
+                    charged.append(credits_left)
+
+    threads = [threading.Thread(target=spend) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(charged) == 33
+    assert sorted(charged) == list(range(1, 100, 3))
+    db.refresh(functions)
+    assert functions.credits == 1
+
+
+def test_concurrent_payment_key_claims_wait_for_the_first(db: Session) -> None:
+    user_id = create_random_user(db).id
+    assert user_id is not None
+    purge_before = datetime.now(timezone.utc) - timedelta(hours=1)
+    claims: list[bool] = []
+
+    with Session(engine) as first:
+        assert crud.claim_payment_key(
+            session=first,
+            user_id=user_id,
+            key="retry",
+            option="model1",
+            expired_before=purge_before,
+        )
+
+        def claim() -> None:
+            with Session(engine) as session:
+                claims.append(
+                    crud.claim_payment_key(
+                        session=session,
+                        user_id=user_id,
+                        key="retry",
+                        option="model1",
+                        expired_before=purge_before,
+                    )
+                )
+
+        thread = threading.Thread(target=claim)
+        thread.start()
+        # Blocked on the uncommitted key
+        thread.join(timeout=0.2)
+        assert thread.is_alive()
+        crud.store_payment_response(
+            session=first,
+            user_id=user_id,
+            key="retry",
+            response={"total_credits": 30},
+            purge_before=purge_before,
+        )
+        first.commit()
+    thread.join()
+
+    assert claims == [False]
+    claimed = crud.get_payment_key(session=db, user_id=user_id, key="retry")
+    assert claimed is not None
+    assert claimed.response == {"total_credits": 30}
+
+
+def test_expired_payment_key_is_claimed_again(db: Session) -> None:
+    user_id = create_random_user(db).id
+    assert user_id is not None
+    expired_before = datetime.now(timezone.utc) - timedelta(hours=1)
+    assert crud.claim_payment_key(
+        session=db,
+        user_id=user_id,
+        key="late",
+        option="model1",
+        expired_before=expired_before,
+    )
+    crud.store_payment_response(
+        session=db,
+        user_id=user_id,
+        key="late",
+        response={"total_credits": 30},
+        purge_before=expired_before,
+    )
+    db.commit()
+    assert not crud.claim_payment_key(
+        session=db,
+        user_id=user_id,
+        key="late",
+        option="model2",
+        expired_before=expired_before,
+    )
+    db.rollback()
+
+    # Not purged yet, but past its expiry
+    assert crud.claim_payment_key(
+        session=db,
+        user_id=user_id,
+        key="late",
+        option="model2",
+        expired_before=datetime.now(timezone.utc) + timedelta(hours=1),
+    )
+    db.commit()
+    claimed = crud.get_payment_key(session=db, user_id=user_id, key="late")
+    assert claimed is not None
+    assert claimed.option == "model2"
+    assert claimed.response is None
+
+
+def test_payment_doesnt_overwrite_concurrent_charges(db: Session) -> None:
+    functions = create_functions(db, 10, "model1")
+    masks = model_catalog.get().masks
+    user_id = functions.id
+    assert user_id is not None
+    with Session(engine) as payment:
+        entitlements, credits = crud.add_credits(
+            session=payment, user_id=user_id, credits=5, entitlements=masks["model2"]
+        )
+        assert entitlements == masks["model1"] | masks["model2"]
+        assert credits == 15
+
+        # Waits for the payment's row lock, then charges its balance
+        def charge() -> None:
+            with Session(engine) as session:
+                crud.deduct_credits(session=session, user_id=user_id, amount=3)
+
+        thread = threading.Thread(target=charge)
+        thread.start()
+        payment.commit()
+        thread.join()
+    db.refresh(functions)
+    assert functions.credits == 12
+
+    # Users who never paid get a balance
+    user = create_random_user(db)
+    assert user.id is not None
+    assert crud.add_credits(
+        session=db, user_id=user.id, credits=5, entitlements=masks["model1"]
+    ) == (masks["model1"], 5)
+    db.commit()
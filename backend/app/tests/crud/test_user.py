@@ -1,8 +1,15 @@
+import time
+
 from fastapi.encoders import jsonable_encoder
 from sqlmodel import Session
 
 from app import crud
-from app.core.security import verify_password
+from app.core.security import (
+    make_password_context,
+    password_hasher,
+    password_needs_rehash,
+    verify_password,
+)
 from app.models import User, UserCreate, UserUpdate
 from app.tests.utils.utils import random_email, random_lower_string
 
@@ -26,6 +33,34 @@ def test_authenticate_user(db: Session) -> None:
     assert user.email == authenticated_user.email
 
 
+def test_authenticate_user_rehashes_outdated_hash(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    outdated = make_password_context("pbkdf2_sha256", rounds=1000)
+    user.hashed_password = outdated.hash(password)
+    db.add(user)
+    db.commit()
+    assert password_needs_rehash(user.hashed_password)
+
+    assert crud.authenticate(session=db, email=email, password=password)
+    deadline = time.monotonic() + 5
+    while password_hasher.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    db.refresh(user)
+    assert not password_needs_rehash(user.hashed_password)
+    assert verify_password(password, user.hashed_password)
+    # Not over a password changed meanwhile
+    assert not crud.update_password_hash(
+        session=db,
+        user_id=user.id,
+        hashed_password=outdated.hash(password),
+        new_hashed_password=outdated.hash(password),
+    )
+
+
 def test_not_authenticate_user(db: Session) -> None:
     email = random_email()
     password = random_lower_string()
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.mlmodel import batching
+from app.mlmodel.batching import MicroBatcher, QueueFullError
+from app.mlmodel.prediction import PredictionService, rows_to_matrix
+from app.models import InputData
+
+input_rows = [
+    InputData(
+        married=i % 2,
+        income=1000 + 250 * i,
+        education=(i // 2) % 2,
+        loan_amount=80 + 15 * i,
+        credit_history=(i // 3) % 2,
+    )
+    for i in range(20)
+]
+
+
+def test_concurrent_predictions_are_batched() -> None:
+    batcher = MicroBatcher(max_wait_ms=50, max_batch_size=8, max_queue_size=100)
+
+    async def run() -> list[int]:
+        try:
+            return await asyncio.gather(
+                *(batcher.predict("model1", row) for row in input_rows)
+            )
+        finally:
+            await batcher.stop()
+
+    predictions = asyncio.run(run())
+
+    expected = PredictionService("model1").predict_batch(rows_to_matrix(input_rows))
+    assert predictions == expected
+    metrics = batcher.metrics()["model1"]
+    assert metrics["rows"] == len(input_rows)
+    assert metrics["batches"] == 3
+    assert metrics["batch_size_buckets"]["le_8"] == 2
+
+
+def test_queue_full() -> None:
+    batcher = MicroBatcher(max_wait_ms=50, max_batch_size=8, max_queue_size=2)
+
+    async def run() -> None:
+        try:
+            await asyncio.gather(
+                *(batcher.predict("model1", row) for row in input_rows[:4])
+            )
+        finally:
+            await batcher.stop()
+
+    with pytest.raises(QueueFullError):
+        asyncio.run(run())
+
+
+def test_caller_cancelled_during_batch(monkeypatch: pytest.MonkeyPatch) -> None:
+    batcher = MicroBatcher(max_wait_ms=1, max_batch_size=8, max_queue_size=100)
+    scoring = threading.Event()
+    predict_batch = batching._predict_batch
+
+    def slow_predict_batch(model_name: str, rows: list[InputData]) -> list[int]:
+        scoring.set()
+        time.sleep(0.2)
+        return predict_batch(model_name, rows)
+
+    monkeypatch.setattr(batching, "_predict_batch", slow_predict_batch)
+
+    async def run() -> int:
+        try:
+            cancelled = asyncio.create_task(batcher.predict("model1", input_rows[0]))
+            while not scoring.is_set():
+                await asyncio.sleep(0.01)
+            cancelled.cancel()
+            # The worker outlives the caller it couldn't answer
+            return await asyncio.wait_for(batcher.predict("model1", input_rows[1]), 5)
+        finally:
+            await batcher.stop()
+
+    prediction = asyncio.run(run())
+
+    assert (
+        prediction
+        == PredictionService("model1").predict_batch(rows_to_matrix(input_rows[1:2]))[0]
+    )
@@ -0,0 +1,56 @@
+import numpy as np
+from sklearn.linear_model import LogisticRegression  # type: ignore
+
+from app.benchmarks.predict import random_inputs
+from app.mlmodel.booster import BoosterPipeline
+from app.mlmodel.prediction import PredictionService
+from app.mlmodel.registry import ModelRegistry
+from app.models import InputData
+
+
+def test_matches_sklearn_pipeline() -> None:
+    loaded = ModelRegistry().get("model1")
+    assert loaded.fast is not None
+    # Unrounded inputs, scaled in float64 by the sklearn pipeline
+    rng = np.random.default_rng(1)
+    x_values = random_inputs(5000).astype(np.float64)
+    x_values[:, [1, 3]] += rng.uniform(-0.5, 0.5, (5000, 2))
+    x_values[::7, 1] = np.nan
+    expected = loaded.model.predict(loaded.scaler.transform(x_values))
+    assert loaded.fast.predict(x_values).tolist() == expected.tolist()
+
+
+def test_single_row_matches_sklearn_pipeline() -> None:
+    # Rounding it to float32 before scaling flips the prediction
+    input_data = InputData(
+        married=1,
+        income=4512.838204843472,
+        education=1,
+        loan_amount=54.888554287647715,
+        credit_history=1,
+    )
+    loaded = ModelRegistry().get("model1")
+    expected = loaded.model.predict(
+        loaded.scaler.transform(
+            np.array([[1, 4512.838204843472, 1, 54.888554287647715, 1]])
+        )
+    )
+    assert PredictionService("model1").predict(input_data) == {
+        "prediction": int(expected[0])
+    }
+
+
+def test_does_not_modify_input() -> None:
+    loaded = ModelRegistry().get("model1")
+    assert loaded.fast is not None
+    x_values = random_inputs(10)
+    original = x_values.copy()
+    loaded.fast.predict(x_values)
+    assert np.array_equal(x_values, original)
+
+
+def test_unsupported_models_fall_back() -> None:
+    loaded = ModelRegistry().get("model1")
+    model = LogisticRegression()
+    assert BoosterPipeline.from_pipeline(model, loaded.scaler) is None
+    assert BoosterPipeline.from_pipeline(loaded.model, object()) is None
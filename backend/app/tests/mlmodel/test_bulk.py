@@ -0,0 +1,47 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+import pytest
+
+from app.mlmodel.bulk import BulkInputError, iter_lines, read_chunks
+
+
+async def stream(*parts: bytes) -> AsyncIterator[bytes]:
+    for part in parts:
+        yield part
+
+
+async def collect_lines(*parts: bytes) -> list[bytes]:
+    return [line async for line in iter_lines(stream(*parts), max_line_bytes=16)]
+
+
+def test_iter_lines_across_parts() -> None:
+    lines = asyncio.run(collect_lines(b"a,b\r\nc", b"d\n", b"\nef"))
+    assert lines == [b"a,b", b"cd", b"", b"ef"]
+
+
+def test_iter_lines_rejects_long_lines() -> None:
+    with pytest.raises(BulkInputError):
+        asyncio.run(collect_lines(b"x" * 17))
+
+
+def test_read_chunks_csv() -> None:
+    header = b"credit_history,loan_amount,education,income,married\n"
+    rows = b"".join(b"1,%d,0,1000,1\n" % i for i in range(5))
+
+    async def run() -> list[list[list[float]]]:
+        chunks = read_chunks(stream(header, rows), "csv", chunk_rows=2)
+        return [chunk.tolist() async for chunk in chunks]
+
+    chunks = asyncio.run(run())
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert chunks[2] == [[1, 1000, 0, 4, 1]]
+
+
+def test_read_chunks_csv_missing_column() -> None:
+    async def run() -> None:
+        async for _ in read_chunks(stream(b"married,income\n1,2\n"), "csv", 2):
+            pass
+
+    with pytest.raises(BulkInputError, match="education"):
+        asyncio.run(run())
@@ -0,0 +1,60 @@
+from dataclasses import replace
+
+from app.mlmodel.cache import PredictionCache, prediction_key
+from app.mlmodel.mlconfig import MANIFEST
+from app.models import InputData
+from app.tests.utils.utils import FakeClock
+
+input_data = InputData(
+    married=1, income=5000, education=1, loan_amount=100, credit_history=1
+)
+
+
+def test_hit_and_miss() -> None:
+    cache = PredictionCache(max_size=10, ttl_seconds=60)
+    key = prediction_key(MANIFEST["model1"], input_data)
+    assert cache.get(key) is None
+    cache.put(key, 1)
+    assert cache.get(key) == 1
+    metrics = cache.metrics()
+    assert metrics["hits"] == 1
+    assert metrics["misses"] == 1
+
+
+def test_key_changes_with_model_artifacts() -> None:
+    spec = MANIFEST["model1"]
+    replaced = replace(spec, model_sha256="0" * 64)
+    assert prediction_key(spec, input_data) == prediction_key(
+        MANIFEST["model1"], input_data.model_copy()
+    )
+    assert prediction_key(spec, input_data) != prediction_key(replaced, input_data)
+
+
+def test_evicts_least_recently_used() -> None:
+    cache = PredictionCache(max_size=2, ttl_seconds=60)
+    cache.put("a", 0)
+    cache.put("b", 1)
+    cache.get("a")
+    cache.put("c", 1)
+    assert cache.get("b") is None
+    assert cache.get("a") == 0
+    assert len(cache) == 2
+    assert cache.metrics()["evictions"] == 1
+
+
+def test_entries_expire() -> None:
+    clock = FakeClock()
+    cache = PredictionCache(max_size=10, ttl_seconds=5, clock=clock)
+    cache.put("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.metrics()["expirations"] == 1
+
+
+def test_disabled() -> None:
+    cache = PredictionCache(max_size=0, ttl_seconds=60)
+    cache.put("a", 1)
+    assert len(cache) == 0
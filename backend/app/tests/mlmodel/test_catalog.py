@@ -0,0 +1,27 @@
+from sqlmodel import Session
+
+from app.mlmodel.catalog import Catalog
+from app.models import CatalogModel
+
+
+def test_catalog_load(db: Session) -> None:
+    catalog = Catalog.load(db)
+    assert catalog.prices == {"model1": 1, "model2": 2, "model3": 3}
+    assert catalog.options["all"].entitlements == sum(catalog.masks.values())
+    entitlements = catalog.masks["model1"] | catalog.masks["model3"]
+    assert catalog.entitled(entitlements, "model3")
+    assert not catalog.entitled(entitlements, "model2")
+    assert catalog.entitled_models(entitlements) == ["model1", "model3"]
+
+
+def test_catalog_ignores_models_missing_from_manifest(db: Session) -> None:
+    unknown = CatalogModel(name="model9", bit=9, price=9)
+    db.add(unknown)
+    db.commit()
+    try:
+        catalog = Catalog.load(db)
+    finally:
+        db.delete(unknown)
+        db.commit()
+    assert "model9" not in catalog.prices
+    assert "model9" not in catalog.masks
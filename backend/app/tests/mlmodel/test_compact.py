@@ -0,0 +1,65 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.benchmarks.predict import random_inputs
+from app.mlmodel.compact import CompactModel, compact_path, convert, save
+from app.mlmodel.mlconfig import MANIFEST
+from app.mlmodel.registry import ModelRegistry
+
+
+@pytest.fixture(scope="module")
+def loaded() -> tuple[object, object]:
+    model = ModelRegistry().get("model1")
+    return model.model, model.scaler
+
+
+def test_convert_round_trip_matches_model(
+    tmp_path: Path, loaded: tuple[object, object]
+) -> None:
+    model, scaler = loaded
+    save(str(tmp_path), *convert(model, scaler))
+    compact = CompactModel.load(str(tmp_path))
+    x_values = random_inputs(5000)
+    expected = model.predict(scaler.transform(x_values))  # type: ignore[attr-defined]
+    assert compact.predict(x_values).tolist() == expected.tolist()
+
+
+def test_matches_model_on_split_thresholds(loaded: tuple[object, object]) -> None:
+    model, scaler = loaded
+    compact = CompactModel.load(compact_path(MANIFEST["model1"]), mmap=False)
+    # Rows sitting exactly on, and right next to, every folded threshold
+    base_row = random_inputs(1)
+    boundary_rows = []
+    for feature, threshold in zip(compact.feature, compact.threshold, strict=True):
+        if np.isnan(threshold):
+            continue
+        rows = np.repeat(base_row, 3, axis=0)
+        rows[:, feature] = [
+            np.nextafter(threshold, np.float32(-np.inf)),
+            threshold,
+            np.nextafter(threshold, np.float32(np.inf)),
+        ]
+        boundary_rows.append(rows)
+    x_values = np.vstack(boundary_rows)
+    expected = model.predict(scaler.transform(x_values))  # type: ignore[attr-defined]
+    assert compact.predict(x_values).tolist() == expected.tolist()
+
+
+def test_missing_values_follow_default_direction(
+    loaded: tuple[object, object],
+) -> None:
+    model, scaler = loaded
+    compact = CompactModel.load(compact_path(MANIFEST["model1"]))
+    x_values = random_inputs(500)
+    x_values[::2, 1] = np.nan
+    x_values[::3, 3] = np.nan
+    expected = model.predict(scaler.transform(x_values))  # type: ignore[attr-defined]
+    assert compact.predict(x_values).tolist() == expected.tolist()
+
+
+def test_registry_shares_compact_models() -> None:
+    model_registry = ModelRegistry()
+    assert model_registry.get_compact("model1") is model_registry.get_compact("model2")
+    assert "model1" not in model_registry
@@ -0,0 +1,76 @@
+import threading
+from unittest.mock import patch
+
+from sqlmodel import Session, col, select
+
+from app import crud
+from app.benchmarks.predict import random_inputs
+from app.core.db import engine
+from app.mlmodel.catalog import model_catalog
+from app.mlmodel.jobs import score_next_chunk
+from app.mlmodel.prediction import PredictionService
+from app.models import Functions, PredictionJob, PredictionJobResult
+from app.tests.utils.user import create_random_user
+
+
+def create_job(db: Session, n_chunks: int, chunk_rows: int) -> PredictionJob:
+    user = create_random_user(db)
+    assert user.id is not None
+    entitlements = model_catalog.get().masks["model1"]
+    db.add(
+        Functions(id=user.id, entitlements=entitlements, credits=n_chunks * chunk_rows)
+    )
+    db.commit()
+    job = crud.create_prediction_job(session=db, owner_id=user.id, model="model1")
+    for i in range(n_chunks):
+        x_values = random_inputs(chunk_rows, seed=i)
+        crud.add_prediction_job_chunk(
+            session=db, job=job, inputs=x_values.tobytes(), n_rows=chunk_rows
+        )
+    assert crud.queue_prediction_job(session=db, job=job, price=1) == 0
+    return job
+
+
+def test_workers_share_the_queue(db: Session) -> None:
+    job = create_job(db, n_chunks=12, chunk_rows=50)
+    scored_by: dict[str, int] = {}
+
+    def work() -> None:
+        name = threading.current_thread().name
+        with Session(engine) as session:
+            while score_next_chunk(session):
+                scored_by[name] = scored_by.get(name, 0) + 1
+
+    threads = [threading.Thread(target=work, name=f"worker-{i}") for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(scored_by.values()) == 12
+    db.refresh(job)
+    assert job.status == "completed"
+    assert job.scored_rows == job.total_rows == 600
+    assert job.started_at and job.finished_at
+    predictions = db.exec(
+        select(PredictionJobResult.prediction)
+        .where(PredictionJobResult.job_id == job.id)
+        .order_by(col(PredictionJobResult.row))
+    ).all()
+    expected = PredictionService("model1").predict_batch(random_inputs(50, seed=11))
+    assert predictions[-50:] == expected
+
+
+def test_failed_job_is_refunded(db: Session) -> None:
+    job = create_job(db, n_chunks=3, chunk_rows=10)
+    assert score_next_chunk(db)
+    with patch.object(PredictionService, "predict_batch", side_effect=ValueError):
+        assert score_next_chunk(db)
+    assert not score_next_chunk(db)
+
+    db.refresh(job)
+    assert job.status == "failed"
+    assert job.error == "ValueError: "
+    assert job.credits == 10
+    functions = crud.get_functions(session=db, user_id=job.owner_id)
+    assert functions and functions.credits == 20
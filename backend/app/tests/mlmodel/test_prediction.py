@@ -0,0 +1,31 @@
+from typing import Any
+
+import numpy.typing as npt
+import pytest
+
+from app.mlmodel.booster import BoosterPipeline
+from app.mlmodel.prediction import PredictionService, predict_ensemble
+from app.mlmodel.reload import GoldenSet
+
+
+def test_predict_ensemble_scales_shared_inputs_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    x_values = GoldenSet.load().inputs
+    expected = {
+        model_name: PredictionService(model_name).predict_batch(x_values)
+        for model_name in ("model1", "model2", "model3")
+    }
+    calls = []
+    transform = BoosterPipeline.transform
+
+    def counting_transform(
+        self: BoosterPipeline, x_values: npt.NDArray[Any]
+    ) -> npt.NDArray[Any]:
+        calls.append(x_values)
+        return transform(self, x_values)
+
+    monkeypatch.setattr(BoosterPipeline, "transform", counting_transform)
+    # The bundled models share their artifacts
+    assert predict_ensemble(list(expected), x_values) == expected
+    assert len(calls) == 1
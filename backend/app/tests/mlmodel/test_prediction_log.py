@@ -0,0 +1,173 @@
+import random
+from datetime import date, datetime, timezone
+from typing import Literal
+
+import numpy as np
+import numpy.typing as npt
+import psycopg
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, col, select
+
+from app.mlmodel import prediction_log as prediction_log_module
+from app.mlmodel.prediction_log import PredictionLogger, partition_name
+from app.models import PredictionLog
+
+
+def make_logger(
+    max_rows: int = 1000,
+    overflow: Literal["drop_newest", "drop_oldest"] = "drop_newest",
+    retention_days: int = 0,
+) -> PredictionLogger:
+    return PredictionLogger(
+        enabled=True,
+        flush_seconds=60,
+        flush_rows=max_rows,
+        max_rows=max_rows,
+        overflow=overflow,
+        retention_days=retention_days,
+    )
+
+
+def x_values(n_rows: int) -> npt.NDArray[np.float32]:
+    return np.arange(n_rows * 5, dtype=np.float32).reshape(n_rows, 5)
+
+
+def test_flush_copies_buffered_predictions(db: Session) -> None:
+    # Not a foreign key, any id is logged
+    user_id = random.randint(10**8, 10**9)
+    prediction_log = make_logger()
+    prediction_log.log(user_id, "model1", x_values(1), [1])
+    prediction_log.log(user_id, "model2", x_values(3), [0, 1, 0])
+
+    assert prediction_log.flush() == 4
+    assert prediction_log.flush() == 0
+    rows = db.exec(
+        select(PredictionLog)
+        .where(PredictionLog.user_id == user_id)
+        .order_by(col(PredictionLog.id))
+    ).all()
+    assert [(row.model, row.prediction) for row in rows] == [
+        ("model1", 1),
+        ("model2", 0),
+        ("model2", 1),
+        ("model2", 0),
+    ]
+    assert rows[3].inputs == [10, 11, 12, 13, 14]
+    assert prediction_log.metrics()["written_rows"] == 4
+
+
+@pytest.mark.parametrize(
+    "overflow, kept",
+    [("drop_newest", ["model1", "model3"]), ("drop_oldest", ["model2", "model3"])],
+)
+def test_buffer_is_bounded(
+    overflow: Literal["drop_newest", "drop_oldest"], kept: list[str]
+) -> None:
+    prediction_log = make_logger(max_rows=4, overflow=overflow)
+    prediction_log.log(1, "model1", x_values(3), [0, 0, 0])
+    prediction_log.log(1, "model2", x_values(2), [0, 0])
+    prediction_log.log(1, "model3", x_values(1), [0])
+
+    metrics = prediction_log.metrics()
+    assert metrics["buffered_rows"] <= 4
+    assert [batch.model_name for batch in prediction_log._batches] == kept
+    assert metrics["dropped_rows"] == 6 - metrics["buffered_rows"]
+
+
+def test_failed_flush_keeps_rows(monkeypatch: pytest.MonkeyPatch) -> None:
+    prediction_log = make_logger()
+    prediction_log.log(1, "model1", x_values(2), [0, 1])
+
+    def fail(*_args: object) -> None:
+        raise psycopg.OperationalError("database unavailable")
+
+    monkeypatch.setattr(prediction_log_module, "copy_batches", fail)
+    with pytest.raises(psycopg.OperationalError):
+        prediction_log.flush()
+    assert prediction_log.metrics()["buffered_rows"] == 2
+
+
+def test_maintain_partitions(db: Session) -> None:
+    # Dropping partitions waits for the transactions reading the table
+    db.commit()
+    prediction_log = make_logger(retention_days=5)
+    prediction_log.maintain_partitions(today=date(2001, 1, 10))
+    created = [partition_name(date(2001, 1, day)) for day in (10, 11, 12)]
+    assert set(created) <= set(PredictionLogger.partitions(db))
+
+    prediction_log.maintain_partitions(today=date(2001, 1, 20))
+    partitions = PredictionLogger.partitions(db)
+    assert not set(created) & set(partitions)
+    assert partition_name(date(2001, 1, 22)) in partitions
+    # Keeps today's partitions
+    prediction_log.retention_days = 1
+    prediction_log.maintain_partitions()
+    assert partition_name(date(2001, 1, 22)) not in PredictionLogger.partitions(db)
+    today = datetime.now(timezone.utc).date()
+    assert partition_name(today) in PredictionLogger.partitions(db)
+
+
+def test_partition_takes_rows_from_default(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user_id = random.randint(10**8, 10**9)
+    # Written while the day's partition was missing
+    db.add(
+        PredictionLog(
+            created_at=datetime(2002, 3, 11, 12, tzinfo=timezone.utc),
+            user_id=user_id,
+            model="model1",
+            inputs=[1, 2, 3, 4, 5],
+            prediction=1,
+        )
+    )
+    db.commit()
+    prediction_log = make_logger(retention_days=5)
+
+    def fail(*_args: object) -> None:
+        raise OperationalError("DROP TABLE", None, Exception("lock timeout"))
+
+    monkeypatch.setattr(prediction_log, "_drop_partitions", fail)
+    with pytest.raises(OperationalError):
+        prediction_log.maintain_partitions(today=date(2002, 3, 10))
+
+    # Created even though dropping failed
+    name = partition_name(date(2002, 3, 11))
+    assert name in PredictionLogger.partitions(db)
+    moved = db.execute(
+        text(f"SELECT prediction FROM {name} WHERE user_id = :user_id"),
+        {"user_id": user_id},
+    ).scalars()
+    assert list(moved) == [1]
+    db.commit()
+    monkeypatch.undo()
+    prediction_log.retention_days = 1
+    prediction_log.maintain_partitions()
+    assert name not in PredictionLogger.partitions(db)
+
+
+def test_rejected_rows_dont_block_the_log(db: Session) -> None:
+    user_id = random.randint(10**8, 10**9)
+    prediction_log = make_logger()
+    prediction_log.log(user_id, "model1", x_values(1), [1])
+    # Longer than the model column
+    prediction_log.log(user_id, "m" * 300, x_values(2), [0, 1])
+    # Out of the range of REAL, logged as infinite
+    prediction_log.log(user_id, "model2", np.full((1, 5), 1e300), [0])
+
+    assert prediction_log.flush() == 2
+    prediction_log.log(user_id, "model3", x_values(1), [1])
+    assert prediction_log.flush() == 1
+
+    rows = db.exec(
+        select(PredictionLog)
+        .where(PredictionLog.user_id == user_id)
+        .order_by(col(PredictionLog.id))
+    ).all()
+    assert [row.model for row in rows] == ["model1", "model2", "model3"]
+    assert rows[1].inputs[0] == float("inf")
+    metrics = prediction_log.metrics()
+    assert metrics["rejected_rows"] == 2
+    assert metrics["buffered_rows"] == 0
@@ -0,0 +1,85 @@
+import hashlib
+from pathlib import Path
+from unittest.mock import patch
+
+import joblib  # type: ignore
+import pytest
+
+from app.mlmodel.mlconfig import FEATURES, ArtifactHashError, ModelSpec, load_artifact
+from app.mlmodel.registry import ModelRegistry
+
+
+def make_manifest(tmp_path: Path, n_models: int) -> dict[str, ModelSpec]:
+    manifest = {}
+    for i in range(1, n_models + 1):
+        paths = []
+        for kind in ("model", "scaler"):
+            path = tmp_path / f"{kind}{i}.pkl"
+            joblib.dump({"kind": kind, "index": i, "payload": "x" * 1000}, path)
+            paths.append((str(path), hashlib.sha256(path.read_bytes()).hexdigest()))
+        manifest[f"model{i}"] = ModelSpec(
+            name=f"model{i}",
+            model_path=paths[0][0],
+            model_sha256=paths[0][1],
+            scaler_path=paths[1][0],
+            scaler_sha256=paths[1][1],
+            input_schema=FEATURES,
+        )
+    return manifest
+
+
+def test_get_loads_each_model_once() -> None:
+    model_registry = ModelRegistry()
+    with patch(
+        "app.mlmodel.registry.load_artifact", wraps=load_artifact
+    ) as load_artifact_mock:
+        first = model_registry.get("model1")
+        second = model_registry.get("model1")
+    assert first is second
+    assert load_artifact_mock.call_count == 2
+
+
+def test_identical_artifacts_are_shared() -> None:
+    model_registry = ModelRegistry()
+    model_registry.preload()
+    model1 = model_registry.get("model1")
+    model2 = model_registry.get("model2")
+    assert model1 is not model2
+    assert model1.model is model2.model
+    assert model1.scaler is model2.scaler
+
+
+def test_preload(tmp_path: Path) -> None:
+    model_registry = ModelRegistry(manifest=make_manifest(tmp_path, 3))
+    model_registry.preload(["model1", "model2"])
+    assert "model1" in model_registry
+    assert "model2" in model_registry
+    assert "model3" not in model_registry
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path: Path) -> None:
+    model_registry = ModelRegistry(manifest=make_manifest(tmp_path, 3))
+    model_registry.get("model1")
+    model_registry.max_bytes = model_registry.loaded_bytes * 2
+    model_registry.get("model2")
+    model_registry.get("model1")
+    model_registry.get("model3")
+    assert len(model_registry) == 2
+    assert "model1" in model_registry
+    assert "model2" not in model_registry
+    assert model_registry.loaded_bytes <= model_registry.max_bytes
+
+
+def test_keeps_requested_model_when_budget_too_small(tmp_path: Path) -> None:
+    model_registry = ModelRegistry(max_bytes=1, manifest=make_manifest(tmp_path, 2))
+    model_registry.get("model1")
+    loaded = model_registry.get("model2")
+    assert len(model_registry) == 1
+    assert loaded.name == "model2"
+
+
+def test_rejects_artifact_not_matching_manifest(tmp_path: Path) -> None:
+    manifest = make_manifest(tmp_path, 1)
+    joblib.dump("tampered", manifest["model1"].model_path)
+    with pytest.raises(ArtifactHashError):
+        ModelRegistry(manifest=manifest).get("model1")
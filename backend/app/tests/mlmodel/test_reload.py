@@ -0,0 +1,116 @@
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+import joblib  # type: ignore
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression  # type: ignore
+
+from app.mlmodel.mlconfig import MANIFEST_PATH, load_manifest, this_dir
+from app.mlmodel.registry import ModelRegistry
+from app.mlmodel.reload import GOLDEN_PATH, GoldenSet, ManifestWatcher
+
+
+def retrained_model(tmp_path: Path) -> tuple[str, str]:
+    """A different model1, returns its path and hash."""
+    rng = np.random.default_rng(0)
+    x_values = rng.normal(size=(200, 5))
+    model = LogisticRegression().fit(x_values, x_values[:, 1] > 0.3)
+    path = tmp_path / "model1-v2.pkl"
+    joblib.dump(model, path)
+    return str(path), hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def write_manifest(tmp_path: Path, **model1: object) -> str:
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    for entry in manifest.values():
+        entry["model"] = f"{this_dir}/models/{entry['model']}"
+        entry["scaler"] = f"{this_dir}/models/{entry['scaler']}"
+    manifest["model1"].update(model1)
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+def test_reload_swaps_changed_models(tmp_path: Path) -> None:
+    model_registry = ModelRegistry()
+    previous = model_registry.get("model1")
+    unchanged = model_registry.get("model2")
+    model_path, model_sha256 = retrained_model(tmp_path)
+    manifest_path = write_manifest(
+        tmp_path, model=model_path, model_sha256=model_sha256
+    )
+
+    changed = model_registry.reload(load_manifest(manifest_path))
+
+    assert changed == ["model1"]
+    reloaded = model_registry.get("model1")
+    assert reloaded is not previous
+    assert reloaded.spec.model_sha256 == model_sha256
+    assert model_registry.get("model2") is unchanged
+    # Requests holding the previous model finish with it
+    x_values = GoldenSet.load().inputs
+    assert previous.predict_batch(x_values) == unchanged.predict_batch(x_values)
+
+
+def test_reload_rejects_removing_models() -> None:
+    model_registry = ModelRegistry()
+    manifest = load_manifest()
+    del manifest["model3"]
+    with pytest.raises(ValueError):
+        model_registry.reload(manifest)
+    assert "model3" in model_registry.manifest
+
+
+def test_watcher_keeps_serving_models_failing_golden_set(tmp_path: Path) -> None:
+    golden_path = tmp_path / "golden.json"
+    shutil.copy(GOLDEN_PATH, golden_path)
+    manifest_path = write_manifest(tmp_path)
+    model_registry = ModelRegistry(manifest=load_manifest(manifest_path))
+    previous = model_registry.get("model1")
+    watcher = ManifestWatcher(
+        model_registry,
+        interval=0,
+        manifest_path=manifest_path,
+        golden_path=str(golden_path),
+    )
+    watcher.check()
+    assert watcher.check() == []
+    assert watcher.reloads == 1
+
+    model_path, model_sha256 = retrained_model(tmp_path)
+    write_manifest(tmp_path, model=model_path, model_sha256=model_sha256)
+    assert watcher.check() == []
+    assert watcher.last_error is not None
+    assert "golden predictions" in watcher.last_error
+    assert model_registry.get("model1") is previous
+
+    # Accepted once the golden expectations are updated for the new model
+    golden = json.loads(golden_path.read_text())
+    new_model = joblib.load(model_path)
+    scaler = previous.scaler
+    golden["expected"]["model1"] = [
+        int(p) for p in new_model.predict(scaler.transform(np.array(golden["inputs"])))
+    ]
+    golden_path.write_text(json.dumps(golden))
+    assert watcher.check() == ["model1"]
+    assert watcher.last_error is None
+    assert watcher.reloads == 2
+    assert model_registry.get("model1").spec.model_sha256 == model_sha256
+
+
+def test_watcher_without_models_follows_manifest(tmp_path: Path) -> None:
+    manifest_path = write_manifest(tmp_path)
+    model_registry = ModelRegistry(manifest=load_manifest(manifest_path))
+    watcher = ManifestWatcher(model_registry, interval=0, manifest_path=manifest_path)
+    watcher.load_models = False
+    watcher.check()
+
+    model_path, model_sha256 = retrained_model(tmp_path)
+    write_manifest(tmp_path, model=model_path, model_sha256=model_sha256)
+    assert watcher.check() == ["model1"]
+    assert model_registry.manifest["model1"].model_sha256 == model_sha256
+    assert len(model_registry) == 0
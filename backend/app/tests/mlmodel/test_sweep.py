@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.mlmodel.prediction import PredictionService
+from app.mlmodel.sweep import axis_values, decision_runs, grid_matrix, sweep
+from app.models import InputData, SweepAxis
+
+base = InputData(married=1, income=3000, education=1, loan_amount=120, credit_history=1)
+
+
+def test_decision_runs() -> None:
+    predictions = np.array([[1, 1, 0, 0, 1], [0, 0, 0, 0, 0]])
+    values = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    runs = decision_runs(predictions, values)
+    assert [(run.start, run.stop, run.prediction) for run in runs[0]] == [
+        (0.0, 1.0, 1),
+        (2.0, 3.0, 0),
+        (4.0, 4.0, 1),
+    ]
+    assert [(run.start, run.stop, run.prediction) for run in runs[1]] == [(0.0, 4.0, 0)]
+
+
+@pytest.mark.parametrize("model_format", ["pickle", "compact"])
+def test_sweep_matches_scoring_every_point(
+    model_format: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "MODEL_FORMAT", model_format)
+    axes = [
+        SweepAxis(feature="loan_amount", start=0, stop=700, num=40),
+        SweepAxis(feature="income", values=[5000, 100, 2500.5, 4330, 4330.1, 9000]),
+    ]
+    values = [axis_values(axis) for axis in axes]
+    x_values = grid_matrix(base, ["loan_amount", "income"], values)
+    assert x_values.shape == (40 * 6, 5)
+    expected = np.asarray(PredictionService("model1").predict_batch(x_values))
+
+    rows = sweep("model1", base, axes)
+
+    assert [row.value for row in rows] == values[0].tolist()
+    assert [row.runs for row in rows] == decision_runs(
+        expected.reshape(40, 6), values[1]
+    )
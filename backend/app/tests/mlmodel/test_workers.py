@@ -0,0 +1,70 @@
+import time
+from collections.abc import Generator
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.mlmodel.prediction import PredictionService
+from app.mlmodel.workers import InferenceProcessPool, InferenceWorkerError
+
+
+@pytest.fixture(scope="module")
+def pool() -> Generator[InferenceProcessPool, None, None]:
+    pool = InferenceProcessPool(processes=2, slots=2, max_rows=16)
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def test_pool_matches_local_predictions(pool: InferenceProcessPool) -> None:
+    rng = np.random.default_rng(0)
+    x_values = np.column_stack(
+        [
+            rng.integers(0, 2, 50),
+            rng.uniform(500, 8000, 50),
+            rng.integers(0, 2, 50),
+            rng.uniform(20, 500, 50),
+            rng.integers(0, 2, 50),
+        ]
+    ).astype(np.float32)
+
+    expected = PredictionService("model2").predict_batch(x_values)
+    # 50 rows go through the 16 row slots in 4 chunks
+    assert pool.predict("model2", x_values) == expected
+
+
+def test_pool_serves_prediction_service(pool: InferenceProcessPool) -> None:
+    x_values = np.array([[1, 5000, 1, 100, 1]], dtype=np.float32)
+    expected = PredictionService("model1").predict_batch(x_values)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("app.mlmodel.prediction.inference_pool", pool)
+        prediction_service = PredictionService("model1")
+        assert prediction_service.pool is pool
+        assert prediction_service.predict_batch(x_values) == expected
+
+
+def test_pool_recovers_slots(monkeypatch: pytest.MonkeyPatch) -> None:
+    x_values = np.array([[1, 5000, 1, 100, 1]], dtype=np.float32)
+    expected = PredictionService("model1").predict_batch(x_values)
+    pool = InferenceProcessPool(processes=1, slots=1, max_rows=16)
+    pool.start()
+    try:
+        # Still loading the models when it times out, the slot comes back
+        # with the late response
+        monkeypatch.setattr(settings, "INFERENCE_PROCESS_TIMEOUT", 0.001)
+        with pytest.raises(InferenceWorkerError):
+            pool.predict("model1", x_values)
+        monkeypatch.setattr(settings, "INFERENCE_PROCESS_TIMEOUT", 30.0)
+        assert pool.predict("model1", x_values) == expected
+
+        # A process that dies is respawned with its slots
+        pool._workers[0].process.kill()
+        deadline = time.monotonic() + 10
+        while not pool.respawns and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.respawns == 1
+        for _ in range(3):
+            assert pool.predict("model1", x_values) == expected
+    finally:
+        pool.stop()
@@ -0,0 +1,15 @@
+from sqlmodel import Session
+
+from app.mlmodel.catalog import model_catalog
+from app.models import Functions
+from app.tests.utils.user import create_random_user
+
+
+def create_functions(db: Session, credits: int, *model_names: str) -> Functions:
+    user = create_random_user(db)
+    masks = model_catalog.get().masks
+    entitlements = sum(masks[model_name] for model_name in model_names)
+    functions = Functions(id=user.id, credits=credits, entitlements=entitlements)
+    db.add(functions)
+    db.commit()
+    return functions
@@ -1,8 +1,11 @@
 import random
 import string
+import time
+from typing import Any
 
 from fastapi.testclient import TestClient
 
+from app.core.cache import TTLCache
 from app.core.config import settings
 
 
@@ -24,3 +27,17 @@ def get_superuser_token_headers(client: TestClient) -> dict[str, str]:
     a_token = tokens["access_token"]
     headers = {"Authorization": f"Bearer {a_token}"}
     return headers
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def wait_for_invalidations(cache: TTLCache[Any, Any], invalidations: int) -> None:
+    deadline = time.monotonic() + 5
+    while cache.invalidations < invalidations and time.monotonic() < deadline:
+        time.sleep(0.01)